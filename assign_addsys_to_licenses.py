@@ -16,12 +16,7 @@ Script to assign attributes to points from point in polygon spatial query
 
 import os
 import time
-import arcpy
-
-# Start timer and print start time in UTC
-start_time = time.time()
-readable_start = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
-print('The script start time is {}'.format(readable_start))
+from dabs_core import RunReport, assign_poly_attr
 
 # Update variables below
 database = r'C:\DABC\OpenGov\address_fixes_20221206\DABS.gdb'
@@ -40,69 +35,25 @@ poly_dict = {
         }
 
 
-###############
-#  Functions  #
-###############
-
-
-def assign_poly_attr(pts, polygonDict):
-    
-    arcpy.env.workspace = os.path.dirname(pts)
-    arcpy.env.overwriteOutput = True
-    
-    for lyr in polygonDict:
-        # set path to polygon layer
-        polyFC = polygonDict[lyr]['poly_path']
-        print (polyFC)
-        
-        # generate near table for each polygon layer
-        neartable = 'in_memory\\near_table'
-        arcpy.analysis.GenerateNearTable(pts, polyFC, neartable, '1 Meters', 'NO_LOCATION', 'NO_ANGLE', 'CLOSEST')
-        
-        # create dictionaries to store data
-        pt_poly_link = {}       # dictionary to link points and polygons by OIDs 
-        poly_OID_field = {}     # dictionary to store polygon NEAR_FID as key, polygon field as value
-    
-        # loop through near table, store point IN_FID (key) and polygon NEAR_FID (value) in dictionary (links two features)
-        with arcpy.da.SearchCursor(neartable, ['IN_FID', 'NEAR_FID', 'NEAR_DIST']) as nearCur:
-            for row in nearCur:
-                pt_poly_link[row[0]] = row[1]       # IN_FID will return NEAR_FID
-                # add all polygon OIDs as key in dictionary
-                poly_OID_field.setdefault(row[1])
-        
-        # loop through polygon layer, if NEAR_FID key in poly_OID_field, set value to poly field name
-        with arcpy.da.SearchCursor(polyFC, ['OID@', polygonDict[lyr]['poly_field']]) as polyCur:
-            for row in polyCur:
-                if row[0] in poly_OID_field:
-                    poly_OID_field[row[0]] = row[1]
-        
-        # loop through points layer, using only OID and field to be updated
-        with arcpy.da.UpdateCursor(pts, ['OID@', lyr]) as uCur:
-            for urow in uCur:
-                try:
-                    # search for corresponding polygon OID in polygon dictionay (polyDict)
-                    if pt_poly_link[urow[0]] in poly_OID_field:
-                        # if found, set point field equal to polygon field
-                        # IN_FID in pt_poly_link returns NEAR_FID, which is key in poly_OID_field that returns value of polygon field
-                        urow[1] =  poly_OID_field[pt_poly_link[urow[0]]]
-                except:         # if error raised, just put a blank in the field
-                    urow[1] = ''
-                uCur.updateRow(urow)
-    
-        # Delete in memory near table
-        arcpy.management.Delete(neartable)
-    
 ##########################
 #  Call Functions Below  #
 ##########################
 
-# Call function if script run as main program
-if __name__ == '__main__':
+def main():
+    # Start timer and print start time in UTC
+    report = RunReport('assign_addsys_to_licenses').start()
+    readable_start = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    print('The script start time is {}'.format(readable_start))
+
     assign_poly_attr(points, poly_dict)
 
+    print('Script shutting down ...')
+    # Stop timer and print end time in UTC
+    readable_end = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    print('The script end time is {}'.format(readable_end))
+    report.finish(os.path.dirname(database))
+
 
-print('Script shutting down ...')
-# Stop timer and print end time in UTC
-readable_end = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
-print('The script end time is {}'.format(readable_end))
-print('Time elapsed: {:.2f}s'.format(time.time() - start_time))
\ No newline at end of file
+# Call function if script run as main program
+if __name__ == '__main__':
+    main()
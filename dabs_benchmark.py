@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark suite for the DABS hot paths on synthetic Utah-scale data
+- Generates reproducible datasets with dabs_core.synthetic (no arcpy, SGID or C:\\DABC paths)
+- Times polygon index builds, point X/Y extraction and reprojection, polygon assignment (single and multi-core),
+  the MAT column derivations, the MAT de-duplication (object and typed schema) and the license/MAT
+  address set comparisons (in memory and through the SQLite MAT lookup index), the sheet-vs-AGOL
+  license reconciliation and the arcpy-free GDAL storage path (FileGDB write and Arrow reads, needs pyogrio)
+- Reports rows, seconds, rows/sec and peak traced memory for each benchmark as JSON
+- --compare prints the change against a previous JSON report so regressions show up
+
+Usage:
+    python dabs_benchmark.py --scale 0.1 --out bench.json
+    python dabs_benchmark.py --scale 1.0 --workers 8 --compare bench_previous.json
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import tracemalloc
+import numpy as np
+
+from dabs_core import (
+    MatLookup, PolygonIndex, address_key, address_keys, apply_schema, build_mat_lookup, dedup,
+    derive_columns, iter_address_chunks, latlng_to_cells, lazy_import, match_parallel, memory_mb,
+    normalize_addresses, read_table, reconcile, synthetic, utm12_to_wgs84, write_points,
+)
+from dabs_core.mat import MAT_H3_RESOLUTION, dedup_two_pass
+from dabs_core.mat_lookup import mat_lookup_path
+from dabs_core.mat_stream import SOURCE_FIELDS
+from dabs_core.table_io import wkb_point_xy
+
+pd = lazy_import('pandas')
+
+#: Rows checked against the two-pass MAT de-duplication
+CHECK_ROWS = 50_000
+
+#: Slower than this ratio of the previous rows/sec is reported as a regression
+REGRESSION_RATIO = 0.9
+
+
+def measure(name, rows, func, repeat=1, trace=True):
+    """Run func repeat times and return its best time, rows/sec and peak traced memory (MB).
+
+    Memory is measured on one extra run with tracemalloc, so tracing overhead doesn't skew the timing.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if trace:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    seconds = min(times)
+    result = {'name': name, 'rows': int(rows), 'seconds': round(seconds, 4),
+              'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+              'peak_mb': round(peak_mb, 1) if peak_mb is not None else None}
+    print(f"    {name:<28} {rows:>10,} rows  {seconds:8.3f}s  {result['rows_per_sec'] or 0:>14,.0f} rows/s"
+          + (f"  {peak_mb:8.1f} MB" if peak_mb is not None else ''))
+    return result
+
+
+def bench_polygons(data, repeat, trace):
+    #: Building the STRtree of prepared polygons for each layer
+    results = []
+    for layer in ['flags', 'zones', 'parcels']:
+        oids, geometries, attributes = data[layer]
+        results.append(measure(f'poly_index_build_{layer}', len(oids),
+                               lambda: PolygonIndex(oids, geometries, attributes), repeat, trace))
+    return results
+
+
+def bench_xy(data, repeat, trace):
+    #: Point coordinates from one WKB buffer, versus creating shapely geometries to read them
+    import shapely
+    points = data['points']
+    wkbs = shapely.to_wkb(shapely.points(points['x'].to_numpy(), points['y'].to_numpy()))
+    buffer = np.frombuffer(b''.join(wkbs), dtype=np.uint8)
+    starts = np.arange(len(wkbs), dtype=np.int64) * 21
+    return [
+        measure('xy_from_wkb_buffer', len(wkbs), lambda: wkb_point_xy(buffer, starts), repeat, trace),
+        measure('xy_from_geometries', len(wkbs), lambda: shapely.get_coordinates(shapely.from_wkb(wkbs)), repeat, trace),
+        measure('xy_utm12_to_wgs84', len(wkbs), lambda: utm12_to_wgs84(points['x'].to_numpy(), points['y'].to_numpy()),
+                repeat, trace),
+    ]
+
+
+def bench_assign(data, repeat, trace, workers):
+    #: The matching and value lookup done by assign_poly_attr for the MAT poly_dict
+    #: (Comp_Group from compliance zones, Flag from flag areas), without the arcpy read/write
+    points = data['points']
+    x, y = points['x'].to_numpy(), points['y'].to_numpy()
+    zones = PolygonIndex(*data['zones'])
+    flags = PolygonIndex(*data['flags'])
+
+    def assign(match):
+        return {'Comp_Group': zones.values('Group_Name', match(zones)),
+                'Flag': flags.values('category', match(flags))}
+
+    results = [measure('assign_poly_attr', len(x), lambda: assign(lambda index: index.match(x, y)), repeat, trace)]
+    if workers != 1:
+        #: Worker processes allocate outside of tracemalloc, so no memory figure here
+        results.append(measure('assign_poly_attr_parallel', len(x),
+                               lambda: assign(lambda index: match_parallel(index, x, y, workers=workers)),
+                               repeat, trace=False))
+    return results
+
+
+def bench_mat(data, repeat, trace):
+    #: MAT column derivations and de-duplication, each run on a fresh copy of the points
+    #: Flag/Comp_Group are filled the way polygon assignment leaves them
+    points = data['points']
+    dabs_addrs = list(data['licenses']['Address'])
+    base = points.copy()
+    flags = PolygonIndex(*data['flags'])
+    zones = PolygonIndex(*data['zones'])
+    x, y = base['x'].to_numpy(), base['y'].to_numpy()
+    base['Flag'] = flags.values('category', flags.match(x, y))
+    base['Comp_Group'] = zones.values('Group_Name', zones.match(x, y))
+
+    derived = derive_columns(base.copy(), dabs_addrs)
+
+    #: The single-pass dedup must keep the same rows, in the same order, as the two-sort version
+    sample = derived.head(CHECK_ROWS)
+    dedup_same = dedup(sample.copy()).equals(dedup_two_pass(sample.copy()))
+    print(f'    single-pass dedup {"identical to" if dedup_same else "DIFFERS from"} the two-pass version')
+
+    #: The typed schema must write the same MAT, and should shrink the frame
+    typed = apply_schema(derived.copy())
+    typed_same = dedup(apply_schema(sample.copy())).to_csv() == dedup(sample.copy()).to_csv()
+    object_mb, typed_mb = memory_mb(derived), memory_mb(typed)
+    print(f'    typed MAT {"identical to" if typed_same else "DIFFERS from"} the object MAT, '
+          f'{object_mb:.0f} MB -> {typed_mb:.0f} MB')
+    lat, lon = base['latitude'].to_numpy(), base['longitude'].to_numpy()
+    results = [
+        measure('mat_derive_columns', len(base), lambda: derive_columns(base.copy(), dabs_addrs), repeat, trace),
+        measure('mat_dedup', len(derived), lambda: dedup(derived.copy()), repeat, trace),
+        measure('mat_dedup_two_pass', len(derived), lambda: dedup_two_pass(derived.copy()), repeat, trace),
+        measure('mat_dedup_typed', len(typed), lambda: dedup(typed.copy()), repeat, trace),
+        measure('mat_apply_schema', len(derived), lambda: apply_schema(derived.copy()), repeat, trace),
+        measure('h3_latlng_to_cells', len(lat), lambda: latlng_to_cells(lat, lon, MAT_H3_RESOLUTION), repeat, trace),
+    ]
+    results[1]['matches_two_pass'] = dedup_same
+    results[3]['matches_object'] = typed_same
+    results[3]['memory_mb'] = {'object': round(object_mb, 1), 'typed': round(typed_mb, 1)}
+    return results
+
+
+def bench_compare(data, repeat, trace):
+    #: The address set comparisons in the dabs_check_* scripts, keys built the way the scripts build them
+    points, lics = data['points'], data['licenses']
+    dabs_addrs = set(normalize_addresses(lics['Address']))
+    dabs_sys = set(address_keys(lics['Address'], lics['City']))
+    full_add, city = points['FullAdd'], points['AddSystem']
+
+    #: The vectorized keys must match the cached scalar path
+    sample_add, sample_city = full_add.head(CHECK_ROWS), city.head(CHECK_ROWS)
+    keys_same = list(address_keys(sample_add, sample_city)) == [address_key(a, c) for a, c in zip(sample_add, sample_city)]
+    print(f'    vectorized address keys {"identical to" if keys_same else "DIFFER from"} the scalar path')
+
+    def compare_addresses():
+        return dabs_addrs - set(normalize_addresses(full_add))
+
+    def compare_address_systems():
+        return dabs_sys - set(address_keys(full_add, city))
+
+    def compare_address_systems_scalar():
+        return dabs_sys - {address_key(a, c) for a, c in zip(full_add, city)}
+
+    #: The check scripts query the MAT lookup index instead, it must give the same set differences
+    work = tempfile.mkdtemp(prefix='dabs_bench_')
+    try:
+        mat_csv = os.path.join(work, 'DABS_mat.csv')
+        mat = points[['FullAdd', 'AddSystem', 'ZipCode', 'UTAddPtID']]
+        mat.rename(columns={'AddSystem': 'City', 'UTAddPtID': 'matID'}).to_csv(mat_csv)
+        results = [
+            measure('address_compare', len(full_add), compare_addresses, repeat, trace),
+            measure('address_system_compare', len(full_add), compare_address_systems, repeat, trace),
+            measure('address_system_compare_scalar', len(full_add), compare_address_systems_scalar, repeat, trace),
+            measure('mat_lookup_build', len(full_add), lambda: build_mat_lookup(mat_csv), repeat, trace),
+        ]
+        #: The index is opened after the builds, it can't be replaced while open on Windows
+        with MatLookup(mat_lookup_path(mat_csv)) as lookup:
+            lookup_same = (set(lookup.missing(dabs_addrs, 'addr')) == compare_addresses()
+                           and set(lookup.missing(dabs_sys, 'addr_sys')) == compare_address_systems())
+            print(f'    MAT lookup index {"identical to" if lookup_same else "DIFFERS from"} the in-memory set differences')
+            results.append(measure('mat_lookup_missing', len(dabs_sys), lambda: lookup.missing(dabs_sys, 'addr_sys'), repeat, trace))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    results[1]['matches_scalar'] = keys_same
+    results[4]['matches_set_difference'] = lookup_same
+    results.append(bench_reconcile(lics, repeat, trace))
+    return results
+
+
+def bench_reconcile(lics, repeat, trace):
+    #: The sheet-vs-AGOL license reconciliation: a copy of the licenses as the target, with licenses
+    #: dropped, extra licenses and changed addresses
+    rng = np.random.default_rng(synthetic.SEED)
+    sheet = lics.drop_duplicates('Lic_Number').reset_index(drop=True)
+    target = sheet.sample(frac=0.97, random_state=synthetic.SEED).rename(columns={'Lic_Number': 'Lic_Num'})
+    extra = pd.DataFrame({'Lic_Num': [f'XX{i:06d}' for i in range(len(sheet) // 50 + 1)], 'Address': '1 MAIN ST', 'City': 'SLC'})
+    target = pd.concat([target, extra], ignore_index=True)
+    edited = rng.random(len(target)) < 0.05
+    target.loc[edited, 'Address'] = target.loc[edited, 'Address'].astype(str) + ' X'
+    target.insert(0, 'OBJECTID', np.arange(1, len(target) + 1))
+
+    def run():
+        return reconcile(sheet, target, 'Lic_Number', 'Lic_Num', ['Address', 'City'], target_id='OBJECTID')
+
+    result = run()
+    sheet_keys, target_keys = set(sheet['Lic_Number']), set(target['Lic_Num'])
+    expected_changes = set(target.loc[edited, 'Lic_Num']) & sheet_keys
+    reconcile_same = (set(result.adds['Lic_Number']) == sheet_keys - target_keys
+                      and set(result.removes['Lic_Num']) == target_keys - sheet_keys
+                      and set(result.changes['key']) == expected_changes)
+    print(f'    reconciliation {"identical to" if reconcile_same else "DIFFERS from"} the set differences and edits')
+    bench = measure('license_reconcile', len(sheet) + len(target), run, repeat, trace)
+    bench['matches_set_difference'] = reconcile_same
+    return bench
+
+
+def bench_storage(data, repeat, trace):
+    #: The address points through the GDAL backend of dabs_core.storage: written to a FileGDB, read back
+    #: as one Arrow table and streamed in MAT export chunks
+    try:
+        import pyogrio
+    except ImportError:
+        print('    pyogrio not installed, skipping the GDAL storage benchmarks')
+        return []
+    points = data['points']
+    frame = points[SOURCE_FIELDS + ['x', 'y']]
+    tmp_dir = tempfile.mkdtemp(prefix='dabs_bench_')
+    addpts = os.path.join(tmp_dir, 'DABS_MAT.gdb', 'AddressPoints')
+    try:
+        results = [measure('gdal_write_points', len(frame), lambda: write_points(frame, 'x', 'y', addpts, 26912, backend='gdal'),
+                           repeat, trace)]
+        results.append(measure('gdal_read_table_arrow', len(frame),
+                               lambda: read_table(addpts, SOURCE_FIELDS, backend='pyogrio', arrow=True), repeat, trace))
+
+        def stream():
+            return pd.concat(list(iter_address_chunks(addpts, project=True)), ignore_index=True)
+
+        chunks = stream()
+        stream_same = (chunks['FullAdd'].tolist() == points['FullAdd'].tolist()
+                       and np.allclose(chunks['longitude'], points['longitude'])
+                       and np.allclose(chunks['latitude'], points['latitude']))
+        print(f'    GDAL streamed address points {"identical to" if stream_same else "DIFFER from"} the source points')
+        results.append(measure('gdal_stream_chunks', len(frame), stream, repeat, trace))
+        results[-1]['matches_source'] = stream_same
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def environment():
+    #: Versions of the libraries the hot paths depend on
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    for name in ['pandas', 'shapely', 'pyproj', 'h3', 'pyogrio']:
+        try:
+            versions[name] = getattr(__import__(name), '__version__', 'unknown')
+        except ImportError:
+            versions[name] = None
+    return {'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'versions': versions}
+
+
+def compare_reports(report, previous_path):
+    """Print rows/sec against a previous report, return the names that regressed."""
+    with open(previous_path) as f:
+        previous = {r['name']: r for r in json.load(f)['results']}
+
+    regressions = []
+    print(f'\nComparing to {previous_path}:')
+    for result in report['results']:
+        old = previous.get(result['name'])
+        if old is None or not old.get('rows_per_sec') or not result['rows_per_sec']:
+            continue
+        ratio = result['rows_per_sec'] / old['rows_per_sec']
+        flag = ''
+        if ratio < REGRESSION_RATIO:
+            flag = '  <-- REGRESSION'
+            regressions.append(result['name'])
+        print(f"    {result['name']:<28} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark DABS hot paths on synthetic data')
+    parser.add_argument('--scale', type=float, default=1.0, help='dataset scale, 1.0 is statewide (~1.1M points)')
+    parser.add_argument('--seed', type=int, default=synthetic.SEED)
+    parser.add_argument('--repeat', type=int, default=1, help='timed runs per benchmark, the best is reported')
+    parser.add_argument('--workers', type=int, default=None, help='workers for the parallel assignment (default all CPUs, 1 to skip)')
+    parser.add_argument('--only', nargs='+', choices=['polygons', 'xy', 'assign', 'mat', 'compare', 'storage'], help='run only these groups')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced memory runs')
+    parser.add_argument('--out', default=None, help='JSON report path (default dabs_benchmark_<date>.json)')
+    parser.add_argument('--compare', default=None, help='previous JSON report to compare rows/sec against')
+    args = parser.parse_args(argv)
+
+    #: Start timer and print start time
+    start_time = time.time()
+    readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script start time is {}".format(readable_start))
+
+    print(f"Generating synthetic data at scale {args.scale} (seed {args.seed}) ...")
+    data_time = time.time()
+    data = synthetic.generate(args.scale, args.seed)
+    print("    Time elapsed generating data: {:.2f}s".format(time.time() - data_time))
+
+    groups = args.only or ['polygons', 'xy', 'assign', 'mat', 'compare', 'storage']
+    trace = not args.no_memory
+    results = []
+    if 'polygons' in groups:
+        results += bench_polygons(data, args.repeat, trace)
+    if 'xy' in groups:
+        results += bench_xy(data, args.repeat, trace)
+    if 'assign' in groups:
+        results += bench_assign(data, args.repeat, trace, args.workers)
+    if 'mat' in groups:
+        results += bench_mat(data, args.repeat, trace)
+    if 'compare' in groups:
+        results += bench_compare(data, args.repeat, trace)
+    if 'storage' in groups:
+        results += bench_storage(data, args.repeat, trace)
+
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
+        'scale': args.scale, 'seed': args.seed, 'repeat': args.repeat,
+        'sizes': synthetic.sizes(args.scale),
+        'environment': environment(),
+        'results': results,
+    }
+    out = args.out or f'dabs_benchmark_{time.strftime("%Y%m%d")}.json'
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark report written to {out}")
+
+    regressions = compare_reports(report, args.compare) if args.compare else []
+
+    print("Time elapsed: {:.2f}s".format(time.time() - start_time))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,19 +11,17 @@ Script to combine OSM and SGID data to build DABS buffers for alcohol license fl
 
 import os
 import time
-import arcpy
-import requests
-import pandas as pd
-import numpy as np
-import geopandas as gpd
-from arcgis.features import GeoAccessor, GeoSeriesAccessor
+from dabs_core import (
+    RunReport, StageCache, add_field, append_layer, buffer_layer, copy_layer, count_rows, create_gdb,
+    default_backend, delete_fields, delete_layers, export_layer, export_layers, feature_to_point, fill_column,
+    lazy_import, read_columns, rename_field, spatial_join, stage, write_columns, write_points,
+)
 
+requests = lazy_import('requests')
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+gpd = lazy_import('geopandas')
 
-
-#: Start timer and print start time in UTC
-start_time = time.time()
-readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-print("The script start time is {}".format(readable_start))
 today = time.strftime("%Y%m%d")
 
 #: Set up directories
@@ -31,11 +29,13 @@ base_dir = r'C:\DABC\Flags'
 work_dir = os.path.join(base_dir, f'Flags_{today}')
 latest_db = r'C:\DABC\DABS_latest_data.gdb'
 
-if os.path.isdir(work_dir) == False:
-    os.mkdir(work_dir)
-    
 today_db_name = "DABS_Flags_" + today
 today_db = os.path.join(work_dir, today_db_name + ".gdb")
+
+#: Reuse SGID/AGOL exports from an earlier run when their source layers haven't changed
+#: (set rebuild_stages = True to redo them, stage_cache.invalidate() clears the cache)
+stage_cache = StageCache()
+rebuild_stages = False
     
 
 # Set up SGID paths and variables
@@ -91,110 +91,63 @@ combined_points = os.path.join(today_db, combined_points_name)
 combined_polygons = os.path.join(today_db, combined_polygons_name)
 combined_buffers = os.path.join(today_db, 'DABS_Flag_Areas')
 
+#: Parcel fields kept by the spatial joins
+keepers = ['name', 'category', 'PARCEL_ID', 'PARCEL_ADD', 'PARCEL_CITY', 'PARCEL_ZIP', 'County'] # etc.
+
 
 # temp_files = ['Building_centroids_original', pois_FC, poi_areas_FC, poi_areas_centroid,
 #               pofw_FC, pofw_areas_FC, pofw_areas_centroid, transport_FC, transport_centroid,
 #               buildings_FC, buildings_centroid]
 
 
-#: Create working geodatabase with today's date
-def create_gdb():
-    print("Creating file geodatabase ...")
-    if arcpy.Exists(today_db) == False:
-        arcpy.CreateFileGDB_management(work_dir, today_db_name)
-    
-    arcpy.env.workspace = today_db
-    arcpy.env.qualifiedFieldNames = False
-
-
 #: Copy SGID data layers to local for faster processing
 def export_data():
-    export_time = time.time()
-    for item in SGID_layers:
-        exported = item.rsplit('.', 1)[-1]
-        if arcpy.Exists(os.path.join(today_db, exported)):
-            arcpy.management.Delete(os.path.join(today_db, exported))
-        print(f"Exporting SGID {item} to: {exported}")
-        arcpy.FeatureClassToFeatureClass_conversion (item, today_db, exported)     
-    
-    print("Time elapsed exporting SGID data: {:.2f}s".format(time.time() - export_time))
+    export_layers(SGID_layers, today_db, cache=stage_cache, rebuild=rebuild_stages)
     
     #: Copy statewide parcels from AGOL to local
-    parcel_time = time.time()
-    arcpy.conversion.FeatureClassToFeatureClass(statewide_parcels, today_db, parcels_name)
-    print("Time elapsed exporting statewide parcels from AGOL: {:.2f}s".format(time.time() - parcel_time))
+    with stage('exporting statewide parcels from AGOL'):
+        export_layer(statewide_parcels, today_db, parcels_name, cache=stage_cache, rebuild=rebuild_stages)
 
 
 def create_initial_layers():   
     #: Create initial polygon layer from parks
-    arcpy.conversion.FeatureClassToFeatureClass(parks_fc, today_db, combined_polygons_name)
-    print(f"Polygon layer is starting with {arcpy.management.GetCount(combined_polygons)[0]} features from SGID parks")
+    copy_layer(parks_fc, combined_polygons)
+    print(f"Polygon layer is starting with {count_rows(combined_polygons)} features from SGID parks")
     
-    arcpy.management.AddField(combined_polygons, "category", "TEXT", "", "", 40)
-    arcpy.management.AlterField(combined_polygons, "NAME", "name")
-    arcpy.management.AlterField(combined_polygons, "COUNTY", "County")
+    add_field(combined_polygons, "category", "TEXT", 40)
+    rename_field(combined_polygons, "NAME", "name")
+    rename_field(combined_polygons, "COUNTY", "County")
     
     # Calc category field = 'park'
-    fields = ['category']
-    with arcpy.da.UpdateCursor(combined_polygons, fields) as cursor:
-        for row in cursor:
-            row[0] = 'park'
-            cursor.updateRow(row)
-    print(f"Updated category field to 'park' on {arcpy.management.GetCount(combined_polygons)[0]} features")
+    result = fill_column(combined_polygons, 'category', 'park')
+    print(f"Updated category field to 'park' on {result.written} features")
     
     #: Create initial points layer from OSM places (churches)
     church_query = """category LIKE '%christian%' OR category IN ('jewish', 'muslim', 'buddhist', 'hindu')"""
-    arcpy.conversion.FeatureClassToFeatureClass(osm_fc, today_db, combined_points_name, church_query)
-    print(f"Point layer is starting with {arcpy.management.GetCount(combined_points)[0]} features from OSM churches")
+    copy_layer(osm_fc, combined_points, church_query)
+    print(f"Point layer is starting with {count_rows(combined_points)} features from OSM churches")
     
     # Calc category field = 'church'
-    fields = ['category']
-    with arcpy.da.UpdateCursor(combined_points, fields) as cursor:
-        for row in cursor:
-            row[0] = 'church'
-            cursor.updateRow(row)
-    print(f"Updated category field to 'church' on {arcpy.management.GetCount(combined_points)[0]} features")
+    result = fill_column(combined_points, 'category', 'church')
+    print(f"Updated category field to 'church' on {result.written} features")
         
-    #: Select containing parcels and move them into a polygon fc
-    fms = arcpy.FieldMappings()
-    # Add all fields from inputs.
-    fms.addTable(parcels_fc)
-    fms.addTable(combined_points)
-    
-    #: Name fields you want
-    keepers = ['name', 'category', 'PARCEL_ID', 'PARCEL_ADD', 'PARCEL_CITY', 'PARCEL_ZIP', 'County'] # etc.
-    
-    #: Remove all unwanted output fields.
-    for field in fms.fields:
-        if field.name not in keepers:
-            fms.removeFieldMap(fms.findFieldMapIndex(field.name))
-    
-    #: Execute spatial join
-    arcpy.analysis.SpatialJoin(parcels_fc, combined_points, church_parcel_fc, 'JOIN_ONE_TO_MANY', 'KEEP_COMMON', fms, 'INTERSECT', '10 Meters')
+    #: Select containing parcels (within 10 meters) and move them into a polygon fc with the keepers fields
+    spatial_join(parcels_fc, combined_points, church_parcel_fc, keepers, 10, 'Meters')
     
     #: Append churches into combined polygons
-    print(f"Adding {arcpy.management.GetCount(church_parcel_fc)[0]} church parcels to combined_polygons")
-    arcpy.management.Append(church_parcel_fc, combined_polygons, "NO_TEST")
+    print(f"Adding {count_rows(church_parcel_fc)} church parcels to combined_polygons")
+    append_layer(church_parcel_fc, combined_polygons)
     
     #: Append parks into combined points layer
-    temp = 'in_memory\\park_points'
-    if arcpy.Exists(temp):
-        print(f"Deleting {temp} ...")
-        arcpy.management.Delete(temp)
-    arcpy.management.FeatureToPoint(parks_fc, temp, "INSIDE")
-    print(f"Adding {arcpy.management.GetCount(temp)[0]} POFW area features to combined_places")
-    arcpy.management.Append('in_memory\\park_points', combined_points, "NO_TEST")
+    temp = 'in_memory\\park_points' if default_backend() == 'arcpy' else os.path.join(today_db, 'park_points')
+    feature_to_point(parks_fc, temp)
+    print(f"Adding {count_rows(temp)} POFW area features to combined_places")
+    append_layer(temp, combined_points)
     
-    # Calc category field = 'church'
-    park_count = 0
-    fields = ['category']
+    # Calc category field = 'park'
     query = "category IS NULL"
-    with arcpy.da.UpdateCursor(combined_points, fields, query) as cursor:
-        for row in cursor:
-            row[0] = 'park'
-            park_count += 1
-            cursor.updateRow(row)
-    print(f"Updated category field to 'park' on {park_count} point features")
+    result = fill_column(combined_points, 'category', 'park', query)
+    print(f"Updated category field to 'park' on {result.written} point features")
     
 
 
@@ -213,44 +166,25 @@ def add_libraries():
     #     fms.addFieldMap(fm)
     
     #: Add fields and calculate
-    arcpy.management.AddField(library_fc, "category", "TEXT", "", "", 40)
-    arcpy.management.AddField(library_fc, "name", "TEXT", "", "", 180)
-    
-    # Calc category field = 'library'
-    count = 0
-    fields = [library_field, 'name', 'category']
-    with arcpy.da.UpdateCursor(library_fc, fields) as cursor:
-        for row in cursor:
-            row[1] = row[0]
-            row[2] = 'library'
-            count += 1
-            cursor.updateRow(row)
-    print(f"Updated fields on {count} library features")
+    add_field(library_fc, "category", "TEXT", 40)
+    add_field(library_fc, "name", "TEXT", 180)
+    
+    # Calc name field from library name and category field = 'library'
+    oids, columns = read_columns(library_fc, [library_field])
+    result = write_columns(library_fc, oids, {'name': columns[library_field],
+                                              'category': np.full(len(oids), 'library', dtype=object)})
+    print(f"Updated fields on {result.written} library features")
     
     #: Append libraries into combined points
-    print(f"Adding {arcpy.management.GetCount(library_fc)[0]} library features to combined_points")
-    arcpy.management.Append(library_fc, combined_points, "NO_TEST")
+    print(f"Adding {count_rows(library_fc)} library features to combined_points")
+    append_layer(library_fc, combined_points)
       
-    #: Select containing parcels and move them into a polygon fc
-    fms = arcpy.FieldMappings()
-    # Add all fields from inputs.
-    fms.addTable(parcels_fc)
-    fms.addTable(library_fc)
-    
-    #: Name fields you want
-    keepers = ['name', 'category', 'PARCEL_ID', 'PARCEL_ADD', 'PARCEL_CITY', 'PARCEL_ZIP', 'County'] # etc.
-    
-    #: Remove all unwanted output fields.
-    for field in fms.fields:
-        if field.name not in keepers:
-            fms.removeFieldMap(fms.findFieldMapIndex(field.name))
-    
-    #: Execute spatial join
-    arcpy.analysis.SpatialJoin(parcels_fc, library_fc, library_parcel_fc, 'JOIN_ONE_TO_MANY', 'KEEP_COMMON', fms, 'INTERSECT', '10 Meters')
+    #: Select containing parcels (within 10 meters) and move them into a polygon fc with the keepers fields
+    spatial_join(parcels_fc, library_fc, library_parcel_fc, keepers, 10, 'Meters')
     
     #: Append libraries into combined polygons
-    print(f"Adding {arcpy.management.GetCount(library_parcel_fc)[0]} library parcels to combined_polygons")
-    arcpy.management.Append(library_parcel_fc, combined_polygons, "NO_TEST")
+    print(f"Adding {count_rows(library_parcel_fc)} library parcels to combined_polygons")
+    append_layer(library_parcel_fc, combined_polygons)
    
     
 def add_schools():
@@ -268,44 +202,25 @@ def add_schools():
     #     fms.addFieldMap(fm)
     
     #: Add fields and calculate
-    arcpy.management.AddField(school_fc, "category", "TEXT", "", "", 40)
-    arcpy.management.AddField(school_fc, "name", "TEXT", "", "", 180)
-    
-    # Calc category field = 'school'
-    count = 0
-    fields = [school_field, 'name', 'category']
-    with arcpy.da.UpdateCursor(school_fc, fields) as cursor:
-        for row in cursor:
-            row[1] = row[0]
-            row[2] = 'school'
-            count += 1
-            cursor.updateRow(row)
-    print(f"Updated fields on {count} school features")
+    add_field(school_fc, "category", "TEXT", 40)
+    add_field(school_fc, "name", "TEXT", 180)
+    
+    # Calc name field from school name and category field = 'school'
+    oids, columns = read_columns(school_fc, [school_field])
+    result = write_columns(school_fc, oids, {'name': columns[school_field],
+                                             'category': np.full(len(oids), 'school', dtype=object)})
+    print(f"Updated fields on {result.written} school features")
     
     #: Append schools into combined points
-    print(f"Adding {arcpy.management.GetCount(school_fc)[0]} school features to combined_points")
-    arcpy.management.Append(school_fc, combined_points, "NO_TEST")
+    print(f"Adding {count_rows(school_fc)} school features to combined_points")
+    append_layer(school_fc, combined_points)
       
-    #: Select containing parcels and move them into a polygon fc
-    fms = arcpy.FieldMappings()
-    # Add all fields from inputs.
-    fms.addTable(parcels_fc)
-    fms.addTable(school_fc)
-    
-    #: Name fields you want
-    keepers = ['name', 'category', 'PARCEL_ID', 'PARCEL_ADD', 'PARCEL_CITY', 'PARCEL_ZIP', 'County'] # etc.
-    
-    #: Remove all unwanted output fields.
-    for field in fms.fields:
-        if field.name not in keepers:
-            fms.removeFieldMap(fms.findFieldMapIndex(field.name))
-    
-    #: Execute spatial join
-    arcpy.analysis.SpatialJoin(parcels_fc, school_fc, school_parcel_fc, 'JOIN_ONE_TO_MANY', 'KEEP_COMMON', fms, 'INTERSECT', '10 Meters')
+    #: Select containing parcels (within 10 meters) and move them into a polygon fc with the keepers fields
+    spatial_join(parcels_fc, school_fc, school_parcel_fc, keepers, 10, 'Meters')
     
     #: Append schools into combined polygons
-    print(f"Adding {arcpy.management.GetCount(school_parcel_fc)[0]} school parcels to combined_polygons")
-    arcpy.management.Append(school_parcel_fc, combined_polygons, "NO_TEST")
+    print(f"Adding {count_rows(school_parcel_fc)} school parcels to combined_polygons")
+    append_layer(school_parcel_fc, combined_polygons)
        
 
 #: Retrieve Overpass API data with requests, convert to dataframe
@@ -318,7 +233,6 @@ def get_overpass_df(query_string):
 
 def add_osm_plagrounds():
     #: Add data from Overpass API using spatial dataframes
-    overpass_start_time = time.time()
     #: Get data from Overpass query
     print("Pulling additional data from Overpass API ...")
     query_string = 'http://overpass-api.de/api/interpreter?data=[out:json];area[name="Utah"]->.utah;nwr[leisure=playground](area.utah);out center;'
@@ -350,75 +264,46 @@ def add_osm_plagrounds():
     public_playgrounds['category'] = 'playground'
     public_playgrounds.rename(columns={'geometry': 'SHAPE'}, inplace=True)
     
-    #: Convert to ESRI sedf, then to feature class
-    sr = arcpy.SpatialReference(4326)
-    playground_sedf = pd.DataFrame.spatial.from_xy(df=public_playgrounds, x_column='lon', y_column='lat', sr=4326)
-    playground_sedf.spatial.to_featureclass(location=playground_fc)
+    #: Write the points to a feature class (WGS84)
+    write_points(public_playgrounds, 'lon', 'lat', playground_fc, 4326)
     
     #: Append playgrounds into combined points
-    print(f"Adding {arcpy.management.GetCount(playground_fc)[0]} playground features to combined_points")
-    arcpy.management.Append(playground_fc, combined_points, "NO_TEST")
+    print(f"Adding {count_rows(playground_fc)} playground features to combined_points")
+    append_layer(playground_fc, combined_points)
       
-    #: Select containing parcels and move them into a polygon fc
-    fms = arcpy.FieldMappings()
-    # Add all fields from inputs.
-    fms.addTable(parcels_fc)
-    fms.addTable(playground_fc)
-    
-    #: Name fields you want
-    keepers = ['name', 'category', 'PARCEL_ID', 'PARCEL_ADD', 'PARCEL_CITY', 'PARCEL_ZIP', 'County'] # etc.
-    
-    #: Remove all unwanted output fields.
-    for field in fms.fields:
-        if field.name not in keepers:
-            fms.removeFieldMap(fms.findFieldMapIndex(field.name))
-    
-    #: Execute spatial join
-    arcpy.analysis.SpatialJoin(parcels_fc, playground_fc, playground_parcel_fc, 'JOIN_ONE_TO_MANY', 'KEEP_COMMON', fms, 'INTERSECT', '10 Meters')
+    #: Select containing parcels (within 10 meters) and move them into a polygon fc with the keepers fields
+    spatial_join(parcels_fc, playground_fc, playground_parcel_fc, keepers, 10, 'Meters')
     
     #: Append playgrounds into combined polygons
-    print(f"Adding {arcpy.management.GetCount(playground_parcel_fc)[0]} playground parcels to combined_polygons")
-    arcpy.management.Append(playground_parcel_fc, combined_polygons, "NO_TEST")
+    print(f"Adding {count_rows(playground_parcel_fc)} playground parcels to combined_polygons")
+    append_layer(playground_parcel_fc, combined_polygons)
     
-    print("Time elapsed on OSM playgrounds: {:.2f}s".format(time.time() - overpass_start_time))
     
     #: Simplify schema on the combined points
-    arcpy.management.DeleteField(combined_points, ['addr_dist', 'osm_id', 'city', 'zip', 'county', 'block_id', 'ugrc_addr', 'disclaimer', 'lat', 'lon',
+    delete_fields(combined_points, ['addr_dist', 'osm_id', 'city', 'zip', 'county', 'block_id', 'ugrc_addr', 'disclaimer', 'lat', 'lon',
                                                    'amenity', 'cuisine', 'tourism', 'shop', 'website', 'phone', 'open_hours', 'osm_addr'])
 
 
 def build_buffer():
     #: Generate 200ft buffers around the combined polygon/parcel layer
-    arcpy.analysis.Buffer(combined_polygons, combined_buffers, "200 Feet", "FULL", "ROUND", "NONE")
+    buffer_layer(combined_polygons, combined_buffers, 200, 'Feet')
     
     #: Simplify schema on the bufferes
-    arcpy.management.DeleteField(combined_buffers, ['CITY', 'ACRES', 'TYPE', 'STATUS', 'BUFF_DIST', 'ORIG_FID' ])
+    delete_fields(combined_buffers, ['CITY', 'ACRES', 'TYPE', 'STATUS', 'BUFF_DIST', 'ORIG_FID' ])
 
 
 def copy_to_latest_db():
-    #: Copy final files to latest database
-    arcpy.env.workspace = latest_db
-    print("Deleting old files ...")
-    deletes = ['Utah_Parcels', 'DABS_Flag_Areas', 'DABS_Flag_Locations']
-    
-    for file in deletes:
-        if arcpy.Exists(file):
-            print(f"Deleting {file} ...")
-            arcpy.management.Delete(file)
-    
+    #: Copy final files to latest database, replacing the old ones
     print("Copying files to latest_db ...")
-    arcpy.FeatureClassToFeatureClass_conversion (parcels_fc, latest_db, 'Utah_Parcels')
-    arcpy.FeatureClassToFeatureClass_conversion (combined_points, latest_db, 'DABS_Flag_Locations')
-    arcpy.FeatureClassToFeatureClass_conversion (combined_buffers, latest_db, 'DABS_Flag_Areas')
+    copy_layer(parcels_fc, os.path.join(latest_db, 'Utah_Parcels'))
+    copy_layer(combined_points, os.path.join(latest_db, 'DABS_Flag_Locations'))
+    copy_layer(combined_buffers, os.path.join(latest_db, 'DABS_Flag_Areas'))
 
 
 def delete_files():
     #: Delete temporary and intermediate files
     print("Deleting copied SGID files ...")
-    for file in SGID_files:
-        if arcpy.Exists(file):
-            print(f"Deleting {file} ...")
-            arcpy.management.Delete(file)
+    delete_layers(SGID_files, today_db)
     
     # print("Deleting temporary files ...")
     # for file in temp_files:
@@ -428,20 +313,36 @@ def delete_files():
 
 
 
-#: Call functions 
-create_gdb()
-export_data()
-create_initial_layers()
-add_libraries()
-add_schools()
-add_osm_plagrounds()
-build_buffer()
-copy_to_latest_db()
-# delete_files()
-
-
-#: Stop timer and print end time in UTC
-print("Script shutting down ...")
-readable_end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-print("The script end time is {}".format(readable_end))
-print("Time elapsed: {:.2f}s".format(time.time() - start_time))
+def main():
+    #: Start timer and print start time in UTC
+    report = RunReport('dabs_build_flags').start()
+    readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script start time is {}".format(readable_start))
+
+    #: Call functions
+    create_gdb(work_dir, today_db_name)
+    with stage('export data'):
+        export_data()
+    with stage('create initial layers'):
+        create_initial_layers()
+    with stage('add libraries'):
+        add_libraries()
+    with stage('add schools'):
+        add_schools()
+    with stage('OSM playgrounds'):
+        add_osm_plagrounds()
+    with stage('build buffer'):
+        build_buffer()
+    with stage('copy to latest db'):
+        copy_to_latest_db()
+    # delete_files()
+
+    #: Stop timer and print end time in UTC
+    print("Script shutting down ...")
+    readable_end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script end time is {}".format(readable_end))
+    report.finish(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,83 +12,85 @@ Script to compare active DABS licenses against those in the map application
 import os
 from pathlib import Path
 import time
-import arcpy
-import pandas as pd
-from arcgis import GeoAccessor, GeoSeriesAccessor
-import numpy as np
-import h3
-from tqdm import tqdm
-import pygsheets
 
 try:
     from . import credentials
 except ImportError:
     import credentials
 
-# Initialize the tqdm progress bar tool
-tqdm.pandas()
-gsheets_client = pygsheets.authorize(service_file=credentials.SERVICE_ACCOUNT_JSON)
+from dabs_core import RunReport, lazy_import, reconcile, table_frame, write_reconciliation
 
-#: Start timer and print start time in UTC
-start_time = time.time()
-readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-print("The script start time is {}".format(readable_start))
-today = time.strftime("%Y%m%d")
+pygsheets = lazy_import('pygsheets')
 
 #: Set up variables
 dabs_licenses = 'https://services1.arcgis.com/99lidPhWCzftIe9K/arcgis/rest/services/DABS_GIS/FeatureServer/0'
-
-
-#: Get addresses from proposed Google Sheet
 sheet_title = time.strftime("%m/%Y")
 sheet_title = 'Current Licenses 2.8.23'
-sheet = gsheets_client.open_by_key(credentials.SHEET_ID)
-active_df = sheet.worksheet_by_title(sheet_title).get_as_df()
-
-#: Remove NULLs and blanks, strip whitespace
-active_df = active_df.applymap(lambda x: x.strip().upper() if isinstance(x, str) else x)
-# active_df.sort_values(['DABS', 'matID'], axis=0, ascending=[False, True], inplace=True)
-print(active_df.head())
-
-#: Get list of active licenses
-actives = list(active_df['LICENSE_NO'])
-actives.sort()
-print(f'Active license count:   {len(actives)}')
-# actives = list(set(actives))
-# print(f'Active license count:   {len(actives)}')  
-           
-#: Get list of licenses from AGOL
-dabs_licenses = [str(row).strip('''(',)"''').replace("'", "") for row in arcpy.da.SearchCursor(dabs_licenses, 'Lic_Number')]
-dabs_licenses.sort()
-print(f'AGOL license count:     {len(dabs_licenses)}')
-# dabs_licenses = list(set(dabs_licenses))
-# print(f'AGOL license count:     {len(dabs_licenses)}')
-
-AGOL_to_remove = list(set(dabs_licenses) - set(actives))
-AGOL_to_remove.sort()
-print(f'\nLicenses to remove from AGOL {len(AGOL_to_remove)}:')
-print(AGOL_to_remove)
-
-AGOL_to_add = list(set(actives) - set(dabs_licenses))
-AGOL_to_add.sort()
-print(f'\nLicenses to add to AGOL {len(AGOL_to_add)}:')
-print(AGOL_to_add)
-
-#: Export removals to CSV
-removes_df = pd.DataFrame.from_dict({'Lic_Number': AGOL_to_remove})
-print(removes_df.head())
 out_dir = Path(r'C:\DABC\Active_License_Review')
-remove_name = out_dir / f'licenses_to_remove_{today}.csv'
-removes_df.to_csv(remove_name)     
-
-#: Export needed additions to CSV
-adds_df = active_df[active_df['LICENSE_NO'].isin(AGOL_to_add)]
-add_name = out_dir / f'licenses_to_add_{today}.csv'
-adds_df.to_csv(add_name)
-
-   
-#: Stop timer and print end time in UTC
-print("Script shutting down ...")
-readable_end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-print("The script end time is {}".format(readable_end))
-print("Time elapsed: {:.2f}s".format(time.time() - start_time))
+
+#: Sheet column -> AGOL field compared on licenses in both, columns missing from the sheet are skipped
+compare_fields = {
+    'ADDRESS': 'Address',
+    'CITY': 'City',
+    'LICENSE_TYPE': 'Lic_Type',
+    'NAME': 'Name',
+}
+
+
+def main():
+    gsheets_client = pygsheets.authorize(service_file=credentials.SERVICE_ACCOUNT_JSON)
+
+    #: Start timer and print start time in UTC
+    report = RunReport('dabs_check_active_licenses_vs_AGOL').start()
+    readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script start time is {}".format(readable_start))
+    today = time.strftime("%Y%m%d")
+
+    #: Get addresses from proposed Google Sheet
+    sheet = gsheets_client.open_by_key(credentials.SHEET_ID)
+    active_df = sheet.worksheet_by_title(sheet_title).get_as_df()
+
+    #: Remove NULLs and blanks, strip whitespace
+    active_df = active_df.applymap(lambda x: x.strip().upper() if isinstance(x, str) else x)
+    # active_df.sort_values(['DABS', 'matID'], axis=0, ascending=[False, True], inplace=True)
+    print(active_df.head())
+
+    #: Sheet columns to compare, AGOL licenses with the matching fields
+    compare = {column: field for column, field in compare_fields.items() if column in active_df.columns}
+    skipped = sorted(set(compare_fields) - set(compare))
+    if skipped:
+        print(f'Columns not in the sheet, not compared: {skipped}')
+    agol_df = table_frame(dabs_licenses, ['Lic_Number'] + list(compare.values()))
+    print(f'Active license count:   {len(active_df)}')
+    print(f'AGOL license count:     {len(agol_df)}')
+
+    #: Adds, removes and per-field changes that bring AGOL in line with the sheet, in one pass
+    result = reconcile(active_df, agol_df, 'LICENSE_NO', 'Lic_Number', compare, target_id='OBJECTID')
+
+    AGOL_to_remove = list(result.removes['Lic_Number'])
+    print(f'\nLicenses to remove from AGOL {len(AGOL_to_remove)}:')
+    print(AGOL_to_remove)
+
+    AGOL_to_add = list(result.adds['LICENSE_NO'])
+    print(f'\nLicenses to add to AGOL {len(AGOL_to_add)}:')
+    print(AGOL_to_add)
+
+    print(f'\nField changes to make in AGOL {len(result.changes)}:')
+    print(result.changes.groupby('field').size().to_string() if len(result.changes) else 'None')
+    if len(result.duplicates):
+        print(f'\nDuplicated license numbers:\n{result.duplicates.to_string(index=False)}')
+
+    #: Export removals, additions and field changes to CSV
+    write_reconciliation(result, out_dir, {'removes': f'licenses_to_remove_{today}.csv',
+                                           'adds': f'licenses_to_add_{today}.csv',
+                                           'changes': f'licenses_to_update_{today}.csv'})
+
+    #: Stop timer and print end time in UTC
+    print("Script shutting down ...")
+    readable_end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script end time is {}".format(readable_end))
+    report.finish(out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,21 +11,8 @@ Script to compare addresses in DABS licenses to addresses in the Master Address
 
 import os
 import time
-import arcpy
-import pandas as pd
-from arcgis import GeoAccessor, GeoSeriesAccessor
-import numpy as np
-import h3
-from tqdm import tqdm
+from dabs_core import RunReport, address_keys, normalize_addresses, open_mat_lookup, read_table
 
-# Initialize the tqdm progress bar tool
-tqdm.pandas()
-
-#: Start timer and print start time in UTC
-start_time = time.time()
-readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-print("The script start time is {}".format(readable_start))
-today = time.strftime("%Y%m%d")
 
 #: Create variables
 dabs_db = r"C:\DABC\DABS_latest_data.gdb"
@@ -37,33 +24,36 @@ mat_dir = r'C:\DABC\MAT\DABS_20230201'
 mat_csv = os.path.join(mat_dir, 'DABS_mat.csv')
 # mat_csv = os.path.join(mat_dir, 'DABS_mat_ALL_ADDRESSES.csv')
 # mat_csv = os.path.join(mat_dir, 'DABS_mat_no_dups.csv')
-#: Get list of addresses from dabs licenses
-dabs_addrs = [str(row).strip('''(',)"''').replace("'", "") for row in arcpy.da.SearchCursor(dabs_licenses, 'Address')]
-# dabs_sys = [f"""{str(row[0]).strip('''(',)"''').replace("'", "")} {str(row[1]).strip("(',)").replace("'", "")}""" for row in arcpy.da.SearchCursor(dabs_licenses, ['Address', 'City'])]
-dabs_sys = [f"""{str(row[0]).strip('''(,)"''').replace("'", "")} {str(row[1]).strip("(,)").replace("'", "")}""" for row in arcpy.da.SearchCursor(dabs_licenses, ['Address', 'City'])]
 
-                                                                                       
-#: Get list of addresses from MAT
-mat_df = pd.read_csv(mat_csv)
-mat_addrs = list(mat_df['FullAdd'])
-# mat_df['LongAdd'] = mat_df.progress_apply(lambda r: f'''{r['FullAdd']} {r['City']}'''.strip('''(',)"''').replace('  ', ' ').replace('  ', ' '), axis = 1)
-mat_df['LongAdd'] = mat_df.progress_apply(lambda r: f'''{r['FullAdd']} {r['City']}'''.strip('''(,)"''').replace('  ', ' ').replace('  ', ' '), axis = 1)
-mat_sys = list(mat_df['LongAdd'])
 
-not_matched = list(set(dabs_addrs) - set(mat_addrs))
-not_matched_sys = list(set(dabs_sys) - set(mat_sys))
+def main():
+    #: Start timer and print start time in UTC
+    report = RunReport('dabs_check_addrs_vs_MAT').start()
+    readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script start time is {}".format(readable_start))
+
+    #: Get list of addresses from dabs licenses
+    dabs_columns = read_table(dabs_licenses, ['Address', 'City'])
+    dabs_addrs = list(normalize_addresses(dabs_columns['Address']))
+    dabs_sys = list(address_keys(dabs_columns['Address'], dabs_columns['City']))
 
-print(f"   Number of unmatched addresses: {len(not_matched)}")
-print(f"   Number of unmatched addresses using address system: {len(not_matched_sys)}")
+    #: Look the addresses up in the MAT key index (built by the MAT export, or here if it's missing)
+    with open_mat_lookup(mat_csv) as mat_lookup:
+        not_matched = mat_lookup.missing(dabs_addrs, 'addr')
+        not_matched_sys = mat_lookup.missing(dabs_sys, 'addr_sys')
 
+    print(f"   Number of unmatched addresses: {len(not_matched)}")
+    print(f"   Number of unmatched addresses using address system: {len(not_matched_sys)}")
 
+    #: Stop timer and print end time in UTC
+    print("Script shutting down ...")
+    readable_end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script end time is {}".format(readable_end))
+    report.finish(mat_dir)
 
-#: Stop timer and print end time in UTC
-print("Script shutting down ...")
-readable_end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-print("The script end time is {}".format(readable_end))
-print("Time elapsed: {:.2f}s".format(time.time() - start_time))
+    # sql = f'''add_and_sys IN ({", ".join(["'" + add + "'" for add in not_matched_sys])})'''
+    # print(sql)
 
 
-# sql = f'''add_and_sys IN ({", ".join(["'" + add + "'" for add in not_matched_sys])})'''
-# print(sql)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Shared functions for the DABS scripts
+"""
+
+from .poly_assign import PolygonIndex, assign_columns, assign_poly_attr, group_by_layer
+from .index_cache import cached_polygon_index, clear_cache, layer_stamp
+from .table_io import WriteResult, fill_column, iter_batches, mark_scratch, read_column, read_columns, read_oids, read_shapes, read_table, read_xy, write_columns
+from .h3_index import cells_to_strings, latlng_to_cells
+from .reproject import reproject, utm12_to_wgs84
+from .sharding import match_parallel, shard_keys
+from .incremental import IncrementalAssigner, assign_poly_attr_incremental
+from .mat import MAT_COLUMNS, DedupStats, dedup, derive_columns
+from .schema import MAT_SCHEMA, apply_schema, memory_mb
+from .mat_io import MatParquetWriter, iter_mat, read_mat, write_mat
+from .mat_stream import export_mat_streaming, iter_address_chunks, read_address_points
+from .mat_delta import MatDelta, mat_delta, row_hashes
+from .mat_lookup import MatLookup, build_mat_lookup, open_mat_lookup
+from .licenses import dabs_comp_needed, dabs_descr, dabs_group, dabs_renew, license_fields, license_type
+from .addresses import address_key, address_keys, normalize_address, normalize_addresses
+from .fuzzy import TrigramIndex, open_trigram_index
+from .reconcile import Reconciliation, reconcile, table_frame, write_reconciliation
+from .storage import add_field, append_layer, buffer_layer, copy_layer, count_rows, create_workspace, default_backend, delete_fields, delete_layer, feature_to_point, layer_exists, rename_field, spatial_join, write_points
+from .stage_cache import StageCache, fingerprint, source_version
+from .workspace import create_gdb, delete_layers, export_layer, export_layers, read_addresses
+from .instrument import RunReport, stage
+from .lazy import lazy_import
+from . import synthetic
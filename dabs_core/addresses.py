@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Address normalizers shared by the MAT export and the check scripts
+- One set of rules for every address, city and license value: apostrophes and
+  typographic quotes are removed, whitespace runs of any length become one
+  space, wrapping punctuation (cursor tuple leftovers, quotes, parentheses,
+  commas) is stripped from the ends
+- normalize_address is the scalar path (LRU cached, cursor rows repeat the
+  same cities and streets), normalize_addresses the vectorized pandas path;
+  both give identical results
+- address_key/address_keys build the 'address city' key used to match
+  licenses to the MAT, the same way on both sides
+"""
+
+import re
+from functools import lru_cache
+import numpy as np
+
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+#: Characters stripped from the ends of a value
+WRAP_CHARS = '''(',)" '''
+
+#: Removed anywhere in a value: apostrophes, backticks and typographic single quotes
+QUOTES_PATTERN = "['`‘’]"
+
+#: Any run of whitespace (spaces, tabs, non-breaking spaces, newlines)
+WHITESPACE_PATTERN = r'\s+'
+
+#: Distinct values kept by the scalar cache
+CACHE_SIZE = 2**18
+
+_quotes = re.compile(QUOTES_PATTERN)
+_whitespace = re.compile(WHITESPACE_PATTERN)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize(text):
+    return _whitespace.sub(' ', _quotes.sub('', text)).strip(WRAP_CHARS)
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def normalize_address(value):
+    """Normalized text of one value (address, city, license number, ...), '' for None/NaN."""
+    if _missing(value):
+        return ''
+    return _normalize(str(value))
+
+
+def normalize_addresses(values):
+    """Vectorized normalize_address for a Series or array, returns an object Series."""
+    values = values if isinstance(values, pd.Series) else pd.Series(np.asarray(values, dtype=object))
+    values = values.astype(object)
+    text = values.where(values.notna(), '').astype(str)
+    return (text.str.replace(QUOTES_PATTERN, '', regex=True)
+                .str.replace(WHITESPACE_PATTERN, ' ', regex=True)
+                .str.strip(WRAP_CHARS))
+
+
+def address_key(address, city):
+    """The 'address city' matching key of one address."""
+    return f'{normalize_address(address)} {normalize_address(city)}'.strip(' ')
+
+
+def address_keys(addresses, cities):
+    """Vectorized address_key, returns an object Series in the order of the inputs."""
+    joined = (normalize_addresses(addresses).to_numpy(dtype=object) + ' '
+              + normalize_addresses(cities).to_numpy(dtype=object))
+    return pd.Series(joined, dtype=object).str.strip(' ')
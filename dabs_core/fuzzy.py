@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Approximate 'address city' search against the MAT with trigram inverted lists
+- Keys are normalized with dabs_core.addresses.address_keys, padded
+  ('  key ') and split into character trigrams, like pg_trgm
+- The index is built with NumPy in chunks: a CSR of trigram -> record ids
+  (inverted lists) and record -> trigram ids (for exact rescoring)
+- A query counts trigram hits over the inverted lists, skipping very common
+  trigrams (' ST', 'ST ', ...) when it has rarer ones, then rescores the best
+  candidates with the trigram Dice coefficient 2|A & B| / (|A| + |B|)
+- Queries take milliseconds on a statewide MAT, the index builds in seconds
+- open_trigram_index keeps the built index next to the MAT (DABS_mat_trigram.npz)
+  with the size and modified time of the MAT it came from, and rebuilds it only
+  when the MAT has changed, like the MAT lookup index (dabs_core.mat_lookup)
+"""
+
+import os
+import json
+import numpy as np
+
+from .lazy import lazy_import
+from .addresses import address_key, address_keys
+from .mat_lookup import _mat_stamp
+from .instrument import stage
+
+pd = lazy_import('pandas')
+
+#: Keys encoded per chunk while building, bounds the temporary arrays
+BUILD_CHUNK = 200_000
+
+#: Inverted lists longer than this are skipped while gathering candidates (when the query has shorter ones)
+MAX_POSTINGS = 50_000
+
+#: Candidates rescored exactly per query
+CANDIDATES = 200
+
+#: Columns returned with each match when the index is built from a MAT
+MAT_FIELDS = ['FullAdd', 'City', 'ZipCode', 'matID']
+
+#: Bump when the saved layout or key rules change so old index files are rebuilt
+TRIGRAM_FORMAT = 1
+
+#: Built arrays saved with the index, by attribute name
+_SAVED_ARRAYS = ['_rec_tris', '_rec_ptr', '_postings', '_grams', '_gram_ptr']
+
+
+def _padded(key):
+    return '  ' + key + ' '
+
+
+def _sorted_unique(values):
+    #: np.unique by sorting, faster than its hash path for tens of millions of int64s
+    values = np.sort(values)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+def _query_grams(key):
+    padded = _padded(key)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Trigram index over normalized 'address city' keys.
+
+    Usage:
+        index = TrigramIndex.from_mat(mat_csv)
+        index.search('123 S MAIN ST SALT LAKE CITY', k=5)
+    """
+
+    def __init__(self, keys, records=None):
+        self.keys = np.asarray(list(keys), dtype=object)
+        self.records = records.reset_index(drop=True) if records is not None else None
+        self._build()
+
+    @classmethod
+    def from_mat(cls, mat_path, fields=MAT_FIELDS):
+        """Index FullAdd + City of a MAT (DABS_mat.csv or .parquet), matches come with the given fields."""
+        from .mat_io import read_mat
+        mat_df = read_mat(mat_path, list(dict.fromkeys(['FullAdd', 'City'] + list(fields))))
+        return cls(address_keys(mat_df['FullAdd'], mat_df['City']), mat_df[list(fields)])
+
+    def _build(self):
+        #: Alphabet of every character in the keys, trigrams are ids in base len(alphabet)
+        alphabet = sorted(set(''.join(self.keys.tolist())) | {' '})
+        self._symbols = {char: i for i, char in enumerate(alphabet)}
+        base = self._base = len(alphabet)
+        lookup = np.full(max(map(ord, alphabet)) + 1, -1, dtype=np.int64)
+        lookup[[ord(char) for char in alphabet]] = np.arange(base)
+
+        recs, tris = [], []
+        for start in range(0, len(self.keys), BUILD_CHUNK):
+            padded = [_padded(key) for key in self.keys[start:start + BUILD_CHUNK].tolist()]
+            lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+            codes = lookup[np.frombuffer(''.join(padded).encode('utf-32-le'), dtype=np.uint32)]
+            ends = np.cumsum(lengths)
+            rec = np.repeat(np.arange(len(padded), dtype=np.int64), lengths)
+            pos = np.flatnonzero(np.arange(len(codes)) + 2 < ends[rec])
+            gram = (codes[pos] * base + codes[pos + 1]) * base + codes[pos + 2]
+            #: Unique (record, trigram) pairs, sorted by record then trigram
+            pairs = _sorted_unique((rec[pos] + start) * base**3 + gram)
+            recs.append((pairs // base**3).astype(np.int32))
+            tris.append((pairs % base**3).astype(np.int32))
+        rec = np.concatenate(recs) if recs else np.zeros(0, dtype=np.int32)
+        tri = np.concatenate(tris) if tris else np.zeros(0, dtype=np.int32)
+
+        #: record -> trigrams
+        self._rec_tris = tri
+        self._rec_ptr = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        self._rec_ptr[1:] = np.cumsum(np.bincount(rec, minlength=len(self.keys)))
+
+        #: trigram -> records (inverted lists)
+        order = np.argsort(tri, kind='stable')
+        self._postings = rec[order]
+        sorted_tri = tri[order]
+        starts = np.flatnonzero(np.r_[True, sorted_tri[1:] != sorted_tri[:-1]]) if len(tri) else np.zeros(0, dtype=np.int64)
+        self._grams = sorted_tri[starts]
+        self._gram_ptr = np.r_[starts, len(tri)].astype(np.int64)
+
+    def save(self, path, stamp=None):
+        """Write the keys, records and built trigram lists to an .npz file, replacing any existing one.
+
+        The file is written next to path first and moved into place, so readers never see a partial index.
+        """
+        fields = list(self.records.columns) if self.records is not None else None
+        meta = {'format': TRIGRAM_FORMAT, 'stamp': stamp, 'fields': fields,
+                'alphabet': ''.join(sorted(self._symbols, key=self._symbols.get))}
+        #: Record columns are stored in order (arr_0, arr_1, ...) with their dtypes, object columns are pickled
+        columns = [self.records[field].to_numpy() for field in fields or []]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, *columns, meta=np.array(json.dumps(meta)), keys=self.keys,
+                     **{name: getattr(self, name) for name in _SAVED_ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, stamp=None, fields=None):
+        """Load an index saved with save(), or None if it's another format, stamp or set of record fields."""
+        with np.load(path, allow_pickle=True) as f:
+            meta = json.loads(str(f['meta']))
+            if (meta.get('format') != TRIGRAM_FORMAT or (stamp is not None and meta.get('stamp') != stamp)
+                    or (fields is not None and meta.get('fields') != list(fields))):
+                return None
+            index = cls.__new__(cls)
+            index.keys = f['keys']
+            index.records = (pd.DataFrame({field: f[f'arr_{i}'] for i, field in enumerate(meta['fields'])})
+                             if meta['fields'] is not None else None)
+            for name in _SAVED_ARRAYS:
+                setattr(index, name, f[name])
+        index._symbols = {char: i for i, char in enumerate(meta['alphabet'])}
+        index._base = len(meta['alphabet'])
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _gram_ids(self, grams):
+        ids = []
+        for gram in grams:
+            symbols = [self._symbols.get(char) for char in gram]
+            if None not in symbols:
+                ids.append((symbols[0] * self._base + symbols[1]) * self._base + symbols[2])
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        slots = np.searchsorted(self._grams, ids)
+        known = slots < len(self._grams)
+        known[known] = self._grams[slots[known]] == ids[known]
+        return ids[known], slots[known]
+
+    def search(self, key, k=5, candidates=CANDIDATES, max_postings=MAX_POSTINGS):
+        """Top k (record position, score) pairs for a normalized key, best first (score 1.0 is an exact trigram match)."""
+        grams = _query_grams(key)
+        ids, slots = self._gram_ids(grams)
+        if not len(slots):
+            return []
+
+        sizes = self._gram_ptr[slots + 1] - self._gram_ptr[slots]
+        rare = sizes <= max_postings
+        use = slots[rare] if rare.any() else slots
+        found = np.concatenate([self._postings[self._gram_ptr[s]:self._gram_ptr[s + 1]] for s in use])
+        recs, hits = np.unique(found, return_counts=True)
+        if len(recs) > candidates:
+            best = np.argpartition(-hits, candidates - 1)[:candidates]
+            recs = recs[best]
+
+        scores = np.empty(len(recs))
+        for i, rec in enumerate(recs.tolist()):
+            rec_tris = self._rec_tris[self._rec_ptr[rec]:self._rec_ptr[rec + 1]]
+            shared = np.intersect1d(ids, rec_tris, assume_unique=True).size
+            scores[i] = 2 * shared / (len(grams) + len(rec_tris))
+        order = np.lexsort((recs, -scores))[:k]
+        return [(int(recs[i]), float(scores[i])) for i in order]
+
+    def search_many(self, addresses, cities, k=5):
+        """Top k MAT matches for each address/city pair, as a dataframe with one row per (query, rank)."""
+        rows = []
+        for address, city in zip(addresses, cities):
+            key = address_key(address, city)
+            for rank, (rec, score) in enumerate(self.search(key, k), start=1):
+                row = {'query': key, 'rank': rank, 'score': round(score, 3), 'match': self.keys[rec]}
+                if self.records is not None:
+                    row.update(self.records.iloc[rec].to_dict())
+                rows.append(row)
+        return pd.DataFrame(rows, columns=['query', 'rank', 'score', 'match']
+                            + (list(self.records.columns) if self.records is not None else []))
+
+
+def trigram_index_path(mat_path):
+    """Trigram index path that goes with a DABS_mat.csv (or .parquet) path."""
+    return os.path.splitext(mat_path)[0] + '_trigram.npz'
+
+
+def open_trigram_index(mat_path, index_path=None, fields=MAT_FIELDS, rebuild=False):
+    """Load the trigram index of a MAT, building and saving it first when it's missing, outdated or rebuild=True."""
+    index_path = index_path or trigram_index_path(mat_path)
+    stamp = _mat_stamp(mat_path)
+    if not rebuild and os.path.exists(index_path):
+        index = TrigramIndex.load(index_path, stamp, fields)
+        if index is not None:
+            return index
+        print(f"MAT trigram index {index_path} is out of date, rebuilding ...")
+    with stage('building MAT trigram index') as timer:
+        index = TrigramIndex.from_mat(mat_path, fields)
+        timer.rows = len(index)
+    index.save(index_path, stamp)
+    print(f"    MAT trigram index of {len(index)} rows written to {index_path}")
+    return index
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Batched H3 indexing of latitude/longitude arrays
+- latlng_to_cells returns H3 cells as a uint64 array (0 for missing or invalid coordinates)
+- Uses a vectorized binding (h3ronpy) when installed, otherwise the scalar h3
+  API (v3 or v4) in chunks across a process pool
+- cells_to_strings turns cells into the usual hex strings, only needed where a
+  string is written out (e.g. matID); missing cells become '0', as h3 v3's
+  geo_to_h3 returned, so matIDs of points without coordinates stay stable
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+#: Points per chunk when the scalar API is spread over a process pool
+CHUNK_SIZE = 200_000
+
+
+def _vectorized():
+    #: Return the h3ronpy coordinates_to_cells function, or None if it isn't installed
+    try:
+        from h3ronpy.vector import coordinates_to_cells
+    except ImportError:
+        try:
+            from h3ronpy.arrow.vector import coordinates_to_cells
+        except ImportError:
+            return None
+    return coordinates_to_cells
+
+
+def _scalar_cells(args):
+    #: Scalar h3 calls for one chunk, integer API of h3 v4 (latlng_to_cell) or v3 (geo_to_h3)
+    lat, lon, resolution = args
+    from h3.api import basic_int
+    to_cell = getattr(basic_int, 'latlng_to_cell', None) or basic_int.geo_to_h3
+    cells = np.zeros(len(lat), dtype=np.uint64)
+    for i, (a, b) in enumerate(zip(lat.tolist(), lon.tolist())):
+        try:
+            cells[i] = to_cell(a, b, resolution)
+        except (ValueError, TypeError):
+            continue
+    return cells
+
+
+def latlng_to_cells(lat, lon, resolution, workers=None, chunk_size=CHUNK_SIZE):
+    """H3 cells for arrays of latitude/longitude (WGS84 degrees) as uint64, 0 where invalid.
+
+    workers only applies when no vectorized binding is installed, it defaults to the number of CPUs.
+    Scripts using more than one worker must call it under if __name__ == '__main__'.
+    """
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+    cells = np.zeros(len(lat), dtype=np.uint64)
+    valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    if not valid.any():
+        return cells
+
+    coordinates_to_cells = _vectorized()
+    if coordinates_to_cells is not None:
+        result = coordinates_to_cells(lat[valid], lon[valid], resolution)
+        cells[valid] = np.asarray(result.to_numpy(zero_copy_only=False) if hasattr(result, 'to_numpy') else result,
+                                  dtype=np.uint64)
+        return cells
+
+    vlat, vlon = lat[valid], lon[valid]
+    chunks = [(vlat[i:i + chunk_size], vlon[i:i + chunk_size], resolution) for i in range(0, len(vlat), chunk_size)]
+    workers = min(workers or os.cpu_count(), len(chunks))
+    if workers <= 1:
+        cells[valid] = np.concatenate([_scalar_cells(chunk) for chunk in chunks])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            cells[valid] = np.concatenate(list(pool.map(_scalar_cells, chunks)))
+    return cells
+
+
+def cells_to_strings(cells):
+    """Hex strings for a uint64 cell array (what h3 returns as string cells), '0' where 0."""
+    return np.array([format(cell, 'x') for cell in np.asarray(cells, dtype=np.uint64).tolist()], dtype=object)
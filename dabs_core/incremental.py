@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental polygon assignment driven by dirty tracking
+- Stores, for each point, a hash of its geometry and, for each polygon layer,
+  an OID/hash/envelope snapshot of every polygon it was last assigned against
+- On the next run only these points are re-assigned:
+    new points or points whose geometry hash changed
+    points inside the envelope (plus tolerance) of polygons that were added,
+    removed or edited since the last run
+- The snapshots are always diffed (they're built on every run anyway), layer
+  stamps can miss attribute edits on remote layers
+- State is only saved by commit(), after the caller has written the results,
+  so a failed run is simply redone next time
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+from .lazy import lazy_import
+from .poly_assign import TOLERANCE, group_by_layer, read_points
+from .index_cache import CACHE_DIR, cached_polygon_index
+from .table_io import write_columns
+
+shapely = lazy_import('shapely')
+
+#: Bump when the on-disk layout changes so old state is ignored
+STATE_FORMAT = 1
+
+
+def point_hashes(x, y):
+    """Hash point coordinates rounded to the millimeter, one uint64 per point."""
+    with np.errstate(invalid='ignore', over='ignore'):
+        xi = np.round(np.nan_to_num(x, nan=-1e15) * 1000).astype(np.int64).view(np.uint64)
+        yi = np.round(np.nan_to_num(y, nan=-1e15) * 1000).astype(np.int64).view(np.uint64)
+        return (xi * np.uint64(0x9E3779B97F4A7C15)) ^ (yi * np.uint64(0xC2B2AE3D27D4EB4F) + np.uint64(0x165667B19E3779F9))
+
+
+def polygon_snapshot(index):
+    """OIDs, per-polygon geometry/attribute hashes and envelopes of a PolygonIndex."""
+    fields = sorted(index.attributes)
+    hashes = np.empty(len(index), dtype=np.uint64)
+    for i, wkb in enumerate(shapely.to_wkb(index.geometries)):
+        h = hashlib.blake2b(wkb or b'', digest_size=8)
+        for field in fields:
+            h.update(str(index.attributes[field][i]).encode('utf-8'))
+        hashes[i] = int.from_bytes(h.digest(), 'little')
+
+    return {'oids': np.asarray(index.oids, dtype=np.int64), 'hashes': hashes,
+            'bounds': shapely.bounds(index.geometries)}
+
+
+def changed_envelopes(old, new):
+    """Envelopes of polygons added, removed or edited between two snapshots (both OID sorted)."""
+    removed = ~np.isin(old['oids'], new['oids'])
+    added = ~np.isin(new['oids'], old['oids'])
+
+    #: Edited polygons count with both their old and new envelope
+    common = ~added
+    old_pos = np.searchsorted(old['oids'], new['oids'][common])
+    edited = np.zeros(len(new['oids']), dtype=bool)
+    edited[common] = old['hashes'][old_pos] != new['hashes'][common]
+    old_edited = old_pos[edited[common]]
+
+    return np.vstack([old['bounds'][removed], new['bounds'][added | edited], old['bounds'][old_edited]])
+
+
+def points_in_envelopes(x, y, envelopes, tolerance=TOLERANCE):
+    """Boolean mask of points inside any envelope expanded by tolerance."""
+    mask = np.zeros(len(x), dtype=bool)
+    envelopes = envelopes[np.isfinite(envelopes).all(axis=1)]
+    if len(envelopes) == 0 or len(x) == 0:
+        return mask
+
+    boxes = shapely.box(envelopes[:, 0] - tolerance, envelopes[:, 1] - tolerance,
+                        envelopes[:, 2] + tolerance, envelopes[:, 3] + tolerance)
+    pt_idx, _ = shapely.STRtree(boxes).query(shapely.points(x, y), predicate='intersects')
+    mask[pt_idx] = True
+    return mask
+
+
+class IncrementalAssigner:
+    """Assign polygon attributes only to points that could have changed since the last commit.
+
+    Usage:
+        tracker = IncrementalAssigner(pts, poly_dict)
+        oids, columns = tracker.assign_columns()
+        write_columns(pts, oids, columns)
+        tracker.commit()
+    """
+
+    def __init__(self, pts, polygonDict, tolerance=TOLERANCE, cache_dir=CACHE_DIR):
+        self.pts = pts
+        self.polygonDict = polygonDict
+        self.tolerance = tolerance
+        self.cache_dir = cache_dir
+        key = json.dumps([pts, {lyr: polygonDict[lyr] for lyr in sorted(polygonDict)}, tolerance, STATE_FORMAT])
+        self.state_dir = os.path.join(cache_dir, 'incremental', hashlib.sha1(key.encode('utf-8')).hexdigest())
+        self._pending = None
+
+    def _load_state(self):
+        meta_path = os.path.join(self.state_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('format') != STATE_FORMAT:
+            return None
+
+        state = {'layers': {}}
+        with np.load(os.path.join(self.state_dir, 'points.npz')) as points:
+            state['oids'], state['hashes'] = points['oids'], points['hashes']
+        for poly_path, file_name in meta['layers'].items():
+            with np.load(os.path.join(self.state_dir, file_name)) as layer:
+                state['layers'][poly_path] = {key: layer[key] for key in ('oids', 'hashes', 'bounds')}
+        return state
+
+    def find_dirty(self):
+        """Read points and polygon layers, return the OIDs that need re-assignment."""
+        oids, x, y = read_points(self.pts)
+        order = np.argsort(oids, kind='stable')
+        oids, x, y = oids[order], x[order], y[order]
+        hashes = point_hashes(x, y)
+        state = self._load_state()
+
+        layers = group_by_layer(self.polygonDict)
+        indexes, snapshots = {}, {}
+        for poly_path, field_map in layers.items():
+            indexes[poly_path] = cached_polygon_index(poly_path, list(dict.fromkeys(field_map.values())),
+                                                      cache_dir=self.cache_dir)
+            snapshots[poly_path] = polygon_snapshot(indexes[poly_path])
+
+        if state is None:
+            print('    no previous state, every point is dirty')
+            dirty = np.ones(len(oids), dtype=bool)
+        else:
+            #: New or moved points
+            pos = np.clip(np.searchsorted(state['oids'], oids), 0, max(len(state['oids']) - 1, 0))
+            known = np.zeros(len(oids), dtype=bool)
+            if len(state['oids']):
+                known = state['oids'][pos] == oids
+            dirty = ~known
+            dirty[known] |= state['hashes'][pos[known]] != hashes[known]
+            print(f'    {int(dirty.sum())} new or moved points')
+
+            #: Points near polygons that changed
+            for poly_path in layers:
+                old = state['layers'].get(poly_path)
+                if old is None:
+                    dirty[:] = True
+                    continue
+                envelopes = changed_envelopes(old, snapshots[poly_path])
+                near = points_in_envelopes(x, y, envelopes, self.tolerance)
+                print(f'    {len(envelopes)} changed polygon envelopes in {poly_path} touch {int(near.sum())} points')
+                dirty |= near
+
+        self._pending = {'oids': oids, 'x': x, 'y': y, 'hashes': hashes, 'dirty': dirty,
+                         'indexes': indexes, 'snapshots': snapshots}
+        return oids[dirty]
+
+    @property
+    def point_oids(self):
+        """Every point OID read by find_dirty (OID sorted)."""
+        if self._pending is None:
+            self.find_dirty()
+        return self._pending['oids']
+
+    def assign_columns(self, extra_oids=None):
+        """Compute polygon attributes for dirty points (plus extra_oids).
+
+        Returns the OIDs that were assigned and a dictionary of point field name to value array.
+        """
+        if self._pending is None:
+            self.find_dirty()
+        pending = self._pending
+        dirty = pending['dirty'].copy()
+        if extra_oids is not None:
+            dirty |= np.isin(pending['oids'], extra_oids)
+        x, y = pending['x'][dirty], pending['y'][dirty]
+
+        columns = {}
+        for poly_path, field_map in group_by_layer(self.polygonDict).items():
+            index = pending['indexes'][poly_path]
+            matched = index.match(x, y, self.tolerance)
+            for lyr, poly_field in field_map.items():
+                columns[lyr] = index.values(poly_field, matched)
+
+        print(f'    assigned {int(dirty.sum())} of {len(dirty)} points')
+        return pending['oids'][dirty], {lyr: columns[lyr] for lyr in self.polygonDict}
+
+    def commit(self):
+        """Save the point hashes and polygon snapshots from this run as the new state."""
+        pending = self._pending
+        if pending is None:
+            return
+
+        tmp_dir = self.state_dir + '.tmp'
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        np.savez(os.path.join(tmp_dir, 'points.npz'), oids=np.asarray(pending['oids'], dtype=np.int64),
+                 hashes=pending['hashes'])
+        layer_files = {}
+        for i, (poly_path, snapshot) in enumerate(pending['snapshots'].items()):
+            layer_files[poly_path] = f'layer_{i}.npz'
+            np.savez(os.path.join(tmp_dir, layer_files[poly_path]), **snapshot)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'format': STATE_FORMAT, 'pts': self.pts, 'layers': layer_files}, f)
+
+        if os.path.isdir(self.state_dir):
+            shutil.rmtree(self.state_dir)
+        os.rename(tmp_dir, self.state_dir)
+        self._pending = None
+
+
+def assign_poly_attr_incremental(pts, polygonDict, tolerance=TOLERANCE):
+    """Incremental version of assign_poly_attr: assign, write and commit only dirty points."""
+    tracker = IncrementalAssigner(pts, polygonDict, tolerance)
+    oids, columns = tracker.assign_columns()
+    result = write_columns(pts, oids, columns)
+    print(f'    wrote {", ".join(columns)} on {result.written} points ({result.unmatched} OIDs not found)')
+    tracker.commit()
+
+    return oids, columns
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk cache of PolygonIndex objects for the DABS polygon layers
+- DABS_Compliance_Zones, DABS_Flag_Areas and Counties change rarely, so the
+  polygons and attribute columns are stored on disk after the first read
+- Each entry is keyed by layer path, fields and spatial reference, and is
+  versioned by a stamp of the source layer (file sizes and modified times of
+  the layer's own table files in a FileGDB, of the whole GeoPackage and of
+  every shapefile sidecar, the newest editor tracking edit date plus the OID
+  set for remote layers)
+- Remote layers without editor tracking have no reliable stamp and are read
+  fresh every time instead of being cached
+- Geometries are stored as one WKB buffer plus offsets, read back memory-mapped;
+  attribute columns keep their Python types (object arrays in an .npz)
+- The entry is rebuilt only when the source stamp changes
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+from .lazy import lazy_import
+from .poly_assign import PolygonIndex, WORK_SR
+from .storage import default_backend, gdal_source
+
+shapely = lazy_import('shapely')
+arcpy = lazy_import('arcpy')
+
+#: Bump when the on-disk layout changes so old entries are ignored
+CACHE_FORMAT = 2
+
+#: Default cache location, can be overridden with the DABS_CACHE_DIR environment variable
+CACHE_DIR = os.environ.get('DABS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.dabs_cache'))
+
+
+def _local_workspace(path):
+    #: Return the file geodatabase, GeoPackage or the layer file itself (shapefile, FlatGeobuf), if it's local
+    parts = os.path.normpath(path).split(os.sep)
+    for i, part in enumerate(parts):
+        if part.lower().endswith(('.gdb', '.gpkg')):
+            return os.sep.join(parts[:i + 1])
+    if os.path.exists(path):
+        return path
+    return None
+
+
+def _gdb_table_ids(workspace):
+    #: Table ID by lower-case name from a FileGDB's system catalog, None when GDAL (pyogrio) isn't installed
+    try:
+        import pyogrio
+    except ImportError:
+        return None
+    #: The table ID is the catalog row's FID
+    meta, table = pyogrio.read_arrow(workspace, layer='GDB_SystemCatalog', columns=['Name'], read_geometry=False,
+                                     return_fids=True)
+    ids = table.column(meta['fid_column'] or 'OGC_FID').to_pylist()
+    return dict(zip((name.lower() for name in table.column('Name').to_pylist()), ids))
+
+
+def _layer_files(workspace, path):
+    if workspace.lower().endswith('.gdb') and os.path.normpath(path) != os.path.normpath(workspace):
+        #: Each FileGDB table lives in its own aNNNNNNNN.* files, numbered by its ID in the system catalog,
+        #: so edits to other layers in the same geodatabase don't change the stamp
+        ids = _gdb_table_ids(workspace)
+        table_id = ids.get(os.path.basename(os.path.normpath(path)).lower()) if ids is not None else None
+        if table_id is not None:
+            prefix = f'a{table_id:08x}.'
+            return sorted(os.path.join(workspace, f) for f in os.listdir(workspace) if f.lower().startswith(prefix))
+    if os.path.isdir(workspace):
+        #: Skip lock files, they come and go whenever the workspace is opened
+        return sorted(os.path.join(workspace, f) for f in os.listdir(workspace) if not f.endswith('.lock'))
+    #: A shapefile's attributes, index and projection live in sidecar files next to the .shp
+    folder, name = os.path.split(workspace)
+    stem = os.path.splitext(name)[0].lower()
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder or '.')
+                  if os.path.splitext(f)[0].lower() == stem and not f.endswith('.lock'))
+
+
+def _remote_stamp(path):
+    #: Newest editor tracking edit date, OID set and fields of a remote layer, None without editor tracking
+    desc = arcpy.Describe(path)
+    edit_field = getattr(desc, 'lastEditDateFieldName', '') if getattr(desc, 'editorTrackingEnabled', False) else ''
+    if not edit_field:
+        return None
+    oids, last_edit = [], None
+    with arcpy.da.SearchCursor(path, ['OID@', edit_field]) as cursor:
+        for oid, edited in cursor:
+            oids.append(oid)
+            if edited is not None and (last_edit is None or edited > last_edit):
+                last_edit = edited
+    oid_hash = hashlib.sha1(np.sort(np.asarray(oids, dtype=np.int64)).tobytes()).hexdigest()
+    stamp = [str(last_edit), oid_hash, [field.name for field in desc.fields]]
+    return hashlib.sha1(json.dumps(stamp).encode('utf-8')).hexdigest()
+
+
+def layer_stamp(path):
+    """Version stamp for a layer that changes whenever the layer changes, None when there's no reliable one.
+
+    Local workspaces use file sizes and modified times (no rows are read): a FileGDB layer
+    stamps its own table files (the whole geodatabase without pyogrio to read the catalog),
+    shapefiles stamp every sidecar (.shp/.dbf/.shx/.prj ...). Remote layers (SDE, feature services) use the
+    newest editor tracking edit date plus the OID set, which catches edits, inserts and
+    deletes; remote layers without editor tracking return None and must not be cached.
+    The gdal backend stamps what it reads: the DABS_SGID snapshot for SDE layers, and
+    None for feature services.
+    """
+    if default_backend() == 'gdal':
+        path = gdal_source(path)
+        if path.startswith('ESRIJSON:'):
+            return None
+    workspace = _local_workspace(path)
+    if workspace is not None:
+        stats = [(os.path.basename(f), os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in _layer_files(workspace, path)]
+        return hashlib.sha1(json.dumps(stats).encode('utf-8')).hexdigest()
+    return _remote_stamp(path)
+
+
+def _entry_dir(path, fields, sr, cache_dir):
+    key = json.dumps([os.path.normcase(os.path.abspath(path)) if _local_workspace(path) else path,
+                      sorted(fields), sr, CACHE_FORMAT])
+    return os.path.join(cache_dir, 'poly_index', hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def save_index(index, entry_dir, stamp):
+    """Write a PolygonIndex to entry_dir, replacing any existing entry."""
+    wkbs = [bytes(wkb) if wkb is not None else b'' for wkb in shapely.to_wkb(index.geometries)]
+    offsets = np.zeros(len(wkbs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(wkb) for wkb in wkbs])
+
+    #: Write to a temporary folder first so a crash never leaves a half-written entry
+    tmp_dir = entry_dir + '.tmp'
+    if os.path.isdir(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'oids.npy'), np.asarray(index.oids, dtype=np.int64))
+    np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+    with open(os.path.join(tmp_dir, 'wkb.bin'), 'wb') as f:
+        f.write(b''.join(wkbs))
+    #: Columns are stored in order (arr_0, arr_1, ...), their field names go in meta.json
+    np.savez(os.path.join(tmp_dir, 'attributes.npz'),
+             *[np.asarray(values, dtype=object) for values in index.attributes.values()])
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({'format': CACHE_FORMAT, 'stamp': stamp, 'count': len(index), 'fields': list(index.attributes)}, f)
+
+    if os.path.isdir(entry_dir):
+        shutil.rmtree(entry_dir)
+    os.rename(tmp_dir, entry_dir)
+
+
+def load_index(entry_dir, stamp=None):
+    """Load a PolygonIndex from entry_dir, or None if missing or stale."""
+    meta_path = os.path.join(entry_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('format') != CACHE_FORMAT or (stamp is not None and meta.get('stamp') != stamp):
+        return None
+
+    oids = np.load(os.path.join(entry_dir, 'oids.npy'), mmap_mode='r')
+    offsets = np.load(os.path.join(entry_dir, 'offsets.npy'), mmap_mode='r')
+    if len(oids):
+        buffer = np.memmap(os.path.join(entry_dir, 'wkb.bin'), dtype=np.uint8, mode='r')
+    else:
+        buffer = np.zeros(0, dtype=np.uint8)
+    wkbs = np.array([buffer[start:end].tobytes() if end > start else None
+                     for start, end in zip(offsets[:-1], offsets[1:])], dtype=object)
+    #: Object arrays are pickled by np.savez, the cache is only ever written by save_index
+    with np.load(os.path.join(entry_dir, 'attributes.npz'), allow_pickle=True) as f:
+        attributes = {field: f[f'arr_{i}'] for i, field in enumerate(meta['fields'])}
+
+    return PolygonIndex(np.asarray(oids), shapely.from_wkb(wkbs), attributes)
+
+
+def cached_polygon_index(poly_fc, fields, sr=WORK_SR, cache_dir=CACHE_DIR, rebuild=False):
+    """Return a PolygonIndex for poly_fc, reading the source layer only when it has changed.
+
+    Layers without a reliable stamp (remote layers without editor tracking) are always read fresh.
+    """
+    fields = list(fields)
+    stamp = layer_stamp(poly_fc)
+    if stamp is None:
+        print(f'    no version stamp for {poly_fc}, reading it without the cache')
+        return PolygonIndex.from_featureclass(poly_fc, fields, sr)
+    entry_dir = _entry_dir(poly_fc, fields, sr, cache_dir)
+
+    if not rebuild:
+        index = load_index(entry_dir, stamp)
+        if index is not None:
+            print(f'    loaded cached index for {poly_fc}')
+            return index
+
+    index = PolygonIndex.from_featureclass(poly_fc, fields, sr)
+    save_index(index, entry_dir, stamp)
+    print(f'    cached index for {poly_fc} in {entry_dir}')
+    return index
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """Remove every cached polygon index."""
+    shutil.rmtree(os.path.join(cache_dir, 'poly_index'), ignore_errors=True)
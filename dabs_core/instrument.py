@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage timing, throughput and memory instrumentation for the DABS scripts
+- stage() is a context manager that times a block (wall and CPU seconds),
+  takes the number of rows it processed and reports rows/sec, resident memory
+  and, while tracemalloc is on, the peak traced allocation of the block
+- A RunReport collects the stages of a script run and writes them as JSON
+  next to the outputs, so runs can be compared as the data grows; stages that
+  run once per chunk are also summed per name
+- stage() works without a RunReport too (it only prints), so dabs_core
+  functions are instrumented whether or not the calling script keeps a report
+- Resident memory comes from psutil when installed, the peak from psutil on
+  Windows and the resource module elsewhere; the peak is the process
+  high-water mark, so each stage also reports how much it raised it
+- tracemalloc is off unless the RunReport has trace_memory=True, without it
+  traced_peak_mb is None
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tracemalloc
+from contextlib import contextmanager
+
+from .index_cache import CACHE_DIR
+
+#: Where reports go when a script has no output folder of its own
+REPORT_DIR = os.path.join(CACHE_DIR, 'runs')
+
+#: Reports that are collecting stages, innermost last
+_active = []
+
+
+def _maxrss_mb():
+    #: Peak resident memory from the resource module, None on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #: ru_maxrss is in KiB on Linux, bytes on macOS
+    return peak / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def rss_mb():
+    """(current, peak) resident memory of this process in MB, None where it can't be measured.
+
+    The peak is the high-water mark since the process started (peak_wset on Windows,
+    ru_maxrss elsewhere); it never goes down, so it can't be reset per stage.
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, 'peak_wset', None)
+        return info.rss / 2**20, (peak / 2**20 if peak is not None else _maxrss_mb())
+    return None, _maxrss_mb()
+
+
+def _round(value, digits=2):
+    return round(value, digits) if value is not None else None
+
+
+class Stage:
+    """Measurements of one stage, set rows inside the with block to get rows/sec."""
+
+    def __init__(self, name, rows=None, depth=0):
+        self.name = name
+        self.rows = rows
+        self.depth = depth
+        self.wall = None
+        self.cpu = None
+        self.memory = (None, None)
+        self.start_peak = None
+        self.traced_peak = 0
+
+    def as_dict(self):
+        rss, peak_rss = self.memory
+        grew = peak_rss - self.start_peak if peak_rss is not None and self.start_peak is not None else None
+        return {
+            'stage': self.name,
+            'depth': self.depth,
+            'rows': self.rows,
+            'wall_s': _round(self.wall, 3),
+            'cpu_s': _round(self.cpu, 3),
+            'rows_per_s': _round(self.rows / self.wall, 1) if self.rows and self.wall else None,
+            'rss_mb': _round(rss, 1),
+            'peak_rss_mb': _round(peak_rss, 1),
+            #: How much this stage raised the process high-water mark, 0 when an earlier stage peaked higher
+            'peak_rss_growth_mb': _round(grew, 1),
+            'traced_peak_mb': _round(self.traced_peak / 2**20, 1) if tracemalloc.is_tracing() else None,
+        }
+
+
+@contextmanager
+def stage(name, rows=None, verbose=True):
+    """Time a block as a named stage, recorded in the active RunReport if there is one.
+
+    Usage:
+        with stage('dedup', rows=len(df)) as s:
+            ...
+            s.rows = len(result)    # optional, rows processed if not known up front
+    """
+    report = _active[-1] if _active else None
+    current = Stage(name, rows, depth=len(report._open) if report is not None else 0)
+    parent = report._open[-1] if report is not None and report._open else None
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        #: Hand the peak so far to the enclosing stage before resetting it for this one
+        if parent is not None:
+            parent.traced_peak = max(parent.traced_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    if report is not None:
+        report._open.append(current)
+    current.start_peak = rss_mb()[1]
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield current
+    finally:
+        current.wall = time.perf_counter() - wall
+        current.cpu = time.process_time() - cpu
+        current.memory = rss_mb()
+        if tracing:
+            current.traced_peak = max(current.traced_peak, tracemalloc.get_traced_memory()[1])
+            if parent is not None:
+                parent.traced_peak = max(parent.traced_peak, current.traced_peak)
+        if report is not None:
+            report._open.pop()
+            report.stages.append(current)
+        if verbose:
+            rate = f', {current.rows / current.wall:,.0f} rows/s' if current.rows and current.wall else ''
+            print(f"    Time elapsed for {name}: {current.wall:.2f}s{rate}")
+
+
+class RunReport:
+    """Stages of one script run, written as JSON when the run finishes.
+
+    Usage:
+        report = RunReport('dabs_MAT_export_fast').start()
+        with stage('export SGID'):
+            ...
+        report.finish(work_dir)
+
+    trace_memory=True turns on tracemalloc for per-stage peak allocations (slows Python-heavy stages);
+    without it stages only have the process-wide resident memory and how much they raised its peak.
+    """
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._open = []
+        self._started = None
+
+    def start(self):
+        self._started = time.time()
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _active.append(self)
+        return self
+
+    def as_dict(self):
+        rss, peak_rss = rss_mb()
+        return {
+            'script': self.name,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._started)),
+            'wall_s': round(time.perf_counter() - self._wall, 3),
+            'cpu_s': round(time.process_time() - self._cpu, 3),
+            'rss_mb': _round(rss, 1),
+            'peak_rss_mb': _round(peak_rss, 1),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'stages': [s.as_dict() for s in self.stages],
+            'totals': self.totals(),
+        }
+
+    def totals(self):
+        """Wall/CPU seconds and rows summed per stage name (stages run once per chunk add up here)."""
+        totals = {}
+        for s in self.stages:
+            total = totals.setdefault(s.name, {'count': 0, 'rows': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            total['count'] += 1
+            total['rows'] += s.rows or 0
+            total['wall_s'] = round(total['wall_s'] + s.wall, 3)
+            total['cpu_s'] = round(total['cpu_s'] + s.cpu, 3)
+        return totals
+
+    def finish(self, out_dir=None):
+        """Stop collecting, print the total time and write the report to out_dir (default REPORT_DIR).
+
+        Returns the report path.
+        """
+        if self in _active:
+            _active.remove(self)
+        report = self.as_dict()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        out_dir = out_dir or REPORT_DIR
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{self.name}_run_{time.strftime('%Y%m%d_%H%M%S', time.localtime(self._started))}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("Time elapsed: {:.2f}s".format(report['wall_s']))
+        print(f"Run report written to {path}")
+        return path
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy imports for heavy dependencies (arcpy, shapely, pyproj, h3, arcgis, ...)
+- lazy_import returns a stand-in that imports the real module on first
+  attribute access, so importing dabs_core or a script costs nothing until a
+  code path actually needs the dependency
+- Missing packages (e.g. arcpy on Linux) only raise when they are used
+"""
+
+import importlib
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name):
+    """Return a LazyModule for name, e.g. arcpy = lazy_import('arcpy')."""
+    return LazyModule(name)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Master Address Table (MAT) column derivations and de-duplication
+- Moved out of dabs_MAT_export_fast.py so the same code can be timed by
+  dabs_benchmark.py on synthetic data
+- derive_columns adds City, Flag, UNIT, STREET, DABS, lat/lon, h3_index_13
+  and matID to a dataframe of SGID address points with pandas .str and NumPy
+  operations (no row-wise lambdas)
+- tests/test_mat_derivations.py checks derive_columns against a golden file
+  of what the original progress_apply lambdas produced
+- dedup removes UTAddPtID and matID duplicates, keeping DABS addresses first,
+  and returns the slimmed MAT; it orders the rows once with integer keys
+  (dedup_two_pass is the original two-sort version); both accept the typed
+  columns of dabs_core.schema
+"""
+
+import time
+from collections import namedtuple
+import numpy as np
+
+from .lazy import lazy_import
+from .h3_index import cells_to_strings, latlng_to_cells
+from .instrument import stage
+
+pd = lazy_import('pandas')
+
+#: Values treated as blank in the address point fields
+BLANKS = [None, 'None', '', ' ']
+
+#: Columns kept while de-duplicating (DABS is used to sort, then dropped)
+COLUMNS_DABS = ['FullAdd', 'AddNum', 'PrefixDir', 'StreetName', 'SuffixDir', 'StreetType', 'UNIT', 'STREET', 'City', 'ZipCode', 'State',
+                'ParcelID', 'longitude', 'latitude', 'matID', 'Comp_Group', 'Flag', 'DABS']
+
+#: Columns in the exported MAT
+MAT_COLUMNS = COLUMNS_DABS[:-1]
+
+#: Row counts from dedup
+#:     rows           - rows before de-duplicating
+#:     addptid_removed/addptid_keys - rows dropped as UTAddPtID duplicates, and how many UTAddPtIDs had duplicates
+#:     matid_removed/matid_keys     - the same for matID, among the rows left
+#:     kept           - rows in the MAT
+DedupStats = namedtuple('DedupStats', ['rows', 'addptid_removed', 'addptid_keys', 'matid_removed', 'matid_keys', 'kept'])
+
+#: H3 resolution used in matID
+MAT_H3_RESOLUTION = 13
+
+
+def _set(addpts_sdf, mask, column, values):
+    #: Masked column update, skipped when nothing matches (an empty .loc assignment can change the dtype)
+    if mask.any():
+        addpts_sdf.loc[mask, column] = values
+
+
+def derive_columns(addpts_sdf, dabs_addrs, h3_workers=None, verbose=True):
+    """Add the MAT columns to an address point dataframe, in place.
+
+    dabs_addrs is the list of DABS license addresses used to calculate the DABS column.
+    Longitude/latitude are taken from the SHAPE column unless already present.
+    h3_index_13 is stored as uint64 cells, h3_workers is passed to latlng_to_cells.
+    Output is otherwise identical to the original row-wise lambdas (see tests/test_mat_derivations.py).
+    verbose=False turns off the progress prints (e.g. when called once per chunk).
+    """
+    log = print if verbose else lambda *args: None
+
+    #: Replace 'City' values with 'AddSystem' values
+    #: If AddSystem contains a parenthesis, split on last and remove
+    log("Populating 'City' field with 'AddSystem' values...")
+    addpts_sdf['City'] = addpts_sdf['AddSystem']
+    mask = addpts_sdf['City'].str.contains('(', regex=False)
+    _set(addpts_sdf, mask, 'City', addpts_sdf.loc[mask, 'City'].str.rpartition('(')[0].str.strip())
+
+    #: Clean up 'FullAdd' values (remove apostrophes)
+    log("Cleaning up 'FullAdd' values...")
+    mask = addpts_sdf['FullAdd'].str.contains("'")
+    _set(addpts_sdf, mask, 'FullAdd', addpts_sdf.loc[mask, 'FullAdd'].str.replace("'", "", regex=False))
+
+    #: Turn flag field into yes/no
+    log("Changing 'Flag' into a yes/no field...")
+    mask = addpts_sdf['Flag'].isin([None, '', ' '])
+    addpts_sdf.loc[mask, 'Flag'] = 'no'
+    addpts_sdf.loc[~mask, 'Flag'] = 'yes'
+
+    rows = len(addpts_sdf)
+
+    #: Calc UNIT as new variable
+    log("Calculating UNIT as a new column ...")
+    with stage('UNIT calculation', rows, verbose):
+        mask = addpts_sdf['UnitType'].isin(BLANKS)
+        addpts_sdf.loc[mask, 'UnitType'] = ''
+        mask = addpts_sdf['UnitID'].isin(BLANKS)
+        addpts_sdf.loc[mask, 'UnitID'] = ''
+        unit = addpts_sdf['UnitType'].astype(str) + ' ' + addpts_sdf['UnitID'].astype(str)
+        addpts_sdf['UNIT'] = unit.str.strip().str.replace('  ', ' ', regex=False).str.replace('  ', ' ', regex=False)
+
+    #: Calc STREET as new variable
+    #: Everything after the house number, cut at the unit type or '#', apostrophes removed
+    log("Calculating STREET as a new column ...")
+    with stage('STREET calculation', rows, verbose):
+        street = addpts_sdf['FullAdd'].astype(str).str.partition(' ')[2].str.strip()
+        mask = ~addpts_sdf['UnitType'].isin(BLANKS)
+        if mask.any():
+            #: The separator differs per row, so this is the one step done with a comprehension
+            street[mask] = [s.split(u)[0].strip() for s, u in zip(street[mask], addpts_sdf.loc[mask, 'UnitType'])]
+        mask = street.str.contains('#', regex=False)
+        if mask.any():
+            #: partition of an empty selection has no columns to index
+            street[mask] = street[mask].str.partition('#')[0].str.strip()
+        street = street.str.replace("'", "", regex=False)
+        addpts_sdf['STREET'] = street
+
+    #: Calc DABS as new variable
+    log("Calculating DABS as a new column ...")
+    with stage('DABS calculation', rows, verbose):
+        mask = addpts_sdf['FullAdd'].isin(dabs_addrs)
+        addpts_sdf['DABS'] = np.where(mask, 'yes', 'no').astype(object)
+
+    #: Calc lat/lon as new variable
+    if 'longitude' not in addpts_sdf or 'latitude' not in addpts_sdf:
+        log("Calculating lat/lon as a new column ...")
+        with stage('lat/lon calculation', rows, verbose):
+            addpts_sdf['longitude'] = [p.x for p in addpts_sdf.SHAPE]
+            addpts_sdf['latitude'] = [p.y for p in addpts_sdf.SHAPE]
+
+    #: h3 index of each point, kept as uint64 until matID is built
+    log("Calculating h3 index ...")
+    with stage('h3 index', rows, verbose):
+        addpts_sdf['h3_index_13'] = latlng_to_cells(addpts_sdf['latitude'].to_numpy(), addpts_sdf['longitude'].to_numpy(),
+                                                    MAT_H3_RESOLUTION, h3_workers)
+
+    #: Calculate matID, follows 'h3index_AddNum_UNIT' pattern
+    log("Calculating matID ...")
+    with stage('matID', rows, verbose):
+        h3_strings = pd.Series(cells_to_strings(addpts_sdf['h3_index_13'].to_numpy()), index=addpts_sdf.index)
+        mat_id = h3_strings + '_' + addpts_sdf['AddNum'].astype(str) + '_' + addpts_sdf['UNIT'].astype(str)
+        addpts_sdf['matID'] = mat_id.str.rstrip('_').str.replace(' ', '_', regex=False).str.strip()
+
+    return addpts_sdf
+
+
+def strip_strings(df):
+    """Strip whitespace from every string value in a dataframe, other values are left as is.
+
+    Only text columns are touched: categoricals strip their categories, string and
+    object columns use .str.strip() (mixed object columns only on the str values).
+    """
+    df = df.copy()
+    for column in df.columns:
+        df[column] = _strip_column(df[column])
+    return df
+
+
+def _strip_column(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories
+        if pd.api.types.infer_dtype(categories, skipna=True) != 'string':
+            return values
+        stripped = categories.str.strip()
+        if stripped.is_unique:
+            return values.cat.rename_categories(stripped)
+        #: Categories that only differ by whitespace merge into one
+        return values.astype(object).str.strip().astype('category')
+    if isinstance(values.dtype, pd.StringDtype):
+        return values.str.strip()
+    if values.dtype != object:
+        return values
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind == 'string':
+        return values.where(values.isna(), values.str.strip())
+    if kind.startswith('mixed'):
+        is_str = values.map(lambda x: isinstance(x, str)).to_numpy(dtype=bool)
+        return values.where(~is_str, values.str.strip())
+    return values
+
+
+def dedup(addpts_sdf, return_stats=False):
+    """Remove UTAddPtID and matID duplicates (DABS addresses win) and return the slimmed MAT dataframe.
+
+    Same result as dedup_two_pass with a single ordering pass: rows are ordered
+    once by (DABS first, matID, input order) using integer keys, then the first
+    row of each UTAddPtID is kept, then the first of each matID among those.
+    With return_stats=True also returns a DedupStats.
+    """
+    with stage('de-duplicating', len(addpts_sdf)):
+        length_1 = len(addpts_sdf.index)
+        print(f'Number of points before de-duplicating:  {length_1}')
+
+        #: DABS as a priority (0 sorts first) and matID as integer codes in string order
+        priority = (addpts_sdf['DABS'].to_numpy() != 'yes').astype(np.int8)
+        mat_codes, _ = pd.factorize(addpts_sdf['matID'], sort=True)
+        order = np.lexsort((mat_codes, priority))
+
+        #: Keep-first on UTAddPtID, then on matID among the rows left
+        addptid_codes, _ = pd.factorize(addpts_sdf['UTAddPtID'].to_numpy()[order])
+        keep_addptid = ~pd.Series(addptid_codes).duplicated().to_numpy()
+        keep_matid = ~pd.Series(mat_codes[order][keep_addptid]).duplicated().to_numpy()
+        rows = order[keep_addptid][keep_matid]
+
+        length_2 = int(keep_addptid.sum())
+        final_length = len(rows)
+        stats = DedupStats(length_1, length_1 - length_2, _duplicated_keys(addptid_codes),
+                           length_2 - final_length, _duplicated_keys(mat_codes[order][keep_addptid]), final_length)
+        print(f'Number of points after removing duplicates on UTAddPtID:  {length_2}')
+        print(f'Removed {stats.addptid_removed} duplicates of {stats.addptid_keys} UTAddPtIDs!')
+        print(f'Number of points after removing duplicates on matID:  {final_length}')
+        print(f'Removed {stats.matid_removed} duplicates of {stats.matid_keys} matIDs!')
+
+        #: Slim down to the MAT columns and strip whitespace, only on the rows kept
+        addpts_slim = strip_strings(addpts_sdf.iloc[rows][MAT_COLUMNS])
+
+    if return_stats:
+        return addpts_slim, stats
+    return addpts_slim
+
+
+def _duplicated_keys(codes):
+    #: Number of distinct keys that occur more than once
+    counts = np.bincount(codes[codes >= 0]) if len(codes) else np.zeros(0, dtype=np.int64)
+    return int((counts > 1).sum()) + int((codes < 0).sum() > 1)
+
+
+def dedup_two_pass(addpts_sdf):
+    """Original sort/dedup/strip/sort/dedup version of dedup, kept as its reference."""
+    #: Remove duplicates on UTAddPtID
+    #: Compare size of dataframe before/after removing UTAddPtID duplicates
+    length_1 = len(addpts_sdf.index)
+    print(f'Number of points before de-duplicating:  {length_1}')
+
+    addpts_sdf.sort_values(['DABS', 'matID'], axis=0, ascending=[False, True], inplace=True)
+    addpts_sdf.drop_duplicates('UTAddPtID', inplace=True, keep='first')
+
+    length_2 = len(addpts_sdf.index)
+    diff_addptid = length_1 - length_2
+    print(f'Number of points after removing duplicates on matID:  {length_2}')
+    print(f'Removed {diff_addptid} duplicates!')
+
+    #: Slim down the dataframe to a specified set of columns
+    addpts_slim = addpts_sdf[COLUMNS_DABS]
+
+    #: Strip all strings of whitespace
+    strip_time = time.time()
+    addpts_slim = strip_strings(addpts_slim)
+    print("\n    Time elapsed stripping all whitespace: {:.2f}s".format(time.time() - strip_time))
+
+    #: Compare size of dataframe before/after removing matID duplicates
+    orig_length = len(addpts_slim.index)
+    print(f'Number of points before de-duplicating:  {orig_length}')
+
+    #: Remove duplicates on matID
+    addpts_slim.sort_values(['DABS', 'matID'], axis=0, ascending=[False, True], inplace=True)
+    addpts_slim.drop_duplicates('matID', inplace=True, keep='first')
+
+    #: remove 'DABS' column
+    addpts_slim = addpts_slim[MAT_COLUMNS]
+
+    final_length = len(addpts_slim.index)
+    diff = orig_length - final_length
+    print(f'Number of points after removing duplicates on matID:  {final_length}')
+    print(f'Removed {diff} duplicates!')
+
+    return addpts_slim
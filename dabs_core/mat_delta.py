@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Delta between two MATs so only changes need to be pushed downstream
+- Rows are joined on matID through a hash index of the previous MAT
+  (matID -> row content hash), the new MAT is streamed through it once
+- A row is 'changed' when its matID exists in both MATs but the content hash
+  of its columns differs
+- Writes added, changed (full new rows) and removed (matID) CSV files
+- Only matIDs and 64-bit hashes of the previous MAT are held in memory
+"""
+
+import os
+from collections import namedtuple
+import numpy as np
+
+from .lazy import lazy_import
+from .mat import MAT_COLUMNS
+from .mat_io import FLOAT_COLUMNS, ROW_GROUP_SIZE, iter_mat
+
+pd = lazy_import('pandas')
+
+#: Row counts of a MAT delta
+MatDelta = namedtuple('MatDelta', ['added', 'changed', 'removed', 'unchanged', 'paths'])
+
+#: Output file names, written to the delta folder
+DELTA_FILES = {'added': 'DABS_mat_added.csv', 'changed': 'DABS_mat_changed.csv', 'removed': 'DABS_mat_removed.csv'}
+
+
+def row_hashes(mat_df, columns=MAT_COLUMNS):
+    """64-bit content hash of each row over the given columns.
+
+    Strings and floats are hashed by value, so a MAT read back from CSV or Parquet
+    hashes the same as the dataframe it was written from; missing values hash as ''.
+    """
+    normalized = pd.DataFrame(index=mat_df.index)
+    for column in columns:
+        values = mat_df[column]
+        if column in FLOAT_COLUMNS:
+            normalized[column] = values.astype('float64')
+        else:
+            values = values.astype(object)
+            normalized[column] = values.where(values.isna(), values.astype(str)).fillna('')
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy(dtype=np.uint64)
+
+
+def previous_index(previous_mat, columns=MAT_COLUMNS, batch_size=ROW_GROUP_SIZE):
+    """Hash index of a MAT: a pandas Index of matIDs and the matching array of row hashes."""
+    ids, hashes = [], []
+    for batch in iter_mat(previous_mat, list(columns), batch_size):
+        ids.append(batch['matID'].to_numpy(dtype=object))
+        hashes.append(row_hashes(batch, columns))
+    ids = np.concatenate(ids) if ids else np.zeros(0, dtype=object)
+    hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+
+    #: matIDs are unique after dedup, keep the first if an older MAT wasn't
+    keep = ~pd.Index(ids).duplicated()
+    return pd.Index(ids[keep]), hashes[keep]
+
+
+def mat_delta(new_mat, previous_mat, out_dir, columns=MAT_COLUMNS, batch_size=ROW_GROUP_SIZE):
+    """Compare a new MAT to the previous one on matID and write added/changed/removed files to out_dir.
+
+    new_mat and previous_mat are DABS_mat.csv (or .parquet) paths. Returns a MatDelta.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {kind: os.path.join(out_dir, name) for kind, name in DELTA_FILES.items()}
+    prev_ids, prev_hashes = previous_index(previous_mat, columns, batch_size)
+    seen = np.zeros(len(prev_ids), dtype=bool)
+
+    counts = {'added': 0, 'changed': 0, 'unchanged': 0}
+    header = True
+    with open(paths['added'], 'w', newline='', encoding='utf-8') as added_f, \
+            open(paths['changed'], 'w', newline='', encoding='utf-8') as changed_f:
+        for batch in iter_mat(new_mat, list(columns), batch_size):
+            pos = prev_ids.get_indexer(batch['matID'].to_numpy(dtype=object))
+            found = pos >= 0
+            seen[pos[found]] = True
+            changed = np.zeros(len(batch), dtype=bool)
+            changed[found] = prev_hashes[pos[found]] != row_hashes(batch[found], columns)
+
+            batch[~found].to_csv(added_f, header=header, index=False)
+            batch[changed].to_csv(changed_f, header=header, index=False)
+            header = False
+            counts['added'] += int((~found).sum())
+            counts['changed'] += int(changed.sum())
+            counts['unchanged'] += int((found & ~changed).sum())
+
+    removed = pd.DataFrame({'matID': prev_ids[~seen]})
+    removed.to_csv(paths['removed'], index=False)
+
+    delta = MatDelta(counts['added'], counts['changed'], len(removed), counts['unchanged'], paths)
+    print(f'    MAT delta: {delta.added} added, {delta.changed} changed, {delta.removed} removed, '
+          f'{delta.unchanged} unchanged')
+    return delta
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar (Parquet) MAT output and column-projected MAT readers
+- DABS_mat.parquet is written next to DABS_mat.csv, with City, StreetType,
+  Comp_Group and Flag dictionary encoded and min/max statistics per row group
+- read_mat/iter_mat load only the requested columns, from the Parquet file when
+  it exists, is at least as new as the CSV and pyarrow is installed, otherwise
+  from the CSV; write_mat without Parquet removes an old Parquet file
+- pyarrow is optional: without it only the CSV is written and read
+- read_mat(..., typed=True) returns the columns in the dabs_core.schema dtypes
+"""
+
+import os
+
+from .lazy import lazy_import
+from .mat import MAT_COLUMNS
+from .schema import apply_schema
+
+pd = lazy_import('pandas')
+
+#: Low-cardinality columns stored as dictionaries
+DICTIONARY_COLUMNS = ['City', 'StreetType', 'Comp_Group', 'Flag']
+
+#: Numeric columns, everything else in the MAT is a string
+FLOAT_COLUMNS = ['longitude', 'latitude']
+
+#: Rows per Parquet row group
+ROW_GROUP_SIZE = 128_000
+
+COMPRESSION = 'zstd'
+
+
+def have_pyarrow():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+
+def mat_parquet_path(mat_csv):
+    """Parquet path that goes with a DABS_mat.csv path."""
+    return os.path.splitext(mat_csv)[0] + '.parquet'
+
+
+def mat_schema():
+    """Arrow schema of the MAT."""
+    import pyarrow as pa
+    fields = []
+    for column in MAT_COLUMNS:
+        if column in FLOAT_COLUMNS:
+            fields.append(pa.field(column, pa.float64()))
+        elif column in DICTIONARY_COLUMNS:
+            fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def to_arrow(mat_df):
+    """Arrow table of a MAT dataframe in the MAT schema (non-string values are converted to strings).
+
+    Accepts object, string and categorical columns (see dabs_core.schema).
+    """
+    import pyarrow as pa
+    mat_df = mat_df[MAT_COLUMNS].copy()
+    for column in MAT_COLUMNS:
+        if column not in FLOAT_COLUMNS:
+            values = mat_df[column].astype(object)
+            mat_df[column] = values.where(values.isna(), values.astype(str))
+    return pa.Table.from_pandas(mat_df, schema=mat_schema(), preserve_index=False)
+
+
+class MatParquetWriter:
+    """Write MAT dataframes to Parquet one chunk at a time.
+
+    Usage:
+        with MatParquetWriter(path) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        import pyarrow.parquet as pq
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._writer = pq.ParquetWriter(path, mat_schema(), compression=COMPRESSION, write_statistics=True)
+
+    def write(self, mat_df):
+        self._writer.write_table(to_arrow(mat_df), row_group_size=self.row_group_size)
+        self.rows += len(mat_df)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_mat(mat_df, mat_csv, parquet=True):
+    """Write the MAT to mat_csv and, when pyarrow is installed, to the matching Parquet file.
+
+    Without a new Parquet file any existing one is removed, so readers don't pick up an old MAT.
+    """
+    mat_df.to_csv(mat_csv)
+    if parquet and have_pyarrow():
+        with MatParquetWriter(mat_parquet_path(mat_csv)) as writer:
+            writer.write(mat_df)
+        print(f"    MAT written to {mat_csv} and {mat_parquet_path(mat_csv)}")
+    else:
+        if os.path.exists(mat_parquet_path(mat_csv)):
+            os.remove(mat_parquet_path(mat_csv))
+        print(f"    MAT written to {mat_csv}")
+
+
+def _source(mat_path):
+    #: Return ('parquet', path) when a Parquet MAT can be used, otherwise ('csv', path)
+    if mat_path.lower().endswith('.parquet'):
+        return 'parquet', mat_path
+    parquet_path = mat_parquet_path(mat_path)
+    #: A Parquet file older than the CSV is from an earlier MAT (e.g. the CSV was rewritten by hand)
+    if (os.path.exists(parquet_path) and have_pyarrow()
+            and (not os.path.exists(mat_path) or os.stat(parquet_path).st_mtime_ns >= os.stat(mat_path).st_mtime_ns)):
+        return 'parquet', parquet_path
+    return 'csv', mat_path
+
+
+def _read_csv(path, columns, **kwargs):
+    #: The first CSV column is the unnamed dataframe index, only read as the index when every column is read
+    dtypes = {c: str for c in (columns or MAT_COLUMNS) if c not in FLOAT_COLUMNS}
+    return pd.read_csv(path, header=0, usecols=columns, dtype=dtypes, index_col=None if columns else 0, **kwargs)
+
+
+def read_mat(mat_path, columns=None, typed=False):
+    """Read only the given columns of a MAT (DABS_mat.csv or .parquet path) into a dataframe.
+
+    The Parquet file next to a CSV path is used when it exists. String columns come back
+    as str, or with typed=True in the dtypes of dabs_core.schema.MAT_SCHEMA.
+    """
+    kind, path = _source(mat_path)
+    if kind == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns)
+        mat_df = table.to_pandas()
+        for column in mat_df.columns.intersection(DICTIONARY_COLUMNS):
+            mat_df[column] = mat_df[column].astype(object)
+    else:
+        mat_df = _read_csv(path, columns)
+    return apply_schema(mat_df) if typed else mat_df
+
+
+def iter_mat(mat_path, columns=None, batch_size=ROW_GROUP_SIZE):
+    """Yield dataframes of batch_size MAT rows with only the given columns."""
+    kind, path = _source(mat_path)
+    if kind == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+            mat_df = batch.to_pandas()
+            for column in mat_df.columns.intersection(DICTIONARY_COLUMNS):
+                mat_df[column] = mat_df[column].astype(object)
+            yield mat_df
+        return
+
+    yield from _read_csv(path, columns, chunksize=batch_size)
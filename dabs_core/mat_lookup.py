@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent SQLite lookup index of the MAT for the check scripts
+- Built once by the MAT export next to DABS_mat.csv (DABS_mat_lookup.sqlite),
+  streaming the MAT in batches so it's never loaded whole into pandas
+- Holds matID, FullAdd, City and ZipCode of every MAT row plus the normalized
+  'addr' (FullAdd) and 'addr_sys' (FullAdd + City) keys, built with
+  dabs_core.addresses exactly like the check scripts build the license keys
+- addr, addr_sys and matID are indexed, so opening the index costs the same
+  for any MAT size and membership/lookup queries are index searches
+- Each index records the size and modified time of the MAT it was built from;
+  open_mat_lookup rebuilds it when the MAT has changed
+"""
+
+import os
+import sqlite3
+
+from .lazy import lazy_import
+from .addresses import address_keys, normalize_addresses
+from .mat_io import ROW_GROUP_SIZE, iter_mat
+from .instrument import stage
+
+pd = lazy_import('pandas')
+
+#: Bump when the table layout or key rules change so old indexes are rebuilt
+LOOKUP_FORMAT = 1
+
+#: Indexed key columns: normalized FullAdd, normalized 'FullAdd City', matID
+KEY_COLUMNS = ['addr', 'addr_sys', 'matID']
+
+#: MAT columns stored with each key
+LOOKUP_FIELDS = ['matID', 'FullAdd', 'City', 'ZipCode']
+
+#: Keys bound per query when looking up a batch
+QUERY_BATCH = 10_000
+
+
+def mat_lookup_path(mat_csv):
+    """Lookup index path that goes with a DABS_mat.csv (or .parquet) path."""
+    return os.path.splitext(mat_csv)[0] + '_lookup.sqlite'
+
+
+def _mat_stamp(mat_path):
+    stat = os.stat(mat_path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def _key_column(column):
+    if column not in KEY_COLUMNS:
+        raise ValueError(f'Unknown key column {column!r}, expected one of {KEY_COLUMNS}')
+    return column
+
+
+def build_mat_lookup(mat_path, lookup_path=None, batch_size=ROW_GROUP_SIZE):
+    """Build the lookup index of a MAT (DABS_mat.csv or .parquet), replacing any existing one.
+
+    The index is written to a temporary file and moved into place, so readers never see a partial index.
+    Returns the index path.
+    """
+    lookup_path = lookup_path or mat_lookup_path(mat_path)
+    tmp_path = lookup_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.execute('PRAGMA journal_mode = OFF')
+        con.execute('PRAGMA synchronous = OFF')
+        con.execute(f'CREATE TABLE mat ({", ".join(LOOKUP_FIELDS + KEY_COLUMNS[:2])})')
+        con.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value)')
+        insert = f'INSERT INTO mat VALUES ({", ".join("?" * (len(LOOKUP_FIELDS) + 2))})'
+        rows = 0
+        with stage('building MAT lookup index') as timer:
+            for batch in iter_mat(mat_path, LOOKUP_FIELDS, batch_size):
+                batch = batch.astype(object).where(batch.notna(), None)
+                batch['addr'] = normalize_addresses(batch['FullAdd']).to_numpy(dtype=object)
+                batch['addr_sys'] = address_keys(batch['FullAdd'], batch['City']).to_numpy(dtype=object)
+                with con:
+                    con.executemany(insert, batch[LOOKUP_FIELDS + KEY_COLUMNS[:2]].itertuples(index=False))
+                rows += len(batch)
+            #: Indexes are created after loading, one sort each instead of row-by-row inserts
+            for column in KEY_COLUMNS:
+                con.execute(f'CREATE INDEX mat_{column} ON mat ({column})')
+            timer.rows = rows
+        with con:
+            con.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('format', LOOKUP_FORMAT), ('rows', rows),
+                ('source', os.path.abspath(mat_path)), ('stamp', _mat_stamp(mat_path))])
+        con.execute('ANALYZE')
+    finally:
+        con.close()
+
+    os.replace(tmp_path, lookup_path)
+    print(f"    MAT lookup index of {rows} rows written to {lookup_path}")
+    return lookup_path
+
+
+def open_mat_lookup(mat_path, lookup_path=None, rebuild=False):
+    """Open the lookup index of a MAT, building it first when it's missing, outdated or rebuild=True."""
+    lookup_path = lookup_path or mat_lookup_path(mat_path)
+    if not rebuild and os.path.exists(lookup_path):
+        lookup = MatLookup(lookup_path)
+        if lookup.is_current(mat_path):
+            return lookup
+        lookup.close()
+        print(f"MAT lookup index {lookup_path} is out of date, rebuilding ...")
+    build_mat_lookup(mat_path, lookup_path)
+    return MatLookup(lookup_path)
+
+
+class MatLookup:
+    """Read-only membership and lookup queries against a MAT lookup index.
+
+    Usage:
+        lookup = open_mat_lookup(mat_csv)
+        not_matched = lookup.missing(license_keys, 'addr_sys')
+        matches = lookup.lookup(['123 S MAIN ST SALT LAKE CITY'], 'addr_sys')
+    """
+
+    def __init__(self, lookup_path):
+        self.path = lookup_path
+        self._con = sqlite3.connect(f'file:{os.path.abspath(lookup_path)}?mode=ro', uri=True, check_same_thread=False)
+        self.meta = dict(self._con.execute('SELECT name, value FROM meta'))
+        if self.meta.get('format') != LOOKUP_FORMAT:
+            self.close()
+            raise ValueError(f'{lookup_path} has lookup format {self.meta.get("format")}, expected {LOOKUP_FORMAT}')
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def is_current(self, mat_path):
+        """True when the index was built from mat_path as it is now."""
+        return os.path.exists(mat_path) and self.meta.get('stamp') == _mat_stamp(mat_path)
+
+    def contains(self, key, column='addr_sys'):
+        """True when a key is in the MAT."""
+        sql = f'SELECT 1 FROM mat WHERE {_key_column(column)} = ? LIMIT 1'
+        return self._con.execute(sql, (key,)).fetchone() is not None
+
+    def _batches(self, keys):
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), QUERY_BATCH):
+            yield keys[start:start + QUERY_BATCH]
+
+    def found(self, keys, column='addr_sys'):
+        """The distinct keys that are in the MAT."""
+        column = _key_column(column)
+        found = set()
+        for batch in self._batches(keys):
+            sql = f'SELECT DISTINCT {column} FROM mat WHERE {column} IN ({", ".join("?" * len(batch))})'
+            found.update(row[0] for row in self._con.execute(sql, batch))
+        return found
+
+    def missing(self, keys, column='addr_sys'):
+        """The distinct keys that aren't in the MAT, in input order (the set difference the check scripts need)."""
+        keys = list(dict.fromkeys(keys))
+        found = self.found(keys, column)
+        return [key for key in keys if key not in found]
+
+    def lookup(self, keys, column='addr_sys', fields=LOOKUP_FIELDS):
+        """MAT rows matching the keys, as a dataframe with a 'key' column (one row per match)."""
+        column = _key_column(column)
+        select = ', '.join([column] + list(fields))
+        frames = []
+        for batch in self._batches(keys):
+            sql = f'SELECT {select} FROM mat WHERE {column} IN ({", ".join("?" * len(batch))})'
+            frames.append(pd.DataFrame.from_records(self._con.execute(sql, batch).fetchall(),
+                                                    columns=['key'] + list(fields)))
+        if not frames:
+            return pd.DataFrame(columns=['key'] + list(fields))
+        return pd.concat(frames, ignore_index=True)
+
+    def close(self):
+        self._con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
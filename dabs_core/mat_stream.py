@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming MAT export with bounded memory
+- Address points are read from the feature class in fixed-size chunks and the
+  MAT columns are derived one chunk at a time (dabs_core.mat.derive_columns)
+- Derived rows go to a temporary on-disk SQLite table; the UTAddPtID and matID
+  de-duplication runs there with window functions, using the same rules as
+  dabs_core.mat.dedup (DABS addresses first, then lowest matID; input order
+  breaks remaining ties)
+- DABS_mat.csv is written incrementally from a SQLite cursor, so peak memory
+  depends on the chunk size, not on the statewide address count
+- The matching DABS_mat.parquet is written chunk by chunk alongside (when pyarrow is installed)
+- The comparison to the previous MAT's matIDs also runs in SQLite
+- project=True reads UTM 12N points and projects them to WGS84 in memory
+- FileGDB/GeoPackage/FlatGeobuf points are streamed in Arrow batches through
+  GDAL (dabs_core.table_io.iter_batches) unless they need arcpy
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+from itertools import islice
+import numpy as np
+
+from .lazy import lazy_import
+from .mat import COLUMNS_DABS, MAT_COLUMNS, derive_columns, strip_strings
+from .schema import SOURCE_TYPED, apply_schema
+from .mat_io import MatParquetWriter, have_pyarrow, iter_mat, mat_parquet_path
+from .table_io import iter_batches, pick_backend, read_columns, read_xy
+from .reproject import utm12_to_wgs84
+from .storage import default_backend
+from .instrument import stage
+
+arcpy = lazy_import('arcpy')
+pd = lazy_import('pandas')
+
+#: Address points per chunk
+CHUNK_SIZE = 100_000
+
+#: Address point fields read from the feature class
+SOURCE_FIELDS = ['FullAdd', 'AddNum', 'PrefixDir', 'StreetName', 'SuffixDir', 'StreetType', 'UnitType', 'UnitID',
+                 'AddSystem', 'ZipCode', 'State', 'ParcelID', 'UTAddPtID', 'Comp_Group', 'Flag']
+
+#: SQLite page cache for the dedup/sort, in KiB (negative cache_size means KiB)
+CACHE_KIB = 65_536
+
+
+def iter_address_chunks(addpts, fields=SOURCE_FIELDS, chunk_size=CHUNK_SIZE, project=False):
+    """Yield dataframes of chunk_size address points with the fields plus longitude/latitude.
+
+    Rows come in cursor order, the dataframe index is the running row position
+    (the same index pd.DataFrame.spatial.from_featureclass gives).
+    project=True converts NAD83 / UTM 12N coordinates to WGS84 in memory (dabs_core.reproject).
+    """
+    for chunk in _address_chunks(addpts, fields, chunk_size):
+        if project:
+            chunk['longitude'], chunk['latitude'] = utm12_to_wgs84(chunk['longitude'].astype('float64').to_numpy(),
+                                                                   chunk['latitude'].astype('float64').to_numpy())
+        yield chunk
+
+
+def _address_chunks(addpts, fields, chunk_size):
+    start = 0
+    if pick_backend(addpts) == 'pyogrio' or (default_backend() == 'gdal' and pick_backend(addpts) != 'arcpy'):
+        for columns, x, y in iter_batches(addpts, fields, chunk_size):
+            chunk = pd.DataFrame(columns, index=pd.RangeIndex(start, start + len(x)))
+            chunk['longitude'], chunk['latitude'] = x, y
+            start += len(x)
+            yield chunk
+        return
+
+    with arcpy.da.SearchCursor(addpts, list(fields) + ['SHAPE@X', 'SHAPE@Y']) as cursor:
+        while True:
+            rows = list(islice(cursor, chunk_size))
+            if not rows:
+                break
+            chunk = pd.DataFrame.from_records(rows, columns=list(fields) + ['longitude', 'latitude'])
+            chunk.index = pd.RangeIndex(start, start + len(rows))
+            start += len(rows)
+            yield chunk
+
+
+def read_address_points(addpts, fields=SOURCE_FIELDS, typed=True, project=False):
+    """Read all address points into a dataframe with the fields plus longitude/latitude.
+
+    Replaces pd.DataFrame.spatial.from_featureclass for the MAT: coordinates come
+    from read_xy as float64 arrays, no SHAPE geometry objects are created.
+    With typed=True the fields derive_columns only reads (schema.SOURCE_TYPED)
+    get their compact dtypes right away.
+    project=True converts NAD83 / UTM 12N coordinates to WGS84 in memory.
+    """
+    oids, columns = read_columns(addpts, fields)
+    xy_oids, x, y = read_xy(addpts)
+    if project:
+        x, y = utm12_to_wgs84(x, y)
+    #: Line the coordinates up with the attribute rows by OID
+    sorter = np.argsort(xy_oids, kind='stable')
+    order = sorter[np.searchsorted(xy_oids, oids, sorter=sorter)]
+    addpts_df = pd.DataFrame(columns)
+    addpts_df['longitude'] = x[order]
+    addpts_df['latitude'] = y[order]
+    if typed:
+        apply_schema(addpts_df, SOURCE_TYPED)
+    return addpts_df
+
+
+def _quote(name):
+    return f'"{name}"'
+
+
+def _connect(path):
+    con = sqlite3.connect(path)
+    con.execute('PRAGMA journal_mode = OFF')
+    con.execute('PRAGMA synchronous = OFF')
+    con.execute('PRAGMA temp_store = FILE')
+    con.execute(f'PRAGMA cache_size = -{CACHE_KIB}')
+    return con
+
+
+def _to_sql_value(value):
+    #: sqlite3 can't bind NumPy scalars, NaN is stored as NULL like pandas writes it to CSV
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+#: Keep the best row per UTAddPtID, then per matID, in MAT order
+#: (n1 is the number of rows left after the UTAddPtID pass, on every row)
+_DEDUP_SQL = '''
+WITH by_addptid AS (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY UTAddPtID ORDER BY DABS DESC, matID, seq) AS r1 FROM mat
+), by_matid AS (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY matID ORDER BY DABS DESC, seq) AS r2, COUNT(*) OVER () AS n1
+    FROM by_addptid WHERE r1 = 1
+)
+'''
+
+
+def export_mat_streaming(addpts, dabs_addrs, mat_csv, previous_mat=None, chunk_size=CHUNK_SIZE, tmp_dir=None,
+                         parquet=True, project=False):
+    """Derive, de-duplicate and write the MAT to mat_csv (and its Parquet file) chunk by chunk.
+
+    previous_mat is an optional earlier DABS_mat.csv to compare matIDs against.
+    project=True reads NAD83 / UTM 12N points and converts them to WGS84 per chunk.
+    Returns a dictionary of row counts (read, after UTAddPtID/matID dedup, and
+    matched/new matIDs when previous_mat is given).
+    """
+    dabs_addrs = set(dabs_addrs)
+    work = tempfile.mkdtemp(prefix='dabs_mat_', dir=tmp_dir)
+    con = _connect(os.path.join(work, 'mat.sqlite'))
+    stats = {}
+    try:
+        #: Derive columns per chunk into the on-disk table
+        columns = ['seq', 'UTAddPtID'] + COLUMNS_DABS
+        con.execute(f'CREATE TABLE mat ({", ".join(_quote(c) for c in columns)})')
+        insert = f'INSERT INTO mat VALUES ({", ".join("?" * len(columns))})'
+        read = 0
+        with stage('deriving columns') as timer:
+            for chunk in iter_address_chunks(addpts, chunk_size=chunk_size, project=project):
+                derive_columns(chunk, dabs_addrs, verbose=False)
+                slim = strip_strings(chunk[COLUMNS_DABS])
+                slim.insert(0, 'UTAddPtID', chunk['UTAddPtID'])
+                slim.insert(0, 'seq', chunk.index)
+                with con:
+                    con.executemany(insert, ([_to_sql_value(v) for v in row] for row in slim.itertuples(index=False)))
+                read += len(chunk)
+                print(f'    derived {read} address points ...')
+            timer.rows = read
+        stats['read'] = read
+
+        print(f'Number of points before de-duplicating:  {read}')
+
+        #: Stream the de-duplicated rows, in MAT order, to the CSV; the UTAddPtID count comes with the rows
+        stats['after_addptid'] = 0
+        with stage(f'writing {mat_csv}', read):
+            select = ', '.join(['seq', 'n1'] + [_quote(c) for c in MAT_COLUMNS])
+            cursor = con.execute(_DEDUP_SQL + f'SELECT {select} FROM by_matid WHERE r2 = 1 ORDER BY DABS DESC, matID, seq')
+            written = 0
+            header = True
+            parquet_writer = MatParquetWriter(mat_parquet_path(mat_csv)) if parquet and have_pyarrow() else None
+            with open(mat_csv, 'w', newline='', encoding='utf-8') as f:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    out = pd.DataFrame.from_records(rows, columns=['seq', 'n1'] + MAT_COLUMNS).set_index('seq')
+                    out.index.name = None
+                    stats['after_addptid'] = int(out.pop('n1').iloc[0])
+                    out.to_csv(f, header=header)
+                    if parquet_writer is not None:
+                        parquet_writer.write(out)
+                    header = False
+                    written += len(out)
+            if parquet_writer is not None:
+                parquet_writer.close()
+            stats['after_matid'] = written
+            print(f'Number of points after removing duplicates on UTAddPtID:  {stats["after_addptid"]}')
+            print(f'Number of points after removing duplicates on matID:  {written}')
+            print(f'Removed {read - written} duplicates!')
+
+        if previous_mat is not None:
+            stats.update(_compare_previous(con, previous_mat, chunk_size))
+    finally:
+        con.close()
+        shutil.rmtree(work, ignore_errors=True)
+
+    return stats
+
+
+def _compare_previous(con, previous_mat, chunk_size):
+    #: Count exported matIDs found in the previous MAT, the previous matIDs are loaded into SQLite in chunks
+    con.execute('CREATE TABLE previous (matID TEXT PRIMARY KEY) WITHOUT ROWID')
+    for chunk in iter_mat(previous_mat, ['matID'], chunk_size):
+        with con:
+            con.executemany('INSERT OR IGNORE INTO previous VALUES (?)', ((m,) for m in chunk['matID'].tolist()))
+
+    total, matched = con.execute(_DEDUP_SQL + '''
+        SELECT COUNT(*), COUNT(previous.matID) FROM by_matid LEFT JOIN previous USING (matID) WHERE r2 = 1''').fetchone()
+    return {'matched_previous': matched, 'new_or_different': total - matched}
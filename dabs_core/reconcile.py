@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Keyed reconciliation of two tables (Google Sheet, AGOL layer, local gdb) for the license checks
+- The source is the table of record (e.g. the active license sheet), the target
+  the table to bring in line with it (e.g. the AGOL license layer)
+- One hash join on the key (a pandas Index of target keys, like the matID join
+  in dabs_core.mat_delta) splits the rows into adds (source only), removes
+  (target only) and matched rows, and the compare columns of the matched rows
+  are diffed column by column in the same pass
+- Key and compare column names can differ between the tables
+  (LICENSE_NO -> Lic_Number); values are compared after normalizing (text,
+  trimmed, whitespace collapsed, upper case, missing as '') unless normalize=None
+- Changes are returned one row per changed field with the target's id, so they
+  can be applied as edits; duplicated keys are reported and only their first
+  row is reconciled
+"""
+
+import os
+import re
+from collections import namedtuple
+import numpy as np
+
+from .lazy import lazy_import
+from .table_io import OID_TOKEN, read_table
+
+pd = lazy_import('pandas')
+
+#: Result of a reconciliation
+#:     adds       - source rows whose key isn't in the target
+#:     removes    - target rows whose key isn't in the source
+#:     changes    - one row per changed field of a matched key: key, target id, field, source_field, target_value, source_value
+#:     unchanged  - matched keys with no changed field
+#:     duplicates - keys found more than once: table ('source'/'target'), key, count
+Reconciliation = namedtuple('Reconciliation', ['adds', 'removes', 'changes', 'unchanged', 'duplicates'])
+
+#: CSV names used by write_reconciliation unless others are given
+EDIT_FILES = {'adds': 'adds.csv', 'removes': 'removes.csv', 'changes': 'changes.csv'}
+
+_whitespace = re.compile(r'\s+')
+
+
+def normalize_values(values):
+    """Comparable text of a column: trimmed, whitespace collapsed, upper case, '' for missing.
+
+    Whole floats lose their '.0', so 123 from a sheet equals 123.0 from a geodatabase.
+    """
+    values = pd.Series(values).astype(object)
+    text = [
+        '' if value is None or (isinstance(value, float) and value != value)
+        else str(int(value)) if isinstance(value, (float, np.floating)) and float(value).is_integer()
+        else _whitespace.sub(' ', str(value)).strip().upper()
+        for value in values.tolist()
+    ]
+    return pd.Series(text, index=values.index, dtype=object)
+
+
+def _as_objects(values):
+    values = pd.Series(values).astype(object)
+    return values.where(values.notna(), None)
+
+
+def _compare_map(compare, source, target, key, target_key):
+    #: {source column: target column}, a list means the same names in both tables
+    if compare is None:
+        return {c: c for c in source.columns if c in target.columns and c not in (key, target_key)}
+    if isinstance(compare, dict):
+        return dict(compare)
+    return {c: c for c in compare}
+
+
+def _duplicates(table, keys):
+    counts = keys[keys.duplicated(keep=False)].value_counts(sort=False)
+    return pd.DataFrame({'table': table, 'key': counts.index, 'count': counts.to_numpy()})
+
+
+def reconcile(source, target, key, target_key=None, compare=None, target_id=None, normalize=normalize_values):
+    """Reconcile the target table to the source table on a key column.
+
+    source/target are dataframes, compare is a list of columns in both tables or a dictionary of
+    source column -> target column (default: every other column the tables share). target_id is a
+    target column (e.g. 'OBJECTID') carried into changes so they can be applied as edits.
+    Returns a Reconciliation.
+    """
+    target_key = target_key or key
+    compare = _compare_map(compare, source, target, key, target_key)
+    prepare = normalize if normalize is not None else _as_objects
+    source_keys = prepare(source[key]).reset_index(drop=True)
+    target_keys = prepare(target[target_key]).reset_index(drop=True)
+
+    duplicates = pd.concat([_duplicates('source', source_keys), _duplicates('target', target_keys)], ignore_index=True)
+    source_first = ~source_keys.duplicated().to_numpy()
+    target_first = np.flatnonzero(~target_keys.duplicated().to_numpy())
+
+    #: Hash join: position of each source key among the (first) target keys
+    target_index = pd.Index(target_keys.to_numpy()[target_first])
+    pos = target_index.get_indexer(source_keys.to_numpy())
+    matched = source_first & (pos >= 0)
+    source_rows = np.flatnonzero(matched)
+    target_rows = target_first[pos[matched]]
+    seen = np.zeros(len(target), dtype=bool)
+    seen[target_rows] = True
+
+    adds = source.iloc[np.flatnonzero(source_first & (pos < 0))]
+    removes = target.iloc[target_first[~seen[target_first]]]
+
+    #: Field level diff of the matched rows, one column pair at a time
+    changes = []
+    changed_rows = np.zeros(len(source_rows), dtype=bool)
+    matched_keys = source_keys.to_numpy()[source_rows]
+    ids = target[target_id].to_numpy()[target_rows] if target_id is not None else None
+    for source_field, target_field in compare.items():
+        new = source[source_field].iloc[source_rows]
+        old = target[target_field].iloc[target_rows]
+        differ = prepare(new).to_numpy() != prepare(old).to_numpy()
+        if not differ.any():
+            continue
+        changed_rows |= differ
+        change = {'key': matched_keys[differ]}
+        if ids is not None:
+            change[target_id] = ids[differ]
+        change.update({'field': target_field, 'source_field': source_field,
+                       'target_value': old.to_numpy()[differ], 'source_value': new.to_numpy()[differ]})
+        changes.append(pd.DataFrame(change))
+    columns = ['key'] + ([target_id] if target_id is not None else []) + ['field', 'source_field', 'target_value', 'source_value']
+    changes = pd.concat(changes, ignore_index=True) if changes else pd.DataFrame(columns=columns)
+    changes = changes.sort_values(['key', 'field'], kind='stable', ignore_index=True)
+
+    result = Reconciliation(adds.sort_values(key, kind='stable'), removes.sort_values(target_key, kind='stable'),
+                            changes, int((~changed_rows).sum()), duplicates)
+    print(f'    Reconciliation: {len(result.adds)} adds, {len(result.removes)} removes, '
+          f'{int(changed_rows.sum())} changed ({len(result.changes)} field changes), {result.unchanged} unchanged')
+    if len(duplicates):
+        print(f'    {len(duplicates)} duplicated keys, only the first row of each was reconciled')
+    return result
+
+
+def table_frame(table, fields, where=None, backend=None, oid_field='OBJECTID'):
+    """Dataframe of a table's OIDs (as oid_field) and fields, read with dabs_core.table_io.read_table."""
+    columns = read_table(table, [OID_TOKEN] + list(fields), where, backend)
+    return pd.DataFrame(columns).rename(columns={OID_TOKEN: oid_field})
+
+
+def write_reconciliation(result, out_dir, names=EDIT_FILES):
+    """Write adds, removes and changes of a Reconciliation to CSV files in out_dir, returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {kind: os.path.join(out_dir, name) for kind, name in names.items()}
+    for kind, path in paths.items():
+        getattr(result, kind).to_csv(path, index=False)
+    return paths
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory reprojection of coordinate arrays with pyproj
+- Replaces arcpy.Project_management for the address points: X/Y arrays are
+  transformed in chunks on a thread pool (PROJ releases the GIL), no projected
+  feature class copy is written
+- UTM12_TO_WGS84 is NAD83 / UTM zone 12N to WGS84 with the same datum
+  transformation the MAT script gave Project_management,
+  WGS_1984_(ITRF00)_To_NAD_1983 (ESRI 108190, coordinate frame), run in reverse
+- pyproj Transformers aren't thread-safe, each thread caches its own per pipeline
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+#: Points per chunk handed to a worker thread
+CHUNK_SIZE = 250_000
+
+#: WGS_1984_(ITRF00)_To_NAD_1983 parameters (ESRI 108190)
+ITRF00_TO_NAD83 = ('+proj=helmert +x=0.9956 +y=-1.9013 +z=-0.5215 +rx=0.025915 +ry=0.009426 +rz=0.011599 '
+                   '+s=0.00062 +convention=coordinate_frame')
+
+#: NAD83 / UTM 12N (EPSG:26912) -> WGS84 lon/lat degrees, through geocentric coordinates
+UTM12_TO_WGS84 = ('+proj=pipeline '
+                  '+step +inv +proj=utm +zone=12 +ellps=GRS80 '
+                  '+step +proj=cart +ellps=GRS80 '
+                  f'+step +inv {ITRF00_TO_NAD83} '
+                  '+step +inv +proj=cart +ellps=WGS84 '
+                  '+step +proj=unitconvert +xy_in=rad +xy_out=deg')
+
+_local = threading.local()
+
+
+def transformer(pipeline=UTM12_TO_WGS84):
+    """pyproj Transformer for a PROJ pipeline string, cached per thread."""
+    cache = getattr(_local, 'transformers', None)
+    if cache is None:
+        cache = _local.transformers = {}
+    if pipeline not in cache:
+        from pyproj import Transformer
+        cache[pipeline] = Transformer.from_pipeline(pipeline)
+    return cache[pipeline]
+
+
+def _transform_chunk(args):
+    x, y, pipeline = args
+    return transformer(pipeline).transform(x, y)
+
+
+def reproject(x, y, pipeline=UTM12_TO_WGS84, workers=None, chunk_size=CHUNK_SIZE):
+    """Transform X/Y arrays with a PROJ pipeline and return new contiguous float64 arrays.
+
+    NaN coordinates stay NaN. workers is the number of threads (default: one per
+    chunk, up to the number of CPUs).
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    out_x = np.full(len(x), np.nan)
+    out_y = np.full(len(y), np.nan)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if not len(finite):
+        return out_x, out_y
+
+    chunks = [finite[i:i + chunk_size] for i in range(0, len(finite), chunk_size)]
+    jobs = [(x[rows], y[rows], pipeline) for rows in chunks]
+    if len(jobs) == 1 or workers == 1:
+        results = list(map(_transform_chunk, jobs))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_transform_chunk, jobs))
+    for rows, (tx, ty) in zip(chunks, results):
+        out_x[rows], out_y[rows] = tx, ty
+    return out_x, out_y
+
+
+def utm12_to_wgs84(x, y, workers=None, chunk_size=CHUNK_SIZE):
+    """Longitude/latitude (WGS84) arrays for NAD83 / UTM 12N X/Y arrays, as arcpy projected them for the MAT."""
+    return reproject(x, y, UTM12_TO_WGS84, workers, chunk_size)
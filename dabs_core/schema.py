@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Declared dtypes for the address point / MAT dataframe
+- Low-cardinality fields (City, PrefixDir, SuffixDir, StreetType, State, Flag,
+  Comp_Group, ZipCode, ...) are categoricals
+- High-cardinality text (FullAdd, STREET, matID, ...) uses Arrow-backed
+  strings when pyarrow is installed, Python objects otherwise
+- Coordinates stay float64: float32 keeps only ~7 significant digits, which
+  is roughly a meter at Utah longitudes and would change matID/H3 cells
+- SOURCE_TYPED lists the columns that can be typed as soon as points are read,
+  the rest are rewritten by derive_columns and are typed after it
+"""
+
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+CATEGORY = 'category'
+STRING = 'string'
+
+#: Column name -> dtype kind ('category', 'string' or a NumPy dtype name)
+MAT_SCHEMA = {
+    'FullAdd': STRING,
+    'AddNum': STRING,
+    'PrefixDir': CATEGORY,
+    'StreetName': STRING,
+    'SuffixDir': CATEGORY,
+    'StreetType': CATEGORY,
+    'UnitType': CATEGORY,
+    'UnitID': STRING,
+    'UNIT': STRING,
+    'STREET': STRING,
+    'AddSystem': CATEGORY,
+    'City': CATEGORY,
+    'ZipCode': CATEGORY,
+    'State': CATEGORY,
+    'ParcelID': STRING,
+    'UTAddPtID': STRING,
+    'longitude': 'float64',
+    'latitude': 'float64',
+    'matID': STRING,
+    'Comp_Group': CATEGORY,
+    'Flag': CATEGORY,
+    'DABS': CATEGORY,
+}
+
+#: Columns derive_columns doesn't use, safe to type when the points are loaded
+#: (the ones it reads or rewrites are typed after it, typed NA in AddNum would change matID)
+SOURCE_TYPED = ['PrefixDir', 'StreetName', 'SuffixDir', 'StreetType', 'ZipCode', 'State', 'ParcelID', 'UTAddPtID', 'Comp_Group']
+
+
+def string_dtype():
+    """Arrow-backed string dtype when pyarrow is installed, otherwise object."""
+    try:
+        import pyarrow
+    except ImportError:
+        return object
+    return pd.StringDtype('pyarrow')
+
+
+def apply_schema(df, columns=None):
+    """Convert the columns of df that are in MAT_SCHEMA (or only the given ones) to their declared dtypes, in place.
+
+    Missing values become NA in string/category columns. Returns df.
+    """
+    strings = string_dtype()
+    for column in (columns if columns is not None else MAT_SCHEMA):
+        if column not in df.columns or column not in MAT_SCHEMA:
+            continue
+        kind = MAT_SCHEMA[column]
+        values = df[column]
+        if kind == CATEGORY:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                df[column] = _as_text(values).astype(CATEGORY)
+        elif kind == STRING:
+            if values.dtype != strings:
+                df[column] = _as_text(values).astype(strings)
+        else:
+            df[column] = values.astype(kind)
+    return df
+
+
+def _as_text(values):
+    #: Non-string values (e.g. numeric ZipCodes) become their str(), missing values stay missing
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+        return values.where(values.isna(), values.astype(str))
+    return values
+
+
+def memory_mb(df):
+    """Deep memory use of a dataframe in MB."""
+    return df.memory_usage(deep=True).sum() / 2**20
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-core sharded point-in-polygon matching for statewide address points
+- Points are partitioned spatially into shards, by H3 cell (resolution 5 by
+  default) or by the polygons of a layer such as SGID Counties
+- Polygons are clipped to each shard's extent (plus the search tolerance)
+  so workers only receive the geometry they need
+- Shards run in a process pool and results are merged back by point position,
+  so output is the same as a single-core PolygonIndex.match regardless of
+  worker count or completion order
+- Scripts using workers > 1 must call it under if __name__ == '__main__'
+  (Windows starts worker processes by re-importing the main script)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .lazy import lazy_import
+from .poly_assign import PolygonIndex, TOLERANCE, WORK_SR
+from .h3_index import latlng_to_cells
+
+shapely = lazy_import('shapely')
+
+#: Default shard granularity, H3 resolution 5 cells are ~250 sq km
+SHARD_BY = 'h3'
+H3_RESOLUTION = 5
+
+
+def shard_keys(x, y, shard_by=SHARD_BY, h3_resolution=H3_RESOLUTION, sr=WORK_SR):
+    """Return a shard key for each point (coordinates in sr).
+
+    shard_by is 'h3' for H3 cells at h3_resolution, or the path to a polygon
+    layer (e.g. SGID Counties) where each polygon is a shard.
+    Points with missing coordinates or outside every shard polygon share one key.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    finite = np.isfinite(x) & np.isfinite(y)
+
+    if shard_by == 'h3':
+        from pyproj import Transformer
+        to_wgs84 = Transformer.from_crs(sr, 4326, always_xy=True)
+        keys = np.zeros(len(x), dtype=np.uint64)
+        lon, lat = to_wgs84.transform(x[finite], y[finite])
+        keys[finite] = latlng_to_cells(lat, lon, h3_resolution)
+        return keys
+
+    #: Imported here because index_cache builds on PolygonIndex
+    from .index_cache import cached_polygon_index
+    shard_index = cached_polygon_index(shard_by, [], sr)
+    return shard_index.match(x, y, tolerance=0)
+
+
+def _match_shard(args):
+    poly_wkb, x, y, tolerance = args
+    geometries = shapely.from_wkb(poly_wkb)
+    return PolygonIndex(np.arange(len(geometries)), geometries).match(x, y, tolerance)
+
+
+def _build_shards(index, x, y, keys, tolerance):
+    #: Yield (point positions, polygon positions, worker arguments) for each shard
+    _, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0, True])
+    pad = 2 * tolerance
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        pts_idx = order[start:end]
+        sx, sy = x[pts_idx], y[pts_idx]
+        finite = np.isfinite(sx) & np.isfinite(sy)
+        if not finite.any():
+            continue
+
+        #: Any polygon within the tolerance of a shard point lies inside the padded extent,
+        #: so clipping to it doesn't change the match
+        rect = (sx[finite].min() - pad, sy[finite].min() - pad, sx[finite].max() + pad, sy[finite].max() + pad)
+        subset = np.sort(index.tree.query(shapely.box(*rect)))
+        if len(subset) == 0:
+            continue
+        clipped = shapely.clip_by_rect(index.geometries[subset], *rect)
+        yield pts_idx, subset, (shapely.to_wkb(clipped), sx, sy, tolerance)
+
+
+def match_parallel(index, x, y, tolerance=TOLERANCE, workers=None, shard_by=SHARD_BY,
+                   h3_resolution=H3_RESOLUTION, keys=None):
+    """Same result as index.match(x, y, tolerance), computed in shards across a process pool.
+
+    workers defaults to the number of CPUs, shard_by/h3_resolution set the shard granularity.
+    keys can pass shard keys from shard_keys() when matching the same points to several layers.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    workers = workers or os.cpu_count()
+    if workers <= 1 or len(x) == 0 or len(index) == 0:
+        return index.match(x, y, tolerance)
+
+    if keys is None:
+        keys = shard_keys(x, y, shard_by, h3_resolution)
+    shards = list(_build_shards(index, x, y, keys, tolerance))
+    print(f'    matching {len(x)} points in {len(shards)} shards on {workers} workers ...')
+
+    matched = np.full(len(x), -1, dtype=np.int64)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_match_shard, [shard[2] for shard in shards], chunksize=4)
+        for (pts_idx, subset, _), shard_matched in zip(shards, results):
+            hit = shard_matched >= 0
+            matched[pts_idx[hit]] = subset[shard_matched[hit]]
+
+    return matched
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of pipeline stage outputs (SGID exports, AGOL
+parcel download, projection, ...)
+- Each stage output is stored under a fingerprint of the stage inputs: source
+  layer path and version (source_version), query and parameters
+- Sources without a reliable version stamp (remote layers without editor
+  tracking) are versioned by the run date, their outputs are only reused
+  within the same day
+- A rerun with the same fingerprint reuses the stored output instead of
+  repeating the stage, so a crash only costs the stage that failed
+- Entries are written to a temporary folder and renamed when complete, a
+  half-built entry is never used
+- invalidate drops entries explicitly, evict removes the least recently used
+  entries once the cache grows past max_bytes
+- layer() stores a feature class in a file geodatabase per entry and copies it
+  into the working geodatabase, later steps may edit the copy freely
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+
+from .lazy import lazy_import
+from .index_cache import CACHE_DIR, layer_stamp
+from .storage import copy_layer, create_workspace, default_backend
+
+arcpy = lazy_import('arcpy')
+
+#: Bump when the on-disk layout changes so old entries are ignored
+CACHE_FORMAT = 1
+
+#: Evict least recently used entries beyond this size
+MAX_BYTES = 20 * 2**30
+
+#: File geodatabase holding a cached layer inside its entry
+STAGE_GDB = 'stage.gdb'
+
+
+def fingerprint(*inputs):
+    """Stable hash of JSON-serializable stage inputs."""
+    key = json.dumps([CACHE_FORMAT, *inputs], sort_keys=True, default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def source_version(source):
+    """Version of a source layer for a stage fingerprint: its layer stamp, or the run date when it has none."""
+    stamp = layer_stamp(source)
+    return stamp if stamp is not None else 'date ' + time.strftime('%Y-%m-%d')
+
+
+def _folder_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+class StageCache:
+    """On-disk cache of stage outputs keyed by a fingerprint of the stage inputs.
+
+    Usage:
+        cache = StageCache()
+        entry_dir, hit = cache.run('export', [source, source_version(source)], build)
+
+    build(tmp_dir) writes the stage output into tmp_dir and is only called on a miss.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.root = os.path.join(cache_dir, 'stages')
+        self.max_bytes = max_bytes
+
+    def entry_dir(self, stage, inputs):
+        return os.path.join(self.root, stage, fingerprint(stage, inputs))
+
+    def lookup(self, stage, inputs):
+        """Entry folder of a complete entry for these inputs, or None."""
+        entry_dir = self.entry_dir(stage, inputs)
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        #: The meta file's modified time is the entry's last use, for eviction
+        os.utime(meta_path)
+        return entry_dir
+
+    def store(self, stage, inputs, build):
+        """Run build(tmp_dir) and keep its output as the entry for these inputs."""
+        entry_dir = self.entry_dir(stage, inputs)
+        tmp_dir = entry_dir + '.tmp'
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        stage_time = time.time()
+        build(tmp_dir)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'format': CACHE_FORMAT, 'stage': stage, 'inputs': inputs, 'size': _folder_size(tmp_dir),
+                       'seconds': round(time.time() - stage_time, 2)}, f, default=str)
+
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.rename(tmp_dir, entry_dir)
+        self.evict(keep=entry_dir)
+        return entry_dir
+
+    def run(self, stage, inputs, build, rebuild=False):
+        """Return (entry_dir, hit): the stored output for these inputs, built first on a miss or with rebuild=True."""
+        entry_dir = None if rebuild else self.lookup(stage, inputs)
+        if entry_dir is not None:
+            print(f'    {stage}: reusing cached output {entry_dir}')
+            return entry_dir, True
+        return self.store(stage, inputs, build), False
+
+    def layer(self, stage, inputs, name, out_db, build, rebuild=False):
+        """Copy the feature class a stage produces into out_db as name, building it only on a miss.
+
+        build(stage_gdb, name) must write the feature class into stage_gdb.
+        Returns the path of the copy in out_db.
+        """
+        arcgis = default_backend() == 'arcpy'
+
+        def build_layer(tmp_dir):
+            build(create_workspace(tmp_dir, os.path.splitext(STAGE_GDB)[0]), name)
+            if arcgis:
+                #: Release the geodatabase so the entry folder can be renamed
+                arcpy.management.ClearWorkspaceCache()
+
+        entry_dir, _ = self.run(stage, list(inputs) + [name], build_layer, rebuild)
+        out_fc = os.path.join(out_db, name)
+        if not arcgis:
+            return copy_layer(os.path.join(entry_dir, STAGE_GDB, name), out_fc)
+        if arcpy.Exists(out_fc):
+            arcpy.management.Delete(out_fc)
+        arcpy.management.Copy(os.path.join(entry_dir, STAGE_GDB, name), out_fc)
+        return out_fc
+
+    def entries(self):
+        """List of (entry_dir, meta) for every complete entry."""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for stage in os.listdir(self.root):
+            stage_dir = os.path.join(self.root, stage)
+            for key in os.listdir(stage_dir):
+                meta_path = os.path.join(stage_dir, key, 'meta.json')
+                if key.endswith('.tmp') or not os.path.exists(meta_path):
+                    continue
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                meta['used'] = os.path.getmtime(meta_path)
+                found.append((os.path.join(stage_dir, key), meta))
+        return found
+
+    def invalidate(self, stage=None, inputs=None):
+        """Remove the entry for stage/inputs, every entry of a stage, or (no arguments) the whole cache."""
+        if stage is None:
+            shutil.rmtree(self.root, ignore_errors=True)
+        elif inputs is None:
+            shutil.rmtree(os.path.join(self.root, stage), ignore_errors=True)
+        else:
+            shutil.rmtree(self.entry_dir(stage, inputs), ignore_errors=True)
+
+    def evict(self, max_bytes=None, keep=None):
+        """Remove least recently used entries until the cache is under max_bytes, returns the removed folders."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries(), key=lambda entry: entry[1]['used'])
+        total = sum(meta['size'] for _, meta in entries)
+        removed = []
+        for entry_dir, meta in entries:
+            if total <= max_bytes:
+                break
+            if entry_dir == keep:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= meta['size']
+            removed.append(entry_dir)
+        if removed:
+            print(f'    stage cache: evicted {len(removed)} entries')
+        return removed
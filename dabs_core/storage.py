@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+Layer-level storage operations with an arcpy and an arcpy-free GDAL backend
+- 'arcpy' runs the geoprocessing tools the scripts always used (Windows, SDE,
+  feature services); 'gdal' reads and writes FileGDB, GeoPackage and
+  FlatGeobuf through pyogrio's Arrow API and does the geometry work with
+  shapely/pyproj, so the pipelines run on Linux batch nodes without ArcGIS
+- The gdal backend reads the pipeline sources too: ArcGIS feature service
+  layers through GDAL's ESRIJSON driver (paged queries), and SGID layers from
+  a local snapshot (a FileGDB or GeoPackage named by the DABS_SGID environment
+  variable, e.g. the SGID download), since GDAL can't open SDE connections
+- The backend is arcpy when it's installed, otherwise gdal; the DABS_BACKEND
+  environment variable ('arcpy' or 'gdal') overrides it
+- Covers what the MAT export, license calculations, zone assignment and flag
+  build need: exists/delete/count, copy, append (NO_TEST field matching),
+  add/rename/delete fields, feature to point, buffer, spatial join and
+  writing points from a dataframe; row-level reads and column updates are in
+  dabs_core.table_io
+- Operations that write a layer replace it when it exists, in both backends
+- The gdal backend changes schemas in place through GDAL's own bindings
+  (osgeo, GDAL 3.6+ for FileGDB); without them it rewrites the layer, which
+  renumbers FileGDB OIDs, so only workspaces and layers created by this run
+  are rewritten (table_io.mark_scratch) and anything else raises
+"""
+
+import os
+import re
+import importlib.util
+import numpy as np
+
+from .lazy import lazy_import
+from .table_io import (_gdal_writes_filegdb, _geometry_column, _ogr_open, _project, check_rewrite,
+                       mark_scratch, ogr_driver, split_workspace, write_options)
+
+arcpy = lazy_import('arcpy')
+pyogrio = lazy_import('pyogrio')
+shapely = lazy_import('shapely')
+
+BACKENDS = ('arcpy', 'gdal')
+
+#: Local snapshot of the SGID layers for the gdal backend, layers named like the last part of the SDE name
+SGID_SNAPSHOT = os.environ.get('DABS_SGID')
+
+#: ArcGIS feature service (or map service) layer URL
+SERVICE_LAYER = re.compile(r'^https?://.+/(FeatureServer|MapServer)/\d+/?$', re.IGNORECASE)
+
+#: Meters per linear unit for buffer and join distances (arcpy unit names)
+UNITS = {'Meters': 1.0, 'Kilometers': 1000.0, 'Feet': 0.3048, 'Miles': 1609.344}
+
+#: Arrow types for the arcpy field types add_field accepts
+FIELD_TYPES = {'TEXT': 'string', 'SHORT': 'int16', 'LONG': 'int32', 'FLOAT': 'float32', 'DOUBLE': 'float64',
+               'DATE': 'timestamp[ms]'}
+
+#: OGR field type and subtype for the same arcpy field types
+OGR_FIELD_TYPES = {'TEXT': ('OFTString', 'OFSTNone'), 'SHORT': ('OFTInteger', 'OFSTInt16'),
+                   'LONG': ('OFTInteger', 'OFSTNone'), 'FLOAT': ('OFTReal', 'OFSTFloat32'),
+                   'DOUBLE': ('OFTReal', 'OFSTNone'), 'DATE': ('OFTDateTime', 'OFSTNone')}
+
+
+def default_backend():
+    """'arcpy' when arcpy is installed, otherwise 'gdal'; the DABS_BACKEND environment variable overrides it."""
+    backend = os.environ.get('DABS_BACKEND')
+    if backend:
+        if backend not in BACKENDS:
+            raise ValueError(f'DABS_BACKEND must be one of {BACKENDS}, not {backend!r}')
+        return backend
+    return 'arcpy' if importlib.util.find_spec('arcpy') is not None else 'gdal'
+
+
+def _gdal(backend):
+    return (backend or default_backend()) == 'gdal'
+
+
+def _arcpy_replace(out_path):
+    #: Outputs replace existing layers in both backends (GDAL writes always do)
+    if arcpy.Exists(out_path):
+        arcpy.management.Delete(out_path)
+
+
+def gdal_source(path):
+    """Path the gdal backend reads a layer from.
+
+    Local FileGDB, GeoPackage and FlatGeobuf paths are returned as they are. Feature service
+    layers (https://.../FeatureServer/0) become an ESRIJSON query that GDAL pages through.
+    SDE layers (...\\SGID.sde\\SGID.LOCATION.AddressPoints) are read from the layer with the
+    same short name (AddressPoints) in the DABS_SGID snapshot.
+    """
+    if SERVICE_LAYER.match(path):
+        return f"ESRIJSON:{path.rstrip('/')}/query?where=1%3D1&outFields=*&f=json"
+    parts = re.split(r'[\\/]', path)
+    if not any(part.lower().endswith('.sde') for part in parts[:-1]):
+        return path
+    name = parts[-1].rsplit('.', 1)[-1]
+    if not SGID_SNAPSHOT:
+        raise ValueError(f'{path} is an SDE layer, the gdal backend reads SDE layers from a local snapshot: '
+                         f'set DABS_SGID to a FileGDB or GeoPackage holding {name}')
+    return os.path.join(SGID_SNAPSHOT, name)
+
+
+def _split(path):
+    path = gdal_source(path)
+    if path.startswith('ESRIJSON:'):
+        return path, None
+    workspace, layer = split_workspace(path)
+    if workspace is None:
+        raise ValueError(f'{path} is not a FileGDB, GeoPackage or FlatGeobuf layer, it needs the arcpy backend')
+    return workspace, layer
+
+
+def _read(path, where=None, columns=None):
+    #: (meta, Arrow table) of a layer's attributes and WKB geometry, without FIDs
+    workspace, layer = _split(path)
+    return pyogrio.read_arrow(workspace, layer=layer, columns=columns, where=where or None)
+
+
+def _write(table, path, meta, append=False, geometry_type=None):
+    workspace, layer = _split(path)
+    if not append and os.path.exists(workspace) and ogr_driver(workspace) == 'FlatGeobuf':
+        os.remove(workspace)
+    os.makedirs(os.path.dirname(os.path.abspath(workspace)), exist_ok=True)
+    pyogrio.write_arrow(table, workspace, layer=layer, driver=ogr_driver(workspace),
+                        geometry_name=_geometry_column(meta, table), geometry_type=geometry_type or meta['geometry_type'],
+                        crs=meta['crs'], append=append, layer_options=write_options(workspace))
+    if not append:
+        mark_scratch(workspace, layer)
+
+
+def _geometries(meta, table):
+    return shapely.from_wkb(table.column(_geometry_column(meta, table)).to_numpy(zero_copy_only=False))
+
+
+def _with_geometries(meta, table, geometries):
+    import pyarrow as pa
+    name = _geometry_column(meta, table)
+    return table.set_column(table.column_names.index(name), name, pa.array(shapely.to_wkb(geometries), pa.binary()))
+
+
+def _read_with_fids(path, fid_name):
+    #: Layer with its FIDs as an int32 fid_name column (ORIG_FID, ...), replacing any column of that name
+    import pyarrow as pa
+    workspace, layer = _split(path)
+    meta, table = pyogrio.read_arrow(workspace, layer=layer, return_fids=True)
+    fid = meta['fid_column'] or 'OGC_FID'
+    fids = table.column(fid).cast(pa.int32())
+    table = table.drop_columns([name for name in (fid, fid_name) if name in table.column_names])
+    return meta, table.add_column(0, fid_name, fids)
+
+
+def _meters_per_unit(crs):
+    from pyproj import CRS
+    crs = CRS.from_user_input(crs)
+    if crs.is_geographic:
+        raise ValueError('Distances need a projected layer, project it (e.g. to EPSG:26912) first')
+    return crs.axis_info[0].unit_conversion_factor
+
+
+def layer_exists(path, backend=None):
+    """True when the layer exists."""
+    if not _gdal(backend):
+        return arcpy.Exists(path)
+    workspace, layer = _split(path)
+    if workspace.startswith('ESRIJSON:'):
+        return True
+    if not os.path.exists(workspace):
+        return False
+    return layer is None or layer in [name for name, _ in pyogrio.list_layers(workspace)]
+
+
+def delete_layer(path, backend=None):
+    """Delete a layer (a FlatGeobuf file, or a layer of a FileGDB/GeoPackage)."""
+    if not _gdal(backend):
+        arcpy.management.Delete(path)
+        return
+    workspace, layer = _split(path)
+    if layer is None:
+        os.remove(workspace)
+        return
+    #: pyogrio can't drop layers, GDAL's own bindings can (copies and writes replace layers without them)
+    try:
+        from osgeo import gdal
+    except ImportError:
+        raise ImportError(f"Deleting {layer} from {workspace} needs GDAL's Python bindings (osgeo)") from None
+    gdal.UseExceptions()
+    ds = gdal.OpenEx(workspace, gdal.OF_VECTOR | gdal.OF_UPDATE)
+    ds.DeleteLayer(layer)
+    ds = None
+
+
+def create_workspace(work_dir, name, backend=None):
+    """Create (if needed) the file geodatabase work_dir/name.gdb and return its path.
+
+    With gdal only the folder is created, GDAL creates the geodatabase with its first layer.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    gdb = os.path.join(work_dir, name + '.gdb')
+    if not _gdal(backend):
+        if not arcpy.Exists(gdb):
+            arcpy.CreateFileGDB_management(work_dir, name)
+        return gdb
+    mark_scratch(gdb)
+    return gdb
+
+
+def count_rows(path, backend=None):
+    """Number of rows in a layer."""
+    if not _gdal(backend):
+        return int(arcpy.management.GetCount(path)[0])
+    workspace, layer = _split(path)
+    return int(pyogrio.read_info(workspace, layer=layer, force_feature_count=True)['features'])
+
+
+def copy_layer(source, out_path, where=None, backend=None):
+    """Copy a layer (optionally only the rows matching where) to out_path. Returns out_path."""
+    if not _gdal(backend):
+        out_db, name = os.path.dirname(out_path), os.path.basename(out_path)
+        _arcpy_replace(out_path)
+        arcpy.conversion.FeatureClassToFeatureClass(source, out_db, name, where)
+        return out_path
+    meta, table = _read(source, where)
+    _write(table, out_path, meta)
+    return out_path
+
+
+def append_layer(source, target, backend=None):
+    """Append the rows of source to target, matching fields by name like Append NO_TEST (others stay null)."""
+    if not _gdal(backend):
+        arcpy.management.Append(source, target, "NO_TEST")
+        return
+    import pyarrow as pa
+    target_meta, target_table = _read(target, columns=[])
+    target_schema = pyogrio.read_arrow(*_split(target), max_features=0)[1].schema
+    meta, table = _read(source)
+    by_name = {name.lower(): name for name in table.column_names}
+    geometry = _geometries(meta, table)
+    if meta['crs'] and target_meta['crs']:
+        geometry = _project(geometry, meta['crs'], _crs_epsg(target_meta['crs']))
+
+    columns = {}
+    for field in target_schema:
+        if field.name == _geometry_column(target_meta, target_table):
+            columns[field.name] = pa.array(shapely.to_wkb(geometry), pa.binary())
+        elif field.name.lower() in by_name:
+            columns[field.name] = table.column(by_name[field.name.lower()]).cast(field.type, safe=False)
+        else:
+            columns[field.name] = pa.nulls(len(table), field.type)
+    _write(pa.table(columns), target, target_meta, append=True)
+
+
+def _crs_epsg(crs):
+    from pyproj import CRS
+    code = CRS.from_user_input(crs).to_epsg()
+    if code is None:
+        raise ValueError(f'No EPSG code for {crs}')
+    return code
+
+
+def _rewrite(path, change):
+    #: Read a whole layer, change its Arrow table and write it back, only for scratch outputs
+    check_rewrite(*_split(path))
+    meta, table = _read(path)
+    _write(change(table), path, meta)
+
+
+def _ogr_layer(path):
+    #: (dataset, layer) opened for update through GDAL's own bindings, None without them (or for FlatGeobuf)
+    workspace, layer = _split(path)
+    if layer is None or not _gdal_writes_filegdb():
+        return None
+    return _ogr_open(workspace, layer, update=True)
+
+
+def _ogr_fields(lyr):
+    defn = lyr.GetLayerDefn()
+    return [defn.GetFieldDefn(i).GetName() for i in range(defn.GetFieldCount())]
+
+
+def add_field(path, names, field_type='TEXT', length=None, backend=None):
+    """Add one or more empty fields of an arcpy field type ('TEXT', 'LONG', 'DOUBLE', ...), existing fields are skipped."""
+    names = [names] if isinstance(names, str) else list(names)
+    if not _gdal(backend):
+        for name in names:
+            arcpy.management.AddField(path, name, field_type, "", "", length)
+        return
+    opened = _ogr_layer(path)
+    if opened is not None:
+        from osgeo import ogr
+        ds, lyr = opened
+        existing = {name.lower() for name in _ogr_fields(lyr)}
+        kind, subtype = OGR_FIELD_TYPES[field_type]
+        for name in names:
+            if name.lower() not in existing:
+                defn = ogr.FieldDefn(name, getattr(ogr, kind))
+                defn.SetSubType(getattr(ogr, subtype))
+                if length:
+                    defn.SetWidth(length)
+                lyr.CreateField(defn)
+        ds = None
+        return
+    import pyarrow as pa
+
+    def add(table):
+        existing = {name.lower() for name in table.column_names}
+        for name in names:
+            if name.lower() not in existing:
+                table = table.add_column(table.num_columns - 1, name, pa.nulls(len(table), pa.type_for_alias(FIELD_TYPES[field_type])))
+        return table
+    _rewrite(path, add)
+
+
+def rename_field(path, old, new, backend=None):
+    """Rename a field."""
+    if not _gdal(backend):
+        arcpy.management.AlterField(path, old, new)
+        return
+    opened = _ogr_layer(path)
+    if opened is not None:
+        from osgeo import ogr
+        ds, lyr = opened
+        index = lyr.GetLayerDefn().GetFieldIndex(old)
+        if index < 0:
+            raise ValueError(f'Field {old} not found in {path}')
+        defn = ogr.FieldDefn(new, lyr.GetLayerDefn().GetFieldDefn(index).GetType())
+        lyr.AlterFieldDefn(index, defn, ogr.ALTER_NAME_FLAG)
+        ds = None
+        return
+    _rewrite(path, lambda table: table.rename_columns([new if name == old else name for name in table.column_names]))
+
+
+def delete_fields(path, names, backend=None):
+    """Delete fields, names that aren't in the layer are ignored."""
+    if not _gdal(backend):
+        arcpy.management.DeleteField(path, names)
+        return
+    opened = _ogr_layer(path)
+    if opened is not None:
+        ds, lyr = opened
+        for name in names:
+            index = lyr.GetLayerDefn().GetFieldIndex(name)
+            if index >= 0:
+                lyr.DeleteField(index)
+        ds = None
+        return
+    _rewrite(path, lambda table: table.drop_columns([name for name in names if name in table.column_names]))
+
+
+def feature_to_point(source, out_path, inside=True, backend=None):
+    """Points of source features with their attributes and ORIG_FID, inside the feature (or at its centroid)."""
+    if not _gdal(backend):
+        _arcpy_replace(out_path)
+        arcpy.management.FeatureToPoint(source, out_path, "INSIDE" if inside else "CENTROID")
+        return out_path
+    meta, table = _read_with_fids(source, 'ORIG_FID')
+    geometries = _geometries(meta, table)
+    points = shapely.point_on_surface(geometries) if inside else shapely.centroid(geometries)
+    table = _with_geometries(meta, table, points)
+    _write(table, out_path, meta, geometry_type='Point')
+    return out_path
+
+
+def buffer_layer(source, out_path, distance, unit='Meters', backend=None):
+    """Buffer every feature by distance (in unit) with round ends, keeping attributes; adds BUFF_DIST and ORIG_FID."""
+    if not _gdal(backend):
+        _arcpy_replace(out_path)
+        arcpy.analysis.Buffer(source, out_path, f"{distance} {unit}", "FULL", "ROUND", "NONE")
+        return out_path
+    import pyarrow as pa
+    meta, table = _read_with_fids(source, 'ORIG_FID')
+    layer_distance = distance * UNITS[unit] / _meters_per_unit(meta['crs'])
+    table = _with_geometries(meta, table, shapely.buffer(_geometries(meta, table), layer_distance))
+    table = table.add_column(table.num_columns - 1, 'BUFF_DIST', pa.array(np.full(len(table), float(distance))))
+    _write(table, out_path, meta, geometry_type='Polygon')
+    return out_path
+
+
+def spatial_join(target, join, out_path, fields, distance=0, unit='Meters', backend=None):
+    """One row per target feature and join feature within distance of it (JOIN_ONE_TO_MANY, KEEP_COMMON, INTERSECT).
+
+    Output has the target geometry and only the given fields; a field in both layers takes the
+    target's value unless it's null (the First merge rule of arcpy's field mappings).
+    """
+    fields = list(fields)
+    if not _gdal(backend):
+        fms = arcpy.FieldMappings()
+        #: Add all fields from inputs, then remove all unwanted output fields
+        fms.addTable(target)
+        fms.addTable(join)
+        for field in fms.fields:
+            if field.name not in fields:
+                fms.removeFieldMap(fms.findFieldMapIndex(field.name))
+        _arcpy_replace(out_path)
+        arcpy.analysis.SpatialJoin(target, join, out_path, 'JOIN_ONE_TO_MANY', 'KEEP_COMMON', fms, 'INTERSECT',
+                                   f'{distance} {unit}')
+        return out_path
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    target_meta, target_table = _read_with_fids(target, 'TARGET_FID')
+    join_meta, join_table = _read_with_fids(join, 'JOIN_FID')
+    target_geoms = _geometries(target_meta, target_table)
+    join_geoms = _geometries(join_meta, join_table)
+    if join_meta['crs'] and target_meta['crs']:
+        join_geoms = _project(join_geoms, join_meta['crs'], _crs_epsg(target_meta['crs']))
+
+    tree = shapely.STRtree(join_geoms)
+    if distance:
+        layer_distance = distance * UNITS[unit] / _meters_per_unit(target_meta['crs'])
+        target_idx, join_idx = tree.query(target_geoms, predicate='dwithin', distance=layer_distance)
+    else:
+        target_idx, join_idx = tree.query(target_geoms, predicate='intersects')
+    order = np.lexsort((join_idx, target_idx))
+    target_idx, join_idx = target_idx[order], join_idx[order]
+
+    columns = {'TARGET_FID': target_table.column('TARGET_FID').take(pa.array(target_idx)),
+               'JOIN_FID': join_table.column('JOIN_FID').take(pa.array(join_idx))}
+    for field in fields:
+        values = None
+        if field in join_table.column_names:
+            values = join_table.column(field).take(pa.array(join_idx))
+        if field in target_table.column_names:
+            target_values = target_table.column(field).take(pa.array(target_idx))
+            values = target_values if values is None else pc.coalesce(target_values, values.cast(target_values.type))
+        if values is not None:
+            columns[field] = values
+    columns[_geometry_column(target_meta, target_table)] = pa.array(shapely.to_wkb(target_geoms[target_idx]), pa.binary())
+    _write(pa.table(columns), out_path, target_meta)
+    return out_path
+
+
+def write_points(frame, x_column, y_column, out_path, sr=4326, backend=None):
+    """Write a dataframe with X/Y columns as a point layer in spatial reference sr (an EPSG code)."""
+    if not _gdal(backend):
+        _arcpy_replace(out_path)
+        from arcgis.features import GeoAccessor, GeoSeriesAccessor
+        import pandas as pd
+        sedf = pd.DataFrame.spatial.from_xy(df=frame, x_column=x_column, y_column=y_column, sr=sr)
+        sedf.spatial.to_featureclass(location=out_path)
+        return out_path
+    import pyarrow as pa
+    points = shapely.points(frame[x_column].to_numpy(dtype='float64'), frame[y_column].to_numpy(dtype='float64'))
+    attributes = frame.drop(columns=[c for c in frame.columns if frame[c].map(lambda v: hasattr(v, 'geom_type')).any()])
+    table = pa.Table.from_pandas(attributes.astype(object).where(attributes.notna(), None), preserve_index=False)
+    table = table.append_column('SHAPE', pa.array(shapely.to_wkb(points), pa.binary()))
+    meta = {'geometry_name': 'SHAPE', 'geometry_type': 'Point', 'crs': f'EPSG:{sr}'}
+    _write(table, out_path, meta)
+    return out_path
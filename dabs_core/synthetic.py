@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Reproducible synthetic Utah-scale datasets for benchmarking, no arcpy or SGID needed
+- Address points are clustered around random town centers inside a Utah-sized
+  extent in NAD83 / UTM 12N, with SGID AddressPoints style fields
+- Parcels are small boxes around the points, flag areas are 200 ft buffers,
+  compliance zones are Voronoi cells covering the extent
+- Licenses reuse MAT addresses plus a share of addresses that aren't in the MAT
+- The same seed and scale always produce the same data
+"""
+
+import numpy as np
+
+from .lazy import lazy_import
+
+shapely = lazy_import('shapely')
+pd = lazy_import('pandas')
+
+#: Row counts at scale 1.0, roughly statewide SGID/DABS sizes
+SIZES = {
+    'points': 1_100_000,
+    'parcels': 1_000_000,
+    'flags': 30_000,
+    'zones': 10_000,
+    'licenses': 10_000,
+}
+
+#: Utah-sized extent in NAD83 / UTM Zone 12N (xmin, ymin, xmax, ymax)
+EXTENT = (228_000.0, 4_094_000.0, 674_000.0, 4_653_000.0)
+
+SEED = 2026
+
+DIRECTIONS = np.array(['N', 'S', 'E', 'W'], dtype=object)
+STREET_TYPES = np.array(['', 'ST', 'AVE', 'DR', 'LN', 'CIR', 'WAY', 'RD', 'CT', 'BLVD'], dtype=object)
+STREET_NAMES = np.array(['MAIN', 'STATE', 'CENTER', 'CANYON', 'MAPLE', 'OAK', 'CEDAR', 'WILLOW', 'PIONEER', "O'BRIEN",
+                         'SUNSET', 'HIGHLAND', 'REDWOOD', 'BANGERTER', 'FORT UNION', 'VINE', 'HOLLADAY', 'WASATCH'], dtype=object)
+UNIT_TYPES = np.array(['APT', 'UNIT', 'STE', 'BLDG', 'TRLR', '#'], dtype=object)
+
+
+def sizes(scale=1.0):
+    """Row counts for each dataset at a scale (1.0 is statewide)."""
+    return {name: max(int(round(count * scale)), 1) for name, count in SIZES.items()}
+
+
+def _towns(rng, count):
+    #: Town centers, populations follow a long tail like Utah's address systems
+    x = rng.uniform(EXTENT[0] + 10_000, EXTENT[2] - 10_000, count)
+    y = rng.uniform(EXTENT[1] + 10_000, EXTENT[3] - 10_000, count)
+    weight = rng.pareto(1.2, count) + 0.05
+    names = np.array([f'TOWN{i:03d}' for i in range(count)], dtype=object)
+    return x, y, weight / weight.sum(), names
+
+
+def address_points(count, seed=SEED):
+    """Address point dataframe with SGID style fields plus x/y (UTM 12N) and longitude/latitude."""
+    rng = np.random.default_rng(seed)
+    tx, ty, weight, towns = _towns(rng, 250)
+    town = rng.choice(len(tx), count, p=weight)
+    spread = 1_500 + 6_000 * np.sqrt(weight[town] * len(tx))
+    x = np.clip(tx[town] + rng.normal(0, 1, count) * spread, EXTENT[0], EXTENT[2]).round(3)
+    y = np.clip(ty[town] + rng.normal(0, 1, count) * spread, EXTENT[1], EXTENT[3]).round(3)
+
+    add_num = rng.integers(1, 15_000, count)
+    prefix = DIRECTIONS[rng.integers(0, 4, count)]
+    street = np.where(rng.random(count) < 0.5, rng.integers(1, 140, count).astype(str).astype(object) + '00',
+                      STREET_NAMES[rng.integers(0, len(STREET_NAMES), count)])
+    street_type = STREET_TYPES[rng.integers(0, len(STREET_TYPES), count)]
+    suffix = np.where(street_type == '', DIRECTIONS[rng.integers(0, 4, count)], '')
+
+    has_unit = rng.random(count) < 0.18
+    unit_type = np.where(has_unit, UNIT_TYPES[rng.integers(0, len(UNIT_TYPES), count)], None)
+    unit_id = np.where(has_unit, rng.integers(1, 400, count).astype(str).astype(object), None)
+    #: Blank-looking unit values seen in SGID
+    blank = rng.random(count) < 0.02
+    unit_type = np.where(blank & ~has_unit, ' ', unit_type)
+    unit_id = np.where(blank & ~has_unit, 'None', unit_id)
+
+    full_add = [' '.join(part for part in (str(n), p, s, t, sd) if part) +
+                (f' {ut} {ui}' if ut not in (None, ' ') else '')
+                for n, p, s, t, sd, ut, ui in zip(add_num, prefix, street, street_type, suffix, unit_type, unit_id)]
+
+    add_system = towns[town].copy()
+    #: Some address systems carry a parenthesized qualifier, e.g. 'SALT LAKE CITY (SLCO)'
+    paren = rng.random(count) < 0.1
+    add_system[paren] = add_system[paren] + ' (CO)'
+
+    #: About 1% of points share a UTAddPtID with another point
+    addptid = np.array([f'{t}|{f}' for t, f in zip(towns[town], full_add)], dtype=object)
+    dup = rng.random(count) < 0.01
+    addptid[dup] = addptid[rng.integers(0, count, int(dup.sum()))]
+
+    from pyproj import Transformer
+    lon, lat = Transformer.from_crs(26912, 4326, always_xy=True).transform(x, y)
+
+    return pd.DataFrame({
+        'OBJECTID': np.arange(1, count + 1, dtype=np.int64),
+        'x': x, 'y': y,
+        'FullAdd': np.array(full_add, dtype=object),
+        'AddNum': add_num.astype(str).astype(object),
+        'PrefixDir': prefix, 'StreetName': street, 'SuffixDir': suffix, 'StreetType': street_type,
+        'UnitType': unit_type, 'UnitID': unit_id,
+        'AddSystem': add_system,
+        'ZipCode': (84000 + town % 800).astype(str).astype(object),
+        'State': 'UT',
+        'ParcelID': np.char.add('P', rng.integers(0, 10**9, count).astype(str)).astype(object),
+        'UTAddPtID': addptid,
+        'Flag': np.full(count, '', dtype=object),
+        'Comp_Group': np.full(count, '', dtype=object),
+        'longitude': np.asarray(lon), 'latitude': np.asarray(lat),
+    })
+
+
+def parcels(points, count, seed=SEED):
+    """Parcel boxes (20-60 m a side) centered near a sample of the address points."""
+    rng = np.random.default_rng(seed + 1)
+    pick = rng.integers(0, len(points), count)
+    half = rng.uniform(10, 30, count)
+    cx = points['x'].to_numpy()[pick] + rng.normal(0, 5, count)
+    cy = points['y'].to_numpy()[pick] + rng.normal(0, 5, count)
+    geometries = shapely.box(cx - half, cy - half, cx + half, cy + half)
+    return np.arange(1, count + 1, dtype=np.int64), geometries, {
+        'PARCEL_ID': np.array([f'P{i}' for i in range(count)], dtype=object)}
+
+
+def flag_areas(points, count, seed=SEED):
+    """200 ft buffers around parcels at a sample of the address points, like DABS_Flag_Areas."""
+    rng = np.random.default_rng(seed + 2)
+    pick = rng.integers(0, len(points), count)
+    half = rng.uniform(15, 60, count)
+    cx, cy = points['x'].to_numpy()[pick], points['y'].to_numpy()[pick]
+    geometries = shapely.buffer(shapely.box(cx - half, cy - half, cx + half, cy + half), 60.96, quad_segs=4)
+    categories = np.array(['church', 'park', 'school', 'library', 'playground'], dtype=object)
+    return np.arange(1, count + 1, dtype=np.int64), geometries, {
+        'category': categories[rng.integers(0, len(categories), count)]}
+
+
+def compliance_zones(count, seed=SEED):
+    """Voronoi cells covering the extent, like DABS_Compliance_Zones."""
+    rng = np.random.default_rng(seed + 3)
+    seeds = shapely.multipoints(np.column_stack([rng.uniform(EXTENT[0], EXTENT[2], count),
+                                                 rng.uniform(EXTENT[1], EXTENT[3], count)]))
+    cells = shapely.get_parts(shapely.voronoi_polygons(seeds, extend_to=shapely.box(*EXTENT)))
+    geometries = shapely.clip_by_rect(cells, *EXTENT)
+    n = len(geometries)
+    return np.arange(1, n + 1, dtype=np.int64), geometries, {
+        'Group_Name': np.array([f'Group {i % 60 + 1}' for i in range(n)], dtype=object)}
+
+
+def licenses(points, count, seed=SEED, missing=0.05):
+    """License dataframe (Lic_Number, Address, City); a share of addresses aren't in the points."""
+    rng = np.random.default_rng(seed + 4)
+    pick = rng.integers(0, len(points), count)
+    address = points['FullAdd'].to_numpy()[pick].copy()
+    city = points['AddSystem'].to_numpy()[pick].copy()
+    off = rng.random(count) < missing
+    address[off] = [f'{a} X' for a in address[off]]
+    types = np.array(['BC', 'RE', 'TB', 'FL', 'OL', 'BR', 'MB'], dtype=object)
+    numbers = [f'{t}{n:05d}' for t, n in zip(types[rng.integers(0, len(types), count)], range(count))]
+    return pd.DataFrame({'Lic_Number': np.array(numbers, dtype=object), 'Address': address, 'City': city})
+
+
+def generate(scale=1.0, seed=SEED):
+    """All synthetic datasets at a scale, as a dictionary.
+
+    points and licenses are dataframes, parcels/flags/zones are (oids, geometries, attributes).
+    """
+    counts = sizes(scale)
+    points = address_points(counts['points'], seed)
+    return {
+        'points': points,
+        'parcels': parcels(points, counts['parcels'], seed),
+        'flags': flag_areas(points, counts['flags'], seed),
+        'zones': compliance_zones(counts['zones'], seed),
+        'licenses': licenses(points, counts['licenses'], seed),
+    }
@@ -0,0 +1,863 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk columnar read/write helpers for DABS tables and feature classes
+- write_columns takes an OID array and one or more value arrays and applies
+  them in one pass, instead of per-row updateRow calls in each script
+- Reports how many OIDs were written and how many didn't match a row
+- Backends:
+    'gpkg'    - GeoPackage through sqlite3, one executemany in one transaction (no arcpy/GDAL)
+    'ogr'     - FileGDB through GDAL's OpenFileGDB driver in one transaction (GDAL 3.6+, no arcpy)
+    'pyogrio' - FileGDB and FlatGeobuf through pyogrio's Arrow reads; writes rewrite
+                the layer (FileGDB OIDs are renumbered, FlatGeobuf FIDs kept), so
+                they're refused for layers this run didn't create (see mark_scratch)
+    'arcpy'   - single UpdateCursor pass, used for layers, SDE and feature services
+- The backend is picked from the table path unless one is given; FileGDB stays
+  on arcpy when that's the default backend (dabs_core.storage.default_backend),
+  otherwise it goes to 'ogr' (GDAL 3.6+ bindings) or 'pyogrio'
+- read_xy returns point X/Y as contiguous float64 arrays, parsed straight from
+  the geometry buffers (no geometry objects) for the GeoPackage and GDAL
+  backends; only non-point shapes are built to take their centroid
+- read_table/read_column return typed columns in one bulk read: int64, float64
+  (NaN for nulls), datetime64 or object arrays of str/None, or a pyarrow Table;
+  arcpy (Pro 3.2+) and GDAL (3.6+) hand over Arrow tables directly, the other
+  readers fetch all rows in one call and build the columns from them
+- read_shapes returns OIDs, shapely geometries (optionally projected) and
+  attribute columns, for the polygon layers of dabs_core.poly_assign
+- iter_batches streams columns and X/Y in fixed-size Arrow batches through GDAL,
+  for the streaming MAT export
+"""
+
+import os
+import sqlite3
+import struct
+import datetime
+from collections import namedtuple
+import numpy as np
+
+from .lazy import lazy_import
+
+arcpy = lazy_import('arcpy')
+shapely = lazy_import('shapely')
+pyogrio = lazy_import('pyogrio')
+
+#: GeoPackage header envelope size in bytes by envelope indicator
+_GPKG_ENVELOPE_SIZES = np.array([0, 32, 48, 48, 64, 0, 0, 0], dtype=np.int64)
+
+#: Result of a bulk write
+#:     written   - rows updated
+#:     unmatched - OIDs in the input that didn't match a row in the table
+WriteResult = namedtuple('WriteResult', ['written', 'unmatched'])
+
+#: Workspaces and layers this run created (normalized paths), the only ones pyogrio may rewrite whole
+_SCRATCH = set()
+
+#: Field token for the OID column in read_table, whatever the table calls it
+OID_TOKEN = 'OID@'
+
+#: GDAL drivers for the local formats, by file extension
+OGR_DRIVERS = {'.gdb': 'OpenFileGDB', '.gpkg': 'GPKG', '.fgb': 'FlatGeobuf'}
+
+
+def split_workspace(path):
+    """Split a local table path into (workspace, layer name), or (None, path) if not local.
+
+    Handles arcpy style paths such as C:\\data\\DABS.gdb\\DABS_All_Licenses and
+    C:\\data\\DABS.gpkg\\main.DABS_All_Licenses; a .fgb file is its own workspace (layer None).
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    if parts[-1].lower().endswith('.fgb'):
+        #: A FlatGeobuf file is a single layer
+        return path, None
+    for i, part in enumerate(parts[:-1]):
+        if part.lower().endswith(('.gdb', '.gpkg')):
+            name = parts[-1]
+            if part.lower().endswith('.gpkg') and name.lower().startswith('main.'):
+                name = name[5:]
+            return os.sep.join(parts[:i + 1]), name
+    return None, path
+
+
+def _gdal_writes_filegdb():
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return False
+    return int(gdal.VersionInfo()) >= 3060000
+
+
+def _have_pyogrio():
+    try:
+        import pyogrio
+    except ImportError:
+        return False
+    return True
+
+
+def pick_backend(table, backend=None):
+    """Return the backend name to use for a table: 'gpkg', 'ogr', 'pyogrio' or 'arcpy'."""
+    if backend is not None:
+        return backend
+    if not isinstance(table, str):
+        #: Layers and geoprocessing results (e.g. from SelectLayerByLocation)
+        return 'arcpy'
+    workspace, _ = split_workspace(table)
+    if workspace is None:
+        return 'arcpy'
+    if workspace.lower().endswith('.gpkg'):
+        return 'gpkg'
+    if workspace.lower().endswith('.fgb'):
+        return 'pyogrio'
+    if workspace.lower().endswith('.gdb'):
+        #: Production FileGDB writes stay on arcpy wherever it's installed
+        from .storage import default_backend
+        if default_backend() == 'gdal' and _gdal_writes_filegdb():
+            return 'ogr'
+        if default_backend() == 'gdal' and _have_pyogrio():
+            return 'pyogrio'
+    return 'arcpy'
+
+
+#######################
+#  GeoPackage backend #
+#######################
+
+def _gpkg_envelope(blob):
+    #: Return (minx, maxx, miny, maxy) from a GeoPackage geometry blob, None if empty
+    #: Uses the header envelope when present, otherwise reads point coordinates from the WKB
+    if blob is None or len(blob) < 8:
+        return None
+    flags = blob[3]
+    if (flags >> 4) & 1:
+        return None
+    order = '<' if flags & 1 else '>'
+    env_size = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(flags >> 1) & 7]
+    if env_size:
+        return struct.unpack(order + 'dddd', blob[8:40])
+    wkb = blob[8:]
+    wkb_order = '<' if wkb[0] == 1 else '>'
+    if struct.unpack(wkb_order + 'I', wkb[1:5])[0] % 1000 != 1:
+        return None
+    x, y = struct.unpack(wkb_order + 'dd', wkb[5:21])
+    return x, x, y, y
+
+
+def _gpkg_connect(workspace):
+    #: Register the spatial SQL functions used by GeoPackage R-tree triggers
+    con = sqlite3.connect(workspace)
+    con.create_function('ST_IsEmpty', 1, lambda g: int(_gpkg_envelope(g) is None), deterministic=True)
+    for i, name in enumerate(['ST_MinX', 'ST_MaxX', 'ST_MinY', 'ST_MaxY']):
+        con.create_function(name, 1, lambda g, i=i: (_gpkg_envelope(g) or (None,) * 4)[i], deterministic=True)
+    return con
+
+
+def _gpkg_pk(con, layer):
+    for _, name, _, _, _, pk in con.execute(f'PRAGMA table_info("{layer}")'):
+        if pk:
+            return name
+    raise ValueError(f'No primary key found for GeoPackage layer {layer}')
+
+
+def _gpkg_read(workspace, layer, fields, where):
+    con = _gpkg_connect(workspace)
+    try:
+        pk = _gpkg_pk(con, layer)
+        columns = ', '.join(f'"{f}"' for f in [pk] + list(fields))
+        sql = f'SELECT {columns} FROM "{layer}"' + (f' WHERE {where}' if where else '')
+        rows = con.execute(sql).fetchall()
+    finally:
+        con.close()
+    return rows
+
+
+def wkb_point_xy(buffer, starts):
+    """X/Y of WKB points that start at the given offsets of one uint8 buffer.
+
+    Returns x, y and a mask of the rows that were points (others are NaN).
+    Reads the coordinate bytes with one gather instead of creating geometries.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    x = np.full(len(starts), np.nan)
+    y = np.full(len(starts), np.nan)
+    if len(starts) == 0:
+        return x, y, np.zeros(0, dtype=bool)
+
+    little = buffer[starts] == 1
+    type_bytes = buffer[(starts + 1)[:, None] + np.arange(4)]
+    geom_type = np.where(little, type_bytes.view('<u4')[:, 0], type_bytes.view('>u4')[:, 0])
+    #: 2D, Z, M and ZM points are ISO types 1, 1001, 2001 and 3001, X/Y always follow the type
+    is_point = (geom_type % 1000 == 1) & (geom_type < 4000)
+
+    coords = buffer[(starts[is_point] + 5)[:, None] + np.arange(16)]
+    little_pts = little[is_point]
+    xy = np.where(little_pts[:, None], coords.view('<f8'), coords.view('>f8'))
+    x[is_point], y[is_point] = xy[:, 0], xy[:, 1]
+    return x, y, is_point
+
+
+def _gpkg_point_xy(blobs):
+    #: X/Y from GeoPackage geometry blobs: skip each header (8 bytes plus envelope) then read the WKB point
+    lengths = np.fromiter((len(b) if b is not None else 0 for b in blobs), dtype=np.int64, count=len(blobs))
+    x = np.full(len(blobs), np.nan)
+    y = np.full(len(blobs), np.nan)
+    valid = lengths >= 8
+    if not valid.any():
+        return x, y, np.zeros(len(blobs), dtype=bool)
+
+    buffer = np.frombuffer(b''.join(b for b, v in zip(blobs, valid) if v), dtype=np.uint8)
+    starts = np.zeros(int(valid.sum()), dtype=np.int64)
+    starts[1:] = np.cumsum(lengths[valid])[:-1]
+    flags = buffer[starts + 3]
+    not_empty = ((flags >> 4) & 1) == 0
+    wkb_starts = starts + 8 + _GPKG_ENVELOPE_SIZES[(flags >> 1) & 7]
+
+    vx, vy, is_point = wkb_point_xy(buffer, wkb_starts)
+    is_point &= not_empty
+    vx[~is_point], vy[~is_point] = np.nan, np.nan
+    x[valid], y[valid] = vx, vy
+
+    points = np.zeros(len(blobs), dtype=bool)
+    points[valid] = is_point
+    return x, y, points
+
+
+def _gpkg_geometry_column(con, layer):
+    row = con.execute('SELECT column_name, srs_id FROM gpkg_geometry_columns WHERE table_name = ?', (layer,)).fetchone()
+    if row is None:
+        raise ValueError(f'GeoPackage layer {layer} has no geometry column')
+    return row
+
+
+def _gpkg_read_xy(workspace, layer, where):
+    con = _gpkg_connect(workspace)
+    try:
+        pk = _gpkg_pk(con, layer)
+        geom, srs_id = _gpkg_geometry_column(con, layer)
+        sql = f'SELECT "{pk}", "{geom}" FROM "{layer}"' + (f' WHERE {where}' if where else '')
+        rows = con.execute(sql).fetchall()
+    finally:
+        con.close()
+
+    oids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    blobs = [row[1] for row in rows]
+    x, y, points = _gpkg_point_xy(blobs)
+    if not points.all():
+        #: Polygons and lines use their centroid like SHAPE@X/SHAPE@Y, read through shapely
+        other = np.flatnonzero(~points & np.array([b is not None and len(b) >= 8 for b in blobs], dtype=bool))
+        for i in other:
+            env_size = _GPKG_ENVELOPE_SIZES[(blobs[i][3] >> 1) & 7]
+            centroid = shapely.centroid(shapely.from_wkb(blobs[i][8 + env_size:]))
+            if not shapely.is_empty(centroid):
+                x[i], y[i] = shapely.get_x(centroid), shapely.get_y(centroid)
+    return oids, x, y, srs_id
+
+
+def _gpkg_read_shapes(workspace, layer, fields, where):
+    con = _gpkg_connect(workspace)
+    try:
+        pk = _gpkg_pk(con, layer)
+        geom, srs_id = _gpkg_geometry_column(con, layer)
+        columns = ', '.join(f'"{f}"' for f in [pk, geom] + list(fields))
+        rows = con.execute(f'SELECT {columns} FROM "{layer}"' + (f' WHERE {where}' if where else '')).fetchall()
+    finally:
+        con.close()
+    #: Strip each GeoPackage header (8 bytes plus envelope) to get the WKB
+    wkbs = [blob[8 + _GPKG_ENVELOPE_SIZES[(blob[3] >> 1) & 7]:] if blob is not None and len(blob) >= 8 else None
+            for blob in (row[1] for row in rows)]
+    return rows, wkbs, srs_id
+
+
+def _gpkg_write(workspace, layer, oids, fields, values):
+    con = _gpkg_connect(workspace)
+    try:
+        pk = _gpkg_pk(con, layer)
+        assignments = ', '.join(f'"{f}" = ?' for f in fields)
+        with con:
+            cur = con.executemany(f'UPDATE "{layer}" SET {assignments} WHERE "{pk}" = ?',
+                                  zip(*values, oids))
+            written = cur.rowcount
+    finally:
+        con.close()
+    return written
+
+
+#####################
+#  FileGDB backend  #
+#####################
+
+def _ogr_open(workspace, layer, update=False):
+    from osgeo import gdal
+    gdal.UseExceptions()
+    ds = gdal.OpenEx(workspace, gdal.OF_VECTOR | (gdal.OF_UPDATE if update else 0))
+    lyr = ds.GetLayerByName(layer)
+    if lyr is None:
+        raise ValueError(f'Layer {layer} not found in {workspace}')
+    return ds, lyr
+
+
+def _ogr_read(workspace, layer, fields, where):
+    ds, lyr = _ogr_open(workspace, layer)
+    if where:
+        lyr.SetAttributeFilter(where)
+    rows = [(feat.GetFID(), *[feat.GetField(f) for f in fields]) for feat in lyr]
+    ds = None
+    return rows
+
+
+def _ogr_read_arrow(workspace, layer, fields, where):
+    #: Arrow table of the FID and fields through GDAL's columnar API, None when GDAL/pyarrow can't
+    ds, lyr = _ogr_open(workspace, layer)
+    if not hasattr(lyr, 'GetArrowStreamAsPyArrow') or not _have_pyarrow():
+        ds = None
+        return None
+    import pyarrow as pa
+    if where:
+        lyr.SetAttributeFilter(where)
+    defn = lyr.GetLayerDefn()
+    names = [defn.GetFieldDefn(i).GetName() for i in range(defn.GetFieldCount())]
+    #: Skip the geometry and unused fields, fields in the where clause are still read for the filter
+    lyr.SetIgnoredFields([name for name in names if name not in fields and name not in (where or '')] + ['OGR_GEOMETRY'])
+    stream = lyr.GetArrowStreamAsPyArrow(['INCLUDE_FID=YES'])
+    table = pa.Table.from_batches(list(stream), schema=stream.schema)
+    #: Read the FID column name before the dataset (and with it the layer) is released
+    fid = lyr.GetFIDColumn() or 'OGC_FID'
+    ds = None
+    return table.rename_columns([OID_TOKEN if name == fid else name for name in table.column_names])
+
+
+def _ogr_read_xy(workspace, layer, where):
+    ds, lyr = _ogr_open(workspace, layer)
+    if where:
+        lyr.SetAttributeFilter(where)
+    if hasattr(lyr, 'GetArrowStreamAsPyArrow') and _have_pyarrow():
+        import pyarrow as pa
+        #: Only the FID and the WKB geometry, points are parsed from the geometry buffer
+        defn = lyr.GetLayerDefn()
+        names = [defn.GetFieldDefn(i).GetName() for i in range(defn.GetFieldCount())]
+        lyr.SetIgnoredFields([name for name in names if name not in (where or '')])
+        stream = lyr.GetArrowStreamAsPyArrow(['INCLUDE_FID=YES'])
+        table = pa.Table.from_batches(list(stream), schema=stream.schema)
+        fid = lyr.GetFIDColumn() or 'OGC_FID'
+        geometry = lyr.GetGeometryColumn() or 'wkb_geometry'
+        srs = lyr.GetSpatialRef()
+        code = srs.GetAuthorityCode(None) if srs is not None else None
+        ds = None
+        return (table.column(fid).to_numpy().astype(np.int64), *arrow_wkb_xy(table.column(geometry)),
+                int(code) if code else None)
+
+    #: GDAL without the Arrow stream API, one feature at a time
+    oids, x, y = [], [], []
+    for feat in lyr:
+        oids.append(feat.GetFID())
+        geom = feat.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            x.append(np.nan)
+            y.append(np.nan)
+            continue
+        if geom.GetGeometryName() != 'POINT':
+            geom = geom.Centroid()
+        x.append(geom.GetX())
+        y.append(geom.GetY())
+    srs = lyr.GetSpatialRef()
+    code = srs.GetAuthorityCode(None) if srs is not None else None
+    ds = None
+    return (np.array(oids, dtype=np.int64), np.array(x, dtype=np.float64), np.array(y, dtype=np.float64),
+            int(code) if code else None)
+
+
+def _ogr_read_shapes(workspace, layer, fields, where):
+    ds, lyr = _ogr_open(workspace, layer)
+    if where:
+        lyr.SetAttributeFilter(where)
+    rows, wkbs = [], []
+    for feat in lyr:
+        geom = feat.GetGeometryRef()
+        wkbs.append(bytes(geom.ExportToIsoWkb()) if geom is not None else None)
+        rows.append((feat.GetFID(), None, *[feat.GetField(f) for f in fields]))
+    srs = lyr.GetSpatialRef()
+    code = srs.GetAuthorityCode(None) if srs is not None else None
+    ds = None
+    return rows, wkbs, int(code) if code else None
+
+
+def _ogr_write(workspace, layer, oids, fields, values):
+    ds, lyr = _ogr_open(workspace, layer, update=True)
+    defn = lyr.GetLayerDefn()
+    indexes = [defn.GetFieldIndex(f) for f in fields]
+    missing = [f for f, i in zip(fields, indexes) if i < 0]
+    if missing:
+        raise ValueError(f'Fields {missing} not found in {layer}')
+
+    #: One transaction for the whole write, OpenFileGDB only has emulated transactions (hence force)
+    ds.StartTransaction(force=True)
+    written = 0
+    try:
+        for oid, *row in zip(oids, *values):
+            feat = lyr.GetFeature(int(oid))
+            if feat is None:
+                continue
+            for i, value in zip(indexes, row):
+                if value is None:
+                    feat.SetFieldNull(i)
+                else:
+                    feat.SetField(i, value)
+            lyr.SetFeature(feat)
+            written += 1
+        ds.CommitTransaction()
+    except Exception:
+        ds.RollbackTransaction()
+        raise
+    finally:
+        ds = None
+    return written
+
+
+#####################
+#  pyogrio backend  #
+#####################
+
+def ogr_driver(workspace):
+    """GDAL driver name for a local workspace path (.gdb, .gpkg or .fgb)."""
+    driver = OGR_DRIVERS.get(os.path.splitext(workspace)[1].lower())
+    if driver is None:
+        raise ValueError(f'No GDAL driver for {workspace}, expected one of {sorted(OGR_DRIVERS)}')
+    return driver
+
+
+def write_options(workspace):
+    """Layer creation options for pyogrio writes: FlatGeobuf keeps rows (and FIDs) in write order."""
+    return {'SPATIAL_INDEX': 'NO'} if ogr_driver(workspace) == 'FlatGeobuf' else None
+
+
+def _pyogrio_columns(workspace, layer, fields, where):
+    #: Columns to read and the extra ones only read for the filter, GDAL sees unread fields as null in the where clause
+    if fields is None:
+        return None, []
+    columns = [f for f in fields if f != OID_TOKEN]
+    if not where:
+        return columns, []
+    extra = [name for name in pyogrio.read_info(workspace, layer=layer)['fields'] if name in where and name not in columns]
+    return columns + extra, extra
+
+
+def _pyogrio_read_arrow(workspace, layer, fields, where, geometry=False):
+    #: (meta, Arrow table) with the FID as OID@ and, when asked for, the geometry (WKB) last; fields=None reads all
+    columns, extra = _pyogrio_columns(workspace, layer, fields, where)
+    meta, table = pyogrio.read_arrow(workspace, layer=layer, columns=columns, where=where or None,
+                                     read_geometry=geometry, return_fids=True)
+    fid = meta['fid_column'] or 'OGC_FID'
+    table = table.drop_columns(extra)
+    return meta, table.rename_columns([OID_TOKEN if name == fid else name for name in table.column_names])
+
+
+def _pyogrio_read(workspace, layer, fields, where):
+    _, table = _pyogrio_read_arrow(workspace, layer, fields, where)
+    columns = [table.column(name).to_pylist() for name in [OID_TOKEN] + list(fields)]
+    return list(zip(*columns))
+
+
+def _geometry_column(meta, table):
+    #: pyogrio names the WKB column after the layer's geometry column, 'wkb_geometry' when it has none
+    name = meta['geometry_name'] or 'wkb_geometry'
+    return name if name in table.column_names else table.column_names[-1]
+
+
+def _crs_code(crs):
+    #: EPSG code of a CRS string from GDAL, None when it has none
+    if not crs:
+        return None
+    from pyproj import CRS
+    return CRS.from_user_input(crs).to_epsg()
+
+
+def arrow_wkb_xy(column):
+    """X/Y of an Arrow binary column of WKB, read from its offsets and data buffers.
+
+    Points are parsed with wkb_point_xy without creating geometries; only the other
+    geometry types (polygons, lines) are built to take their centroid like SHAPE@X/SHAPE@Y.
+    Missing and empty geometries are NaN.
+    """
+    chunks = column.chunks if hasattr(column, 'chunks') else [column]
+    xs, ys = [np.zeros(0)], [np.zeros(0)]
+    for chunk in chunks:
+        #: geoarrow.wkb extension arrays keep the binary array as their storage
+        chunk = getattr(chunk, 'storage', chunk)
+        _, offsets, data = chunk.buffers()[:3]
+        offset_type = np.int64 if chunk.type.id == _large_binary_id() else np.int32
+        offsets = np.frombuffer(offsets, dtype=offset_type)[chunk.offset:chunk.offset + len(chunk) + 1].astype(np.int64)
+        buffer = np.frombuffer(data, dtype=np.uint8) if data is not None else np.zeros(0, dtype=np.uint8)
+        #: Anything shorter than a WKB header is missing
+        valid = chunk.is_valid().to_numpy(zero_copy_only=False) & (np.diff(offsets) >= 5)
+        x, y = np.full(len(chunk), np.nan), np.full(len(chunk), np.nan)
+        is_point = np.zeros(len(chunk), dtype=bool)
+        x[valid], y[valid], is_point[valid] = wkb_point_xy(buffer, offsets[:-1][valid])
+
+        others = np.flatnonzero(valid & ~is_point)
+        if len(others):
+            centroids = shapely.centroid(shapely.from_wkb(chunk.take(others).to_numpy(zero_copy_only=False)))
+            x[others], y[others] = shapely.get_x(centroids), shapely.get_y(centroids)
+        xs.append(x)
+        ys.append(y)
+    return np.ascontiguousarray(np.concatenate(xs)), np.ascontiguousarray(np.concatenate(ys))
+
+
+def _large_binary_id():
+    import pyarrow as pa
+    return pa.large_binary().id
+
+
+def _arrow_xy(meta, table):
+    #: X/Y of the WKB geometry column, polygons and lines use their centroid like SHAPE@X/SHAPE@Y
+    return arrow_wkb_xy(table.column(_geometry_column(meta, table)))
+
+
+def _pyogrio_read_xy(workspace, layer, where):
+    meta, table = _pyogrio_read_arrow(workspace, layer, [], where, geometry=True)
+    oids = table.column(OID_TOKEN).to_numpy().astype(np.int64)
+    return (oids, *_arrow_xy(meta, table), _crs_code(meta['crs']))
+
+
+def _pyogrio_iter_batches(workspace, layer, fields, batch_size, where):
+    columns, _ = _pyogrio_columns(workspace, layer, fields, where)
+    with pyogrio.open_arrow(workspace, layer=layer, columns=columns, where=where or None,
+                            batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        for batch in reader:
+            columns = {}
+            for field in fields:
+                column = _arrow_column(batch.column(field))
+                columns[field] = column.astype(np.int64) if column.dtype.kind == 'i' else column
+            yield (columns, *_arrow_xy(meta, batch))
+
+
+def _scratch_key(workspace, layer=None):
+    path = os.path.normcase(os.path.abspath(workspace))
+    return path if layer is None else (path, layer.lower())
+
+
+def mark_scratch(workspace, layer=None):
+    """Allow whole-layer rewrites (pyogrio) of a working workspace or layer this run created.
+
+    dabs_core.storage marks the workspaces it creates and the layers it writes.
+    """
+    _SCRATCH.add(_scratch_key(workspace, layer))
+
+
+def check_rewrite(workspace, layer):
+    """Refuse to rewrite a layer that isn't a scratch output of this run."""
+    if _scratch_key(workspace) in _SCRATCH or _scratch_key(workspace, layer) in _SCRATCH:
+        return
+    raise PermissionError(f"Refusing to rewrite {layer or workspace}, it wasn't created by this run; updating it in place "
+                          "needs GDAL 3.6+ Python bindings (osgeo), a rewrite would renumber its OIDs and drop "
+                          "domains, aliases and field lengths")
+
+
+def _pyogrio_write(workspace, layer, oids, fields, values):
+    #: GDAL can't update FileGDB/FlatGeobuf rows through pyogrio, so the whole layer is read and written back
+    import pyarrow as pa
+    check_rewrite(workspace, layer)
+    meta, table = _pyogrio_read_arrow(workspace, layer, None, None, geometry=True)
+    missing = [f for f in fields if f not in table.column_names]
+    if missing:
+        raise ValueError(f'Fields {missing} not found in {layer or workspace}')
+
+    #: Row of each OID, OIDs that aren't in the layer are skipped
+    fids = table.column(OID_TOKEN).to_numpy()
+    oids = np.asarray(oids)
+    sorter = np.argsort(fids, kind='stable')
+    pos = np.searchsorted(fids, oids, sorter=sorter).clip(max=max(len(fids) - 1, 0))
+    found = fids[sorter[pos]] == oids if len(fids) else np.zeros(len(oids), dtype=bool)
+    rows = sorter[pos[found]].tolist()
+    for field, column_values in zip(fields, values):
+        column = table.column(field).to_pylist()
+        for row, value in zip(rows, np.asarray(column_values, dtype=object)[found].tolist()):
+            column[row] = value
+        table = table.set_column(table.column_names.index(field), field,
+                                 pa.array(column, type=table.schema.field(field).type))
+
+    pyogrio.write_arrow(table.drop_columns([OID_TOKEN]), workspace, layer=layer, driver=ogr_driver(workspace),
+                        geometry_name=_geometry_column(meta, table), geometry_type=meta['geometry_type'],
+                        crs=meta['crs'], layer_options=write_options(workspace))
+    return int(found.sum())
+
+
+###################
+#  arcpy backend  #
+###################
+
+def _arcpy_read(table, fields, where):
+    with arcpy.da.SearchCursor(table, ['OID@'] + list(fields), where) as cursor:
+        return list(cursor)
+
+
+def _arcpy_read_arrow(table, fields, where):
+    #: Arrow table straight from arcpy (ArcGIS Pro 3.2+), None on older versions
+    if not hasattr(arcpy.da, 'TableToArrowTable'):
+        return None
+    oid_field = arcpy.Describe(table).OIDFieldName
+    names = [oid_field if f == OID_TOKEN else f for f in fields]
+    table = arcpy.da.TableToArrowTable(table, names, where)
+    return table.rename_columns([OID_TOKEN if name == oid_field and OID_TOKEN in fields else name
+                                 for name in table.column_names])
+
+
+def _arcpy_read_xy(table, where, sr):
+    kwargs = {'spatial_reference': arcpy.SpatialReference(sr)} if sr is not None else {}
+    arr = arcpy.da.FeatureClassToNumPyArray(table, ['OID@', 'SHAPE@X', 'SHAPE@Y'], where, **kwargs,
+                                            null_value={'SHAPE@X': np.nan, 'SHAPE@Y': np.nan})
+    #: Fields of a structured array are strided views, copy each into its own contiguous array
+    return (np.ascontiguousarray(arr['OID@'], dtype=np.int64), np.ascontiguousarray(arr['SHAPE@X'], dtype=np.float64),
+            np.ascontiguousarray(arr['SHAPE@Y'], dtype=np.float64))
+
+
+def _arcpy_read_shapes(table, fields, where, sr):
+    kwargs = {'spatial_reference': arcpy.SpatialReference(sr)} if sr is not None else {}
+    with arcpy.da.SearchCursor(table, ['OID@', 'SHAPE@WKB'] + list(fields), where, **kwargs) as cursor:
+        rows = list(cursor)
+    return rows, [bytes(row[1]) if row[1] is not None else None for row in rows]
+
+
+def _arcpy_write(table, oids, fields, values):
+    lookup = dict(zip(oids, zip(*values)))
+    written = 0
+    with arcpy.da.UpdateCursor(table, ['OID@'] + list(fields)) as uCur:
+        for urow in uCur:
+            if urow[0] in lookup:
+                uCur.updateRow([urow[0], *lookup[urow[0]]])
+                written += 1
+    return written
+
+
+###################
+#  Typed columns  #
+###################
+
+def _have_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+
+def _object_column(values):
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _typed_column(values):
+    #: Typed NumPy array of a list of cursor values, by the types of its non-null values
+    present = [v for v in values if v is not None]
+    kinds = {type(v) for v in present}
+    if kinds and kinds <= {int}:
+        if len(present) == len(values):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if kinds and kinds <= {int, float}:
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if kinds and all(issubclass(kind, datetime.date) for kind in kinds):
+        return np.array(['NaT' if v is None else v for v in values], dtype='datetime64[us]')
+    return _object_column(values)
+
+
+def _arrow_column(column):
+    #: NumPy array of an Arrow column: nulls become NaN/NaT in numeric/time columns and None in the rest
+    import pyarrow as pa
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    if pa.types.is_dictionary(column.type):
+        column = column.dictionary_decode()
+    return column.to_numpy(zero_copy_only=False)
+
+
+def _read_rows(table, fields, where, backend):
+    #: (OID, *fields) tuples of every row, fetched in one call
+    if backend == 'gpkg':
+        return _gpkg_read(*split_workspace(table), fields, where)
+    if backend == 'ogr':
+        return _ogr_read(*split_workspace(table), fields, where)
+    if backend == 'pyogrio':
+        return _pyogrio_read(*split_workspace(table), fields, where)
+    return _arcpy_read(table, fields, where)
+
+
+def _read_arrow(table, fields, where, backend):
+    #: Arrow table from the backends that produce one, None when this one can't
+    if backend == 'ogr':
+        return _ogr_read_arrow(*split_workspace(table), fields, where)
+    if backend == 'pyogrio':
+        return _pyogrio_read_arrow(*split_workspace(table), fields, where)[1]
+    if backend == 'arcpy':
+        return _arcpy_read_arrow(table, fields, where)
+    return None
+
+
+################
+#  Public API  #
+################
+
+def read_columns(table, fields, where=None, backend=None):
+    """Read the OIDs and one or more fields of a table.
+
+    Returns an OID array and a dictionary of field name to object array.
+    """
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    rows = _read_rows(table, fields, where, pick_backend(table, backend))
+
+    oids = np.array([row[0] for row in rows], dtype=np.int64)
+    columns = {field: _object_column([row[i] for row in rows]) for i, field in enumerate(fields, start=1)}
+    return oids, columns
+
+
+def read_table(table, fields, where=None, backend=None, arrow=False):
+    """Read one or more fields of a table (and its OIDs with the 'OID@' token) in one bulk call.
+
+    Returns a dictionary of field name to typed NumPy array (int64, float64 with NaN for
+    nulls, datetime64, or object arrays of str/None), or a pyarrow Table with arrow=True.
+    """
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    backend = pick_backend(table, backend)
+    arrow_table = _read_arrow(table, fields, where, backend) if backend != 'gpkg' else None
+    if arrow_table is not None:
+        arrow_table = arrow_table.select(fields)
+        if arrow:
+            return arrow_table
+        return {field: _arrow_column(arrow_table.column(field)) for field in fields}
+
+    names = [f for f in fields if f != OID_TOKEN]
+    rows = _read_rows(table, names, where, backend)
+    transposed = list(zip(*rows)) or [()] * (len(names) + 1)
+    values = {name: list(column) for name, column in zip([OID_TOKEN] + names, transposed)}
+    if arrow:
+        import pyarrow as pa
+        return pa.table({field: pa.array(values[field]) for field in fields})
+    return {field: _typed_column(values[field]) for field in fields}
+
+
+def read_column(table, field, where=None, backend=None):
+    """Read one field of a table as a typed NumPy array (see read_table)."""
+    return read_table(table, [field], where, backend)[field]
+
+
+def _project(geometries, source, sr):
+    #: Project shapely geometries from a CRS (EPSG code or GDAL string) to an EPSG code
+    from pyproj import CRS, Transformer
+    if source is None:
+        raise ValueError('Layer has no spatial reference to project from, read it with backend="arcpy"')
+    if CRS.from_user_input(source) == CRS.from_epsg(int(sr)):
+        return geometries
+    transformer = Transformer.from_crs(CRS.from_user_input(source), CRS.from_epsg(int(sr)), always_xy=True)
+    return shapely.transform(geometries, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+
+def read_shapes(table, fields=(), where=None, sr=None, backend=None):
+    """Read OIDs, shapely geometries and fields of a feature class.
+
+    sr is an EPSG code to return geometries in (default: the layer's own).
+    Returns an OID array, an object array of geometries (None where missing) and a dictionary
+    of field name to object array, the arguments of poly_assign.PolygonIndex.
+    """
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    backend = pick_backend(table, backend)
+    if backend == 'pyogrio':
+        meta, arrow_table = _pyogrio_read_arrow(*split_workspace(table), fields, where, geometry=True)
+        oids = arrow_table.column(OID_TOKEN).to_numpy().astype(np.int64)
+        wkbs = arrow_table.column(_geometry_column(meta, arrow_table)).to_numpy(zero_copy_only=False)
+        columns = {field: _object_column(arrow_table.column(field).to_pylist()) for field in fields}
+        source = meta['crs']
+    else:
+        if backend == 'gpkg':
+            rows, wkbs, source = _gpkg_read_shapes(*split_workspace(table), fields, where)
+        elif backend == 'ogr':
+            rows, wkbs, source = _ogr_read_shapes(*split_workspace(table), fields, where)
+        else:
+            rows, wkbs = _arcpy_read_shapes(table, fields, where, sr)
+        oids = np.array([row[0] for row in rows], dtype=np.int64)
+        columns = {field: _object_column([row[i] for row in rows]) for i, field in enumerate(fields, start=2)}
+
+    geometries = shapely.from_wkb(_object_column(list(wkbs)))
+    #: arcpy projects while reading
+    if sr is not None and backend != 'arcpy':
+        geometries = _project(geometries, source, sr)
+    return oids, geometries, columns
+
+
+def read_xy(table, where=None, sr=None, backend=None):
+    """Read OIDs and X/Y coordinates of a feature class as contiguous int64/float64 arrays.
+
+    Points give their coordinates, other shapes their centroid, missing geometry NaN.
+    sr is an EPSG code to return coordinates in (default: the layer's own).
+    """
+    backend = pick_backend(table, backend)
+    if backend == 'arcpy':
+        return _arcpy_read_xy(table, where, sr)
+
+    if backend == 'gpkg':
+        oids, x, y, srs_id = _gpkg_read_xy(*split_workspace(table), where)
+    elif backend == 'pyogrio':
+        oids, x, y, srs_id = _pyogrio_read_xy(*split_workspace(table), where)
+    else:
+        oids, x, y, srs_id = _ogr_read_xy(*split_workspace(table), where)
+    if sr is not None and srs_id is None:
+        raise ValueError(f'Spatial reference of {table} has no EPSG code, read it with backend="arcpy"')
+    if sr is not None and int(srs_id) != int(sr):
+        from pyproj import Transformer
+        x, y = Transformer.from_crs(int(srs_id), int(sr), always_xy=True).transform(x, y)
+        x, y = np.ascontiguousarray(x, dtype=np.float64), np.ascontiguousarray(y, dtype=np.float64)
+    return oids, x, y
+
+
+def iter_batches(table, fields, batch_size, where=None, backend=None):
+    """Yield (columns, x, y) for batches of up to batch_size rows, in layer order.
+
+    Columns are NumPy arrays like read_table's (integers as int64), x/y the coordinates in the
+    layer's spatial reference (centroids for non-points). Streams with GDAL's Arrow reader, for
+    arcpy tables use a SearchCursor.
+    """
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    backend = pick_backend(table, backend)
+    if backend == 'arcpy':
+        raise ValueError(f'{table} needs the arcpy backend, read it with a SearchCursor')
+    if not _have_pyogrio():
+        raise ImportError('iter_batches needs pyogrio')
+    yield from _pyogrio_iter_batches(*split_workspace(table), fields, batch_size, where)
+
+
+def read_oids(table, where=None, backend=None):
+    """Read the OIDs of a table, optionally limited by a where clause."""
+    return read_columns(table, [], where, backend)[0]
+
+
+def write_columns(table, oids, columns, backend=None):
+    """Write value arrays to a table, matching rows on OID.
+
+    columns is a dictionary of field name to an array the same length as oids.
+    Returns a WriteResult with the number of rows written and the number of
+    OIDs that didn't match a row.
+    """
+    fields = list(columns)
+    oids = np.asarray(oids).tolist()
+    values = []
+    for field in fields:
+        column = np.asarray(columns[field], dtype=object)
+        if len(column) != len(oids):
+            raise ValueError(f'{field} has {len(column)} values for {len(oids)} OIDs')
+        values.append(column.tolist())
+    if not fields or not oids:
+        return WriteResult(0, 0)
+
+    backend = pick_backend(table, backend)
+    if backend == 'gpkg':
+        written = _gpkg_write(*split_workspace(table), oids, fields, values)
+    elif backend == 'ogr':
+        written = _ogr_write(*split_workspace(table), oids, fields, values)
+    elif backend == 'pyogrio':
+        written = _pyogrio_write(*split_workspace(table), oids, fields, values)
+    else:
+        written = _arcpy_write(table, oids, fields, values)
+
+    return WriteResult(written, len(oids) - written)
+
+
+def fill_column(table, field, value, where=None, backend=None):
+    """Set one field to a constant value on every row (or rows matching where)."""
+    oids = read_oids(table, where, backend)
+    return write_columns(table, oids, {field: np.full(len(oids), value, dtype=object)}, backend)
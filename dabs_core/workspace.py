@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Workspace and I/O helpers shared by the DABS scripts
+- create a dated working geodatabase
+- copy SGID (or other) layers into it, optionally through a StageCache
+- delete intermediate layers
+- read a cleaned address list from a table (arcpy or, offline, GeoPackage/FileGDB)
+- layers are created, copied and deleted through dabs_core.storage (arcpy or GDAL)
+"""
+
+import os
+
+from .lazy import lazy_import
+from .addresses import normalize_addresses
+from .instrument import stage
+from .stage_cache import source_version
+from .storage import copy_layer, create_workspace, default_backend, delete_layer, layer_exists
+from .table_io import read_column
+
+arcpy = lazy_import('arcpy')
+
+
+#: Create working geodatabase with today's date
+def create_gdb(work_dir, db_name):
+    print("Creating file geodatabase ...")
+    gdb = create_workspace(work_dir, db_name)
+    if default_backend() == 'arcpy':
+        arcpy.env.workspace = gdb
+        arcpy.env.qualifiedFieldNames = False
+    return gdb
+
+
+#: Copy one layer to the local gdb, through the stage cache when one is given
+def export_layer(source, out_db, name=None, query=None, cache=None, rebuild=False):
+    name = name or source.rsplit('.', 1)[-1]
+    if cache is not None:
+        def build(stage_gdb, fc_name):
+            copy_layer(source, os.path.join(stage_gdb, fc_name), query)
+        return cache.layer('export', [source, source_version(source), query], name, out_db, build, rebuild)
+
+    return copy_layer(source, os.path.join(out_db, name), query)
+
+
+#: Copy data layers (e.g. SGID.LOCATION.AddressPoints) to local gdb, named after the last part of the path
+def export_layers(layers, out_db, cache=None, rebuild=False):
+    exported_fcs = []
+    with stage('exporting data'):
+        for item in layers:
+            print(f"Exporting {item} to: {item.rsplit('.', 1)[-1]}")
+            exported_fcs.append(export_layer(item, out_db, cache=cache, rebuild=rebuild))
+    return exported_fcs
+
+
+#: Delete temporary and intermediate files
+def delete_layers(names, workspace):
+    for name in names:
+        if layer_exists(os.path.join(workspace, name)):
+            print(f"Deleting {name} ...")
+            delete_layer(os.path.join(workspace, name))
+
+
+#: Read an address field in one bulk read into a list of normalized strings
+def read_addresses(table, field='Address', where=None):
+    return list(normalize_addresses(read_column(table, field, where)))
@@ -11,48 +11,46 @@ Script to combine OSM and SGID data to build DABS buffers for alcohol license fl
 
 import os
 import time
-import arcpy
+import numpy as np
+from dabs_core import RunReport, lazy_import, read_oids, write_columns
 
-
-#: Start timer and print start time in UTC
-start_time = time.time()
-readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-print("The script start time is {}".format(readable_start))
-today = time.strftime("%Y%m%d")
+arcpy = lazy_import('arcpy')
 
 #: Set up variables
 latest_db = r'C:\DABC\DABS_latest_data.gdb'
 flag_areas = os.path.join(latest_db, 'DABS_Flag_Areas')
 parcels = os.path.join(latest_db, 'Utah_Parcels')
 
-#: Add field to the parcels layer
-# print(f"Adding 'DABS_Flag' field to parcels ...")
-# arcpy.management.AddField(parcels, "DABS_Flag", "TEXT", "", "", 5)
-
-#: Calculate the field to 'False' for rows
-print("Calculating all rows to 'False' ...")
-fields = ['DABS_Flag']
-with arcpy.da.UpdateCursor(parcels, fields) as cursor:
-    for row in cursor:
-        row[0] = 'False'
-        cursor.updateRow(row)
-
-#: Create selection on parcels that intersect flag areas
-selection = arcpy.management.SelectLayerByLocation(parcels, "INTERSECT", flag_areas)
-select_count = int(arcpy.management.GetCount(selection)[0])
-print(f"Selected {select_count} parcels that intersect flag areas ...")
-
-#: Calculate the field to 'True' for intersected rows
-print("Calculating selected rows to 'True' ...")
-fields = ['DABS_Flag']
-with arcpy.da.UpdateCursor(selection, fields) as cursor:
-    for row in cursor:
-        row[0] = 'True'
-        cursor.updateRow(row)
-
-
-#: Stop timer and print end time in UTC
-print("Script shutting down ...")
-readable_end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-print("The script end time is {}".format(readable_end))
-print("Time elapsed: {:.2f}s".format(time.time() - start_time))
+
+def main():
+    #: Start timer and print start time in UTC
+    report = RunReport('dabs_parcel_flagger').start()
+    readable_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script start time is {}".format(readable_start))
+
+    #: Add field to the parcels layer
+    # print(f"Adding 'DABS_Flag' field to parcels ...")
+    # arcpy.management.AddField(parcels, "DABS_Flag", "TEXT", "", "", 5)
+
+    #: Create selection on parcels that intersect flag areas
+    selection = arcpy.management.SelectLayerByLocation(parcels, "INTERSECT", flag_areas)
+    selected_oids = read_oids(selection)
+    print(f"Selected {len(selected_oids)} parcels that intersect flag areas ...")
+
+    #: Calculate the field to 'True' for intersected rows and 'False' for all others in one pass
+    print("Calculating selected rows to 'True', all others to 'False' ...")
+    parcel_oids = read_oids(parcels)
+    flags = np.where(np.isin(parcel_oids, selected_oids), 'True', 'False').astype(object)
+    result = write_columns(parcels, parcel_oids, {'DABS_Flag': flags})
+    print(f"Updated 'DABS_Flag' on {result.written} parcels")
+
+
+    #: Stop timer and print end time in UTC
+    print("Script shutting down ...")
+    readable_end = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    print("The script end time is {}".format(readable_end))
+    report.finish(os.path.dirname(latest_db))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+dabs_core.fuzzy trigram search and the index saved next to the MAT
+"""
+
+import os
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from dabs_core.fuzzy import TrigramIndex, open_trigram_index, trigram_index_path
+
+
+def write_mat(path, rows):
+    pd.DataFrame(rows, columns=['FullAdd', 'City', 'ZipCode', 'matID']).to_csv(path)
+    return path
+
+
+MAT_ROWS = [
+    ('123 S MAIN ST', 'SALT LAKE CITY', '84111', 'a_123'),
+    ('125 S MAIN ST', 'SALT LAKE CITY', '84111', 'a_125'),
+    ('9 W 500 N', 'PROVO', '84601', 'b_9'),
+]
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    calls = []
+    from_mat = TrigramIndex.from_mat.__func__
+    monkeypatch.setattr(TrigramIndex, 'from_mat',
+                        classmethod(lambda cls, *args, **kwargs: calls.append(args[0]) or from_mat(cls, *args, **kwargs)))
+    return calls
+
+
+def test_search():
+    index = TrigramIndex(['123 S MAIN ST SALT LAKE CITY', '9 W 500 N PROVO'])
+    (rec, score), = index.search('123 S MAIN ST SALT LAKE CITY', k=1)
+    assert (rec, score) == (0, 1.0)
+    assert index.search('9 W 500 NORTH PROVO', k=1)[0][0] == 1
+
+
+def test_saved_index_is_reused_until_the_mat_changes(tmp_path, builds):
+    mat_csv = write_mat(os.path.join(tmp_path, 'DABS_mat.csv'), MAT_ROWS)
+    built = open_trigram_index(mat_csv)
+    assert os.path.exists(trigram_index_path(mat_csv))
+    loaded = open_trigram_index(mat_csv)
+    assert builds == [mat_csv]
+
+    queries = ['123 S MAIN STREET', '9 W 500 N'], ['SALT LAKE CITY', 'PROVO']
+    assert loaded.search_many(*queries).equals(built.search_many(*queries))
+    assert loaded.keys.tolist() == built.keys.tolist()
+    assert loaded.records.equals(built.records)
+
+    #: Other record fields, or a changed MAT, rebuild it
+    assert len(open_trigram_index(mat_csv, fields=['matID']).records.columns) == 1
+    write_mat(mat_csv, MAT_ROWS + [('1 E 100 S', 'OGDEN', '84401', 'c_1')])
+    assert len(open_trigram_index(mat_csv)) == 4
+    assert builds == [mat_csv] * 3
+    assert open_trigram_index(mat_csv, rebuild=True).records['matID'].tolist()[-1] == 'c_1'
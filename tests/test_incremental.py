@@ -0,0 +1,72 @@
+"""
+dabs_core.incremental dirty tracking between runs
+"""
+
+import os
+import pytest
+
+pd = pytest.importorskip('pandas')
+pa = pytest.importorskip('pyarrow')
+pyogrio = pytest.importorskip('pyogrio')
+shapely = pytest.importorskip('shapely')
+pytest.importorskip('pyproj')
+
+from dabs_core.incremental import IncrementalAssigner
+from dabs_core.storage import write_points
+
+
+def write_zones(gpkg, names):
+    #: Two 100 m squares, 100 m apart
+    geometries = [shapely.box(0, 0, 100, 100), shapely.box(200, 0, 300, 100)]
+    table = pa.table({'NAME': names, 'geom': pa.array(shapely.to_wkb(geometries).tolist(), pa.binary())})
+    pyogrio.write_arrow(table, gpkg, layer='zones', driver='GPKG', geometry_name='geom', geometry_type='Polygon',
+                        crs='EPSG:26912')
+    return os.path.join(gpkg, 'zones')
+
+
+def write_addresses(gpkg, xs):
+    frame = pd.DataFrame({'X': xs, 'Y': [50.0] * len(xs)})
+    return write_points(frame, 'X', 'Y', os.path.join(gpkg, 'pts'), 26912, backend='gdal')
+
+
+def run(pts, zones, cache_dir, commit=True):
+    tracker = IncrementalAssigner(pts, {'Zone': {'poly_path': zones, 'poly_field': 'NAME'}}, cache_dir=cache_dir)
+    oids, columns = tracker.assign_columns()
+    if commit:
+        tracker.commit()
+    return oids.tolist(), columns['Zone'].tolist()
+
+
+def test_only_changed_points_are_reassigned(tmp_path):
+    gpkg = os.path.join(tmp_path, 'data.gpkg')
+    cache_dir = os.path.join(tmp_path, 'cache')
+    zones = write_zones(gpkg, ['a', 'b'])
+    #: In a, in b, in neither, within the 1 m tolerance of a
+    pts = write_addresses(gpkg, [50.0, 250.0, 150.0, 100.5])
+
+    assert run(pts, zones, cache_dir) == ([1, 2, 3, 4], ['a', 'b', '', 'a'])
+    assert run(pts, zones, cache_dir) == ([], [])
+
+    #: An edited polygon dirties the points around it
+    write_zones(gpkg, ['a', 'b2'])
+    assert run(pts, zones, cache_dir) == ([2], ['b2'])
+
+    #: A moved point and a new point
+    write_addresses(gpkg, [50.0, 250.0, 250.5, 100.5, 20.0])
+    assert run(pts, zones, cache_dir, commit=False) == ([3, 5], ['b2', 'a'])
+    #: Nothing is saved without commit, so the next run redoes them
+    assert run(pts, zones, cache_dir) == ([3, 5], ['b2', 'a'])
+    assert run(pts, zones, cache_dir) == ([], [])
+
+
+def test_extra_oids(tmp_path):
+    gpkg = os.path.join(tmp_path, 'data.gpkg')
+    cache_dir = os.path.join(tmp_path, 'cache')
+    zones = write_zones(gpkg, ['a', 'b'])
+    pts = write_addresses(gpkg, [50.0, 250.0])
+    run(pts, zones, cache_dir)
+
+    tracker = IncrementalAssigner(pts, {'Zone': {'poly_path': zones, 'poly_field': 'NAME'}}, cache_dir=cache_dir)
+    oids, columns = tracker.assign_columns(extra_oids=[2])
+    assert oids.tolist() == [2] and columns['Zone'].tolist() == ['b']
+    assert tracker.point_oids.tolist() == [1, 2]
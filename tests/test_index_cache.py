@@ -0,0 +1,96 @@
+"""
+dabs_core.index_cache cold/warm loads and invalidation on a FileGDB
+"""
+
+import os
+import datetime
+import numpy as np
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pyogrio = pytest.importorskip('pyogrio')
+shapely = pytest.importorskip('shapely')
+pytest.importorskip('pyproj')
+
+from dabs_core.index_cache import cached_polygon_index, layer_stamp, load_index, save_index
+from dabs_core.poly_assign import PolygonIndex
+
+FIELDS = ['NAME', 'CODE', 'RATE']
+
+
+def write_zones(gdb, layer, count, append=False):
+    geometries = [shapely.box(i * 10, 0, i * 10 + 10, 10) for i in range(count)]
+    table = pa.table({
+        'NAME': [f'zone {i}' if i % 3 else None for i in range(count)],
+        'CODE': pa.array(range(count), pa.int32()),
+        'RATE': [i / 4 for i in range(count)],
+        'SHAPE': pa.array(shapely.to_wkb(geometries).tolist(), pa.binary()),
+    })
+    pyogrio.write_arrow(table, gdb, layer=layer, driver='OpenFileGDB', geometry_name='SHAPE',
+                        geometry_type='Polygon', crs='EPSG:26912', append=append)
+    return os.path.join(gdb, layer)
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    #: Source layers read by PolygonIndex.from_featureclass (cache misses)
+    calls = []
+    from_featureclass = PolygonIndex.from_featureclass.__func__
+    monkeypatch.setattr(PolygonIndex, 'from_featureclass',
+                        classmethod(lambda cls, *args, **kwargs: calls.append(args[0]) or from_featureclass(cls, *args, **kwargs)))
+    return calls
+
+
+def assert_same(index, other):
+    assert index.oids.tolist() == other.oids.tolist()
+    assert shapely.equals(index.geometries, other.geometries).all()
+    for field in FIELDS:
+        values, cached = index.attributes[field].tolist(), other.attributes[field].tolist()
+        assert values == cached
+        assert [type(v) for v in values] == [type(v) for v in cached]
+
+
+def test_cold_and_warm_loads_are_equal(tmp_path, reads):
+    zones = write_zones(os.path.join(tmp_path, 'data.gdb'), 'zones', 5)
+    cache_dir = os.path.join(tmp_path, 'cache')
+    cold = cached_polygon_index(zones, FIELDS, cache_dir=cache_dir)
+    warm = cached_polygon_index(zones, FIELDS, cache_dir=cache_dir)
+    assert reads == [zones]
+    assert_same(cold, warm)
+    assert warm.attributes['CODE'].tolist() == [0, 1, 2, 3, 4]
+    assert warm.attributes['NAME'][0] is None
+    assert np.array_equal(warm.match([15.0, 99.0], [5.0, 5.0]), [1, -1])
+
+
+def test_invalidation_is_per_layer(tmp_path, reads):
+    gdb = os.path.join(tmp_path, 'data.gdb')
+    zones = write_zones(gdb, 'zones', 5)
+    cache_dir = os.path.join(tmp_path, 'cache')
+    cached_polygon_index(zones, FIELDS, cache_dir=cache_dir)
+    stamp = layer_stamp(zones)
+
+    #: Another layer in the same geodatabase doesn't invalidate the entry
+    write_zones(gdb, 'other', 2)
+    assert layer_stamp(zones) == stamp
+    cached_polygon_index(zones, FIELDS, cache_dir=cache_dir)
+    assert reads == [zones]
+
+    #: Editing the layer itself does
+    write_zones(gdb, 'zones', 2, append=True)
+    assert layer_stamp(zones) != stamp
+    index = cached_polygon_index(zones, FIELDS, cache_dir=cache_dir)
+    assert reads == [zones, zones]
+    assert len(index) == 7
+
+
+def test_attribute_types_round_trip(tmp_path):
+    values = [1, 2.5, 'text', None, datetime.datetime(2023, 2, 1, 12, 30), datetime.date(2023, 2, 1)]
+    index = PolygonIndex(np.arange(len(values)), [shapely.box(i, 0, i + 1, 1) for i in range(len(values))],
+                         {'VALUE': values, 'file': ['a'] * len(values)})
+    entry_dir = os.path.join(tmp_path, 'entry')
+    save_index(index, entry_dir, 'stamp')
+    loaded = load_index(entry_dir, 'stamp')
+    assert loaded.attributes['VALUE'].tolist() == values
+    assert [type(v) for v in loaded.attributes['VALUE']] == [type(v) for v in values]
+    assert loaded.attributes['file'].tolist() == ['a'] * len(values)
+    assert load_index(entry_dir, 'other stamp') is None
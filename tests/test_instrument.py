@@ -0,0 +1,37 @@
+"""
+dabs_core.instrument memory measurements
+"""
+
+import sys
+import types
+from collections import namedtuple
+import pytest
+
+from dabs_core import instrument
+from dabs_core.instrument import RunReport, rss_mb, stage
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='the resource module is not on Windows')
+
+
+def test_peak_without_peak_wset(monkeypatch):
+    #: psutil only has peak_wset on Windows, the peak then comes from ru_maxrss
+    memory = namedtuple('pmem', ['rss', 'vms'])
+    fake = types.SimpleNamespace(Process=lambda: types.SimpleNamespace(memory_info=lambda: memory(300 * 2**20, 0)))
+    monkeypatch.setitem(sys.modules, 'psutil', fake)
+    rss, peak = rss_mb()
+    assert rss == 300
+    assert peak == instrument._maxrss_mb() and peak > 0
+
+
+def test_stage_reports_peak_growth(tmp_path):
+    report = RunReport('test').start()
+    with stage('small', verbose=False):
+        pass
+    with stage('large', verbose=False):
+        block = b'x' * (200 * 2**20)
+        del block
+    stages = {s['stage']: s for s in report.as_dict()['stages']}
+    report.finish(str(tmp_path))
+    assert stages['large']['peak_rss_growth_mb'] > 150
+    assert 0 <= stages['small']['peak_rss_growth_mb'] < 50
+    assert stages['large']['traced_peak_mb'] is None
@@ -0,0 +1,48 @@
+"""
+dabs_core.mat.dedup against the original two-pass de-duplication
+"""
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from dabs_core.mat import COLUMNS_DABS, DedupStats, dedup, dedup_two_pass
+from dabs_core.schema import apply_schema
+
+
+def addresses():
+    #: A and E have duplicate UTAddPtIDs, m1 and m2 duplicate matIDs;
+    #: rows 1 and 3 tie on DABS and matID, rows 5 and 6 tie on DABS
+    rows = [
+        ('A', 'm2', 'no', ' 1 MAIN ST '),
+        ('B', 'm1', 'no', '2 MAIN ST'),
+        ('A', 'm3', 'yes', '3 MAIN ST'),
+        ('C', 'm1', 'no', '4 MAIN ST'),
+        ('D', 'm2', 'yes', '5 MAIN ST '),
+        ('E', 'm4', 'no', '6 MAIN ST'),
+        ('E', 'm0', 'no', '7 MAIN ST'),
+    ]
+    frame = pd.DataFrame({column: [''] * len(rows) for column in COLUMNS_DABS})
+    frame['UTAddPtID'], frame['matID'], frame['DABS'], frame['FullAdd'] = zip(*rows)
+    frame['longitude'] = [-111.9 + i / 1000 for i in range(len(rows))]
+    frame['latitude'] = 40.7
+    return frame
+
+
+def test_dedup_keeps_dabs_first_then_input_order():
+    mat, stats = dedup(addresses(), return_stats=True)
+    assert mat.index.tolist() == [4, 2, 6, 1]
+    assert mat['FullAdd'].tolist() == ['5 MAIN ST', '3 MAIN ST', '7 MAIN ST', '2 MAIN ST']
+    assert 'DABS' not in mat
+    assert stats == DedupStats(rows=7, addptid_removed=2, addptid_keys=2, matid_removed=1, matid_keys=1, kept=4)
+
+
+def test_dedup_matches_two_pass():
+    assert dedup(addresses()).equals(dedup_two_pass(addresses()))
+    #: Shuffled input, ties still go to whichever row comes first
+    shuffled = addresses().sample(frac=1, random_state=3)
+    assert dedup(shuffled.copy()).equals(dedup_two_pass(shuffled.copy()))
+
+
+def test_dedup_typed_schema():
+    assert dedup(apply_schema(addresses())).to_csv() == dedup(addresses()).to_csv()
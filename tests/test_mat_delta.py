@@ -0,0 +1,58 @@
+"""
+dabs_core.mat_delta added/changed/removed rows between two MATs
+"""
+
+import os
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+from dabs_core.mat import MAT_COLUMNS
+from dabs_core.mat_delta import mat_delta, row_hashes
+from dabs_core.mat_io import write_mat
+
+
+def mat(ids):
+    frame = pd.DataFrame({column: [f'{column} {i}' for i in ids] for column in MAT_COLUMNS})
+    frame['matID'] = [f'm{i}' for i in ids]
+    frame['longitude'] = [-111.5 - i / 4 for i in ids]
+    frame['latitude'] = 40.25
+    return frame
+
+
+def test_delta(tmp_path):
+    previous = mat(range(10))
+    new = mat([0, 1, 2, 3, 4, 5, 6, 10, 11])
+    #: A changed attribute, a moved point and a value that only looks different as a float
+    new.loc[1, 'Comp_Group'] = 'new group'
+    new.loc[2, 'latitude'] = 40.5
+    new.loc[3, 'latitude'] = 40.250
+
+    previous_csv = os.path.join(tmp_path, 'previous', 'DABS_mat.csv')
+    new_csv = os.path.join(tmp_path, 'new', 'DABS_mat.csv')
+    os.makedirs(os.path.dirname(previous_csv))
+    os.makedirs(os.path.dirname(new_csv))
+    #: The previous MAT as a CSV only, the new one with its Parquet file
+    write_mat(previous, previous_csv, parquet=False)
+    write_mat(new, new_csv)
+
+    #: Batches smaller than the MATs
+    delta = mat_delta(new_csv, previous_csv, os.path.join(tmp_path, 'delta'), batch_size=4)
+    assert (delta.added, delta.changed, delta.removed, delta.unchanged) == (2, 2, 3, 5)
+    read = {kind: pd.read_csv(path, dtype={'matID': str}) for kind, path in delta.paths.items()}
+    assert read['added']['matID'].tolist() == ['m10', 'm11']
+    assert read['changed']['matID'].tolist() == ['m1', 'm2']
+    assert read['changed']['Comp_Group'].tolist() == ['new group', 'Comp_Group 2']
+    assert read['removed']['matID'].tolist() == ['m7', 'm8', 'm9']
+    assert read['added'].columns.tolist() == MAT_COLUMNS
+
+
+def test_row_hashes_by_value():
+    frame = mat(range(3))
+    as_strings = frame.astype({'City': 'category', 'ZipCode': 'string'})
+    assert (row_hashes(frame) == row_hashes(as_strings)).all()
+    frame.loc[0, 'ZipCode'] = None
+    as_strings.loc[0, 'ZipCode'] = ''
+    assert (row_hashes(frame) == row_hashes(as_strings)).all()
+    assert len(set(row_hashes(frame))) == 3
@@ -0,0 +1,41 @@
+"""
+Golden-file test for the MAT column derivations: derive_columns must give the
+values the original row-wise lambdas of dabs_MAT_export_fast.py produced
+(data/mat_expected.csv) for the address points in data/mat_input.csv
+"""
+
+import os
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('h3')
+
+from dabs_core.mat import derive_columns
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+COLUMNS = ['City', 'FullAdd', 'UNIT', 'STREET', 'DABS', 'Flag', 'matID']
+
+#: FullAdd values of mat_input.csv rows 0, 2, 10 and 20, as license addresses
+DABS_ADDRS = ['123 S MAIN ST', '9 W 500 N # 12', '10740 E OAK LN', '10912 W VINE CIR']
+
+
+def read_input():
+    points = pd.read_csv(os.path.join(DATA, 'mat_input.csv'), dtype=str, keep_default_na=False)
+    points[['longitude', 'latitude']] = points[['longitude', 'latitude']].astype(float)
+    return points
+
+
+def test_derive_columns_matches_golden():
+    expected = pd.read_csv(os.path.join(DATA, 'mat_expected.csv'), dtype=str, keep_default_na=False)
+    derived = derive_columns(read_input(), DABS_ADDRS)
+    for column in COLUMNS:
+        assert derived[column].astype(str).tolist() == expected[column].tolist(), column
+
+
+def test_missing_coordinates_keep_zero_cell():
+    #: h3 v3 returned '0' for points without coordinates, matIDs of those points must not change
+    points = read_input().head(2)
+    points.loc[0, ['longitude', 'latitude']] = float('nan')
+    derived = derive_columns(points, DABS_ADDRS)
+    assert derived['matID'].tolist()[0] == '0_123'
@@ -0,0 +1,55 @@
+"""
+dabs_core.mat_io CSV/Parquet MAT round trips
+"""
+
+import os
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+from dabs_core.mat import MAT_COLUMNS
+from dabs_core.mat_io import iter_mat, mat_parquet_path, read_mat, write_mat
+
+
+def mat(n, city='PROVO'):
+    frame = pd.DataFrame({column: [f'{column} {i}' for i in range(n)] for column in MAT_COLUMNS})
+    frame['City'] = city
+    frame['longitude'] = [-111.5 - i / 4 for i in range(n)]
+    frame['latitude'] = 40.2
+    return frame
+
+
+def test_all_columns_from_the_csv(tmp_path):
+    mat_csv = os.path.join(tmp_path, 'DABS_mat.csv')
+    write_mat(mat(3), mat_csv, parquet=False)
+    from_csv = read_mat(mat_csv)
+    assert from_csv.columns.tolist() == MAT_COLUMNS
+    assert from_csv.equals(mat(3))
+    assert pd.concat(iter_mat(mat_csv, batch_size=2)).columns.tolist() == MAT_COLUMNS
+
+
+def test_parquet_matches_the_csv(tmp_path):
+    mat_csv = os.path.join(tmp_path, 'DABS_mat.csv')
+    write_mat(mat(3), mat_csv)
+    assert os.path.exists(mat_parquet_path(mat_csv))
+    assert read_mat(mat_csv).equals(mat(3))
+    assert read_mat(mat_csv, ['City', 'longitude']).equals(mat(3)[['City', 'longitude']])
+
+
+def test_old_parquet_is_not_read(tmp_path):
+    mat_csv = os.path.join(tmp_path, 'DABS_mat.csv')
+    write_mat(mat(3), mat_csv)
+
+    #: A CSV rewritten without pyarrow, the old Parquet file is removed
+    write_mat(mat(2, 'OREM'), mat_csv, parquet=False)
+    assert not os.path.exists(mat_parquet_path(mat_csv))
+    assert read_mat(mat_csv, ['City'])['City'].tolist() == ['OREM'] * 2
+
+    #: A CSV edited after the Parquet file was written
+    write_mat(mat(3), mat_csv)
+    mat(1, 'LEHI').to_csv(mat_csv)
+    stat = os.stat(mat_parquet_path(mat_csv))
+    os.utime(mat_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert read_mat(mat_csv, ['City'])['City'].tolist() == ['LEHI']
+    assert pd.concat(iter_mat(mat_csv, ['City']))['City'].tolist() == ['LEHI']
@@ -0,0 +1,64 @@
+"""
+dabs_core.mat_lookup key index of the MAT
+"""
+
+import os
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from dabs_core import mat_lookup
+from dabs_core.addresses import address_key, normalize_address
+from dabs_core.mat_lookup import mat_lookup_path, open_mat_lookup
+
+ROWS = [
+    ('123 S MAIN ST', 'SALT LAKE CITY', '84111', 'a_123'),
+    (' 123 S  MAIN ST', 'MURRAY', '84107', 'b_123'),
+    ('9 W 500 N', 'PROVO', '84601', 'c_9'),
+    ('10 E 100 S', 'OGDEN', '84401', 'd_10'),
+    ('11 E 100 S', 'OGDEN', '84401', 'd_11'),
+]
+
+
+def write_mat(path, rows):
+    pd.DataFrame(rows, columns=['FullAdd', 'City', 'ZipCode', 'matID']).to_csv(path)
+    return path
+
+
+def test_lookups(tmp_path):
+    mat_csv = write_mat(os.path.join(tmp_path, 'DABS_mat.csv'), ROWS)
+    with open_mat_lookup(mat_csv) as lookup:
+        assert len(lookup) == 5
+        #: Keys are normalized like the license keys, so both 123 S MAIN ST rows share an addr
+        assert lookup.contains(normalize_address('123 S MAIN   ST '), 'addr')
+        assert lookup.contains(address_key('9 W 500 N', 'PROVO'))
+        assert not lookup.contains(address_key('9 W 500 N', 'OREM'))
+        matches = lookup.lookup([normalize_address('123 S MAIN ST')], 'addr')
+        assert sorted(matches['matID']) == ['a_123', 'b_123']
+        with pytest.raises(ValueError):
+            lookup.contains('x', 'FullAdd')
+
+
+def test_batches_beyond_query_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(mat_lookup, 'QUERY_BATCH', 2)
+    mat_csv = write_mat(os.path.join(tmp_path, 'DABS_mat.csv'), ROWS)
+    keys = [address_key(*row[:2]) for row in ROWS] + ['1 NOWHERE', address_key('9 W 500 N', 'PROVO'), '2 NOWHERE']
+    with open_mat_lookup(mat_csv) as lookup:
+        assert lookup.found(keys) == set(keys[:5])
+        assert lookup.missing(keys) == ['1 NOWHERE', '2 NOWHERE']
+        assert sorted(lookup.lookup(keys, fields=['matID'])['matID']) == [row[3] for row in ROWS]
+        assert lookup.lookup([], fields=['matID']).empty
+
+
+def test_rebuilt_when_the_mat_changes(tmp_path):
+    mat_csv = write_mat(os.path.join(tmp_path, 'DABS_mat.csv'), ROWS)
+    open_mat_lookup(mat_csv).close()
+    built = os.stat(mat_lookup_path(mat_csv)).st_mtime_ns
+    with open_mat_lookup(mat_csv) as lookup:
+        assert lookup.is_current(mat_csv)
+    assert os.stat(mat_lookup_path(mat_csv)).st_mtime_ns == built
+
+    write_mat(mat_csv, ROWS[:2])
+    with open_mat_lookup(mat_csv) as lookup:
+        assert len(lookup) == 2
+        assert not lookup.contains(address_key('9 W 500 N', 'PROVO'))
@@ -0,0 +1,45 @@
+"""
+Streaming MAT export against the in-memory derive_columns + dedup
+"""
+
+import os
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyogrio')
+pytest.importorskip('pyarrow')
+pytest.importorskip('pyproj')
+pytest.importorskip('h3')
+
+from dabs_core import synthetic
+from dabs_core.mat import dedup, derive_columns
+from dabs_core.mat_io import mat_parquet_path
+from dabs_core.mat_stream import SOURCE_FIELDS, export_mat_streaming
+from dabs_core.storage import write_points
+
+
+def test_streamed_mat_matches_in_memory(tmp_path):
+    points = synthetic.address_points(1_000)
+    #: Duplicate some matIDs across chunks: same address number and unit in the same H3 cell
+    points.loc[900:, ['longitude', 'latitude', 'AddNum', 'UnitType', 'UnitID']] = \
+        points.loc[:99, ['longitude', 'latitude', 'AddNum', 'UnitType', 'UnitID']].to_numpy()
+    points['UTAddPtID'] = points['UTAddPtID'].where(points.index % 97 != 0, points['UTAddPtID'].iloc[0])
+    dabs_addrs = points['FullAdd'].iloc[::50].tolist() + points['FullAdd'].iloc[905:910].tolist()
+
+    frame = points[SOURCE_FIELDS + ['longitude', 'latitude']]
+    addpts = write_points(frame, 'longitude', 'latitude', os.path.join(tmp_path, 'addpts.fgb'), 4326, backend='gdal')
+    mat_csv = os.path.join(tmp_path, 'DABS_mat.csv')
+    #: 7 chunks, the last one partial
+    stats = export_mat_streaming(addpts, dabs_addrs, mat_csv, chunk_size=150)
+
+    expected, expected_stats = dedup(derive_columns(frame.copy(), dabs_addrs, verbose=False), return_stats=True)
+    assert expected_stats.addptid_removed and expected_stats.matid_removed
+    assert stats['read'] == expected_stats.rows
+    assert stats['after_addptid'] == expected_stats.rows - expected_stats.addptid_removed
+    assert stats['after_matid'] == expected_stats.kept
+
+    with open(mat_csv, encoding='utf-8') as f:
+        assert f.read() == expected.to_csv(lineterminator='\n')
+    #: The Parquet file has the same rows in the same order, without the index
+    parquet = pd.read_parquet(mat_parquet_path(mat_csv))
+    assert parquet.astype(str).equals(expected.reset_index(drop=True).astype(str))
@@ -0,0 +1,115 @@
+"""
+dabs_core.poly_assign point-in-polygon matching
+"""
+
+import os
+import numpy as np
+import pytest
+
+shapely = pytest.importorskip('shapely')
+
+from dabs_core.poly_assign import UNMATCHED, PolygonIndex, assign_columns, group_by_layer
+
+
+def squares():
+    #: OIDs out of order, 2 and 5 share the edge x = 10, 7 and 9 are 1 meter apart
+    oids = [5, 2, 9, 7]
+    geometries = [shapely.box(0, 0, 10, 10), shapely.box(10, 0, 20, 10),
+                  shapely.box(0, 20, 10, 30), shapely.box(0, 31, 10, 40)]
+    return PolygonIndex(oids, geometries, {'name': ['five', 'two', 'nine', 'seven']})
+
+
+def matched_oids(index, points, tolerance=1.0):
+    x, y = np.array(points, dtype='float64').T
+    matched = index.match(x, y, tolerance)
+    return [int(index.oids[m]) if m >= 0 else None for m in matched]
+
+
+def test_inside_and_on_edges():
+    index = squares()
+    assert matched_oids(index, [(5, 5), (15, 5), (0, 5), (5, 10), (20, 0)]) == [5, 2, 5, 5, 2]
+
+
+def test_shared_edge_goes_to_lowest_oid():
+    assert matched_oids(squares(), [(10, 5), (10, 0)]) == [2, 2]
+
+
+def test_tolerance():
+    index = squares()
+    points = [(-0.5, 5), (-0.99, 5), (-1.01, 5), (5, -1.5), (25, 5)]
+    assert matched_oids(index, points) == [5, 5, None, None, None]
+    assert matched_oids(index, points, tolerance=0) == [None] * 5
+    assert matched_oids(index, points, tolerance=2) == [5, 5, 5, 5, None]
+
+
+def test_tolerance_tie_goes_to_lowest_oid():
+    #: Halfway between 9 (top edge y = 30) and 7 (bottom edge y = 31)
+    assert matched_oids(squares(), [(5, 30.5)]) == [7]
+
+
+def test_closest_polygon_within_tolerance_wins():
+    assert matched_oids(squares(), [(5, 30.2), (5, 30.8)]) == [9, 7]
+
+
+def test_values_and_unmatched():
+    index = squares()
+    matched = index.match([5, 15, 50, np.nan], [5, 5, 50, np.nan])
+    assert matched[3] == -1
+    assert index.values('name', matched).tolist() == ['five', 'two', UNMATCHED, UNMATCHED]
+    assert UNMATCHED == ''
+
+
+def test_empty_inputs():
+    assert PolygonIndex([], []).match([1.0], [1.0]).tolist() == [-1]
+    assert squares().match([], []).tolist() == []
+
+
+def test_group_by_layer():
+    polygonDict = {
+        'Comp_Zone': {'poly_path': 'zones', 'poly_field': 'ZONE'},
+        'County': {'poly_path': 'counties', 'poly_field': 'NAME'},
+        'Comp_Group': {'poly_path': 'zones', 'poly_field': 'GROUP'},
+    }
+    groups = group_by_layer(polygonDict)
+    assert groups == {'zones': {'Comp_Zone': 'ZONE', 'Comp_Group': 'GROUP'}, 'counties': {'County': 'NAME'}}
+    assert list(groups) == ['zones', 'counties']
+
+
+def write_polygons(path, layer, geometries, **columns):
+    pa = pytest.importorskip('pyarrow')
+    pyogrio = pytest.importorskip('pyogrio')
+    table = pa.table({**columns, 'geom': pa.array(shapely.to_wkb(geometries).tolist(), pa.binary())})
+    pyogrio.write_arrow(table, path, layer=layer, driver='GPKG', geometry_name='geom', geometry_type='Polygon',
+                        crs='EPSG:26912')
+    return os.path.join(path, layer)
+
+
+def test_assign_columns(tmp_path, monkeypatch):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyproj')
+    from dabs_core.storage import write_points
+
+    gpkg = os.path.join(tmp_path, 'data.gpkg')
+    zones = write_polygons(gpkg, 'zones', [shapely.box(0, 0, 10, 10), shapely.box(10, 0, 20, 10)],
+                           ZONE=['A', 'B'], GROUP=['1', '2'])
+    counties = write_polygons(gpkg, 'counties', [shapely.box(-100, -100, 100, 100)], NAME=['Salt Lake'])
+    frame = pd.DataFrame({'X': [5.0, 15.0, 20.5, 50.0], 'Y': [5.0, 5.0, 5.0, 50.0]})
+    pts = write_points(frame, 'X', 'Y', os.path.join(gpkg, 'pts'), 26912, backend='gdal')
+
+    polygonDict = {
+        'Comp_Zone': {'poly_path': zones, 'poly_field': 'ZONE'},
+        'County': {'poly_path': counties, 'poly_field': 'NAME'},
+        'Comp_Group': {'poly_path': zones, 'poly_field': 'GROUP'},
+    }
+    reads = []
+    from_featureclass = PolygonIndex.from_featureclass.__func__
+    monkeypatch.setattr(PolygonIndex, 'from_featureclass',
+                        classmethod(lambda cls, *args, **kwargs: reads.append(args[0]) or from_featureclass(cls, *args, **kwargs)))
+    oids, columns = assign_columns(pts, polygonDict, cache=False)
+    #: One read per polygon layer, however many fields come from it
+    assert sorted(reads) == sorted([zones, counties])
+    assert oids.tolist() == [1, 2, 3, 4]
+    assert list(columns) == ['Comp_Zone', 'County', 'Comp_Group']
+    assert columns['Comp_Zone'].tolist() == ['A', 'B', 'B', '']
+    assert columns['Comp_Group'].tolist() == ['1', '2', '2', '']
+    assert columns['County'].tolist() == ['Salt Lake'] * 4
@@ -0,0 +1,63 @@
+"""
+dabs_core.reconcile keyed reconciliation of the license tables
+"""
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from dabs_core.reconcile import normalize_values, reconcile
+
+
+def sheet():
+    return pd.DataFrame({
+        'LICENSE_NO': [123, 124, 125, 126, 126, 130],
+        'Name': ['Bar One', 'bar  two ', 'Bar Three', 'Bar Four', 'Bar Four (copy)', 'Bar New'],
+        'Zip': ['84111', '84101', '84102', '84103', '84103', '84104'],
+    })
+
+
+def layer():
+    return pd.DataFrame({
+        'OBJECTID': [11, 12, 13, 14, 15, 16],
+        'Lic_Number': [123.0, 124.0, 125.0, 126.0, 127.0, 127.0],
+        'Lic_Name': ['BAR ONE', 'BAR TWO', 'Bar 3', 'Bar Four', 'Bar Gone', 'Bar Gone'],
+        'Zip': [84111.0, 84101.0, 84102.0, 84199.0, np.nan, None],
+    })
+
+
+def test_normalize_values():
+    values = [123, 123.0, ' a  b ', None, np.nan, np.float64(7.0), 7.5]
+    assert normalize_values(values).tolist() == ['123', '123', 'A B', '', '', '7', '7.5']
+
+
+def test_reconcile():
+    result = reconcile(sheet(), layer(), 'LICENSE_NO', 'Lic_Number', {'Name': 'Lic_Name', 'Zip': 'Zip'}, 'OBJECTID')
+    #: 123 from the sheet matches 123.0 from the layer
+    assert result.adds['LICENSE_NO'].tolist() == [130]
+    assert result.removes['OBJECTID'].tolist() == [15]
+    assert result.unchanged == 2
+    changes = result.changes
+    assert changes[['key', 'OBJECTID', 'field', 'source_field']].values.tolist() == [
+        ['125', 13, 'Lic_Name', 'Name'], ['126', 14, 'Zip', 'Zip']]
+    assert changes['source_value'].tolist() == ['Bar Three', '84103']
+    assert changes['target_value'].tolist() == ['Bar 3', 84199.0]
+
+    #: Duplicated keys are reported, only their first row is reconciled
+    assert result.duplicates.values.tolist() == [['source', '126', 2], ['target', '127', 2]]
+
+
+def test_shared_columns_by_default():
+    source = sheet().rename(columns={'LICENSE_NO': 'Lic_Number', 'Name': 'Lic_Name'})
+    result = reconcile(source, layer(), 'Lic_Number')
+    assert sorted(set(result.changes['field'])) == ['Lic_Name', 'Zip']
+    assert 'OBJECTID' not in result.changes
+
+
+def test_without_normalizing():
+    result = reconcile(sheet(), layer(), 'LICENSE_NO', 'Lic_Number', {'Name': 'Lic_Name'}, normalize=None)
+    #: 123 == 123.0 still matches as numbers, but names compare exactly
+    assert result.adds['LICENSE_NO'].tolist() == [130]
+    assert result.changes['key'].tolist() == [123, 124, 125]
+    assert result.unchanged == 1
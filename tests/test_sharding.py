@@ -0,0 +1,65 @@
+"""
+dabs_core.sharding results against single-process PolygonIndex.match
+"""
+
+import numpy as np
+import pytest
+
+shapely = pytest.importorskip('shapely')
+pytest.importorskip('pyproj')
+pytest.importorskip('h3')
+
+from dabs_core.poly_assign import PolygonIndex
+from dabs_core.sharding import match_parallel, shard_keys
+
+#: Salt Lake valley in NAD83 / UTM zone 12N
+X0, Y0 = 420_000.0, 4_500_000.0
+
+
+def grid_index():
+    #: 400 m squares with 1.5 m gaps, so the 1 m tolerance decides some matches, in shuffled OID order
+    cells = [(i, j) for i in range(20) for j in range(20)]
+    geometries = [shapely.box(X0 + i * 401.5, Y0 + j * 401.5, X0 + i * 401.5 + 400, Y0 + j * 401.5 + 400)
+                  for i, j in cells]
+    oids = np.random.default_rng(1).permutation(len(cells)) + 1
+    return PolygonIndex(oids, geometries)
+
+
+def edge_points(index, rng):
+    #: Points on, just inside and just outside each polygon's edges
+    bounds = shapely.bounds(index.geometries)
+    x = np.concatenate([bounds[:, 0], bounds[:, 2] + 0.75, bounds[:, 2] + 1.25, bounds[:, 0] - 0.5])
+    y = np.concatenate([bounds[:, 1] + rng.uniform(0, 400, len(bounds)) for _ in range(4)])
+    return x, y
+
+
+def test_h3_shards_match_single_process():
+    index = grid_index()
+    rng = np.random.default_rng(0)
+    x = np.concatenate([rng.uniform(X0 - 50, X0 + 8100, 4000), edge_points(index, rng)[0], [np.nan]])
+    y = np.concatenate([rng.uniform(Y0 - 50, Y0 + 8100, 4000), edge_points(index, rng)[1], [np.nan]])
+    #: Resolution 7 cells (~5 sq km) cut through many polygons
+    keys = shard_keys(x, y, 'h3', 7)
+    assert len(np.unique(keys)) > 5
+
+    expected = index.match(x, y)
+    assert (expected >= 0).any() and (expected < 0).any()
+    assert np.array_equal(match_parallel(index, x, y, workers=2, keys=keys), expected)
+    assert np.array_equal(match_parallel(index, x, y, workers=2, h3_resolution=6), expected)
+
+
+def test_points_either_side_of_a_shard_edge():
+    #: Shards split in the 1.5 m gap between two columns of polygons, 0.5 m from the left one,
+    #: so points just right of the split match the polygon in the left shard
+    index = grid_index()
+    split = X0 + 401.5 + 400 + 0.5
+    y = np.full(6, Y0 + 200.0)
+    x = split + np.array([-0.3, 0.0, 0.1, 0.2, 0.6, 1.5])
+    keys = (x > split).astype(np.uint64)
+
+    expected = index.match(x, y)
+    assert np.array_equal(match_parallel(index, x, y, workers=2, keys=keys), expected)
+    assert (expected >= 0).all()
+    #: The left polygon is matched from both shards
+    left, right = index.oids[expected[keys == 0]], index.oids[expected[keys == 1]]
+    assert set(left) & set(right)
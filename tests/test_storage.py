@@ -0,0 +1,123 @@
+"""
+gdal backend of dabs_core.storage on small GeoPackage and FlatGeobuf layers
+"""
+
+import os
+import sqlite3
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+pyogrio = pytest.importorskip('pyogrio')
+pytest.importorskip('pyarrow')
+shapely = pytest.importorskip('shapely')
+pytest.importorskip('pyproj')
+
+from dabs_core import storage
+from dabs_core.storage import (add_field, append_layer, buffer_layer, copy_layer, count_rows, delete_fields,
+                               feature_to_point, rename_field, spatial_join, write_points)
+
+GDAL = 'gdal'
+
+#: NAD83 / UTM zone 12N (meters) and NAD83 / Utah Central (US survey feet)
+UTM = 26912
+UTAH_FEET = 3566
+
+
+def read(path):
+    workspace, layer = storage._split(path)
+    meta, table = pyogrio.read_arrow(workspace, layer=layer, return_fids=True)
+    return meta, table
+
+
+def points(tmp_path, layer, xs, ys, sr=UTM, **columns):
+    frame = pd.DataFrame({'X': xs, 'Y': ys, **columns})
+    return write_points(frame, 'X', 'Y', os.path.join(tmp_path, layer), sr, backend=GDAL)
+
+
+def test_write_points_round_trip(tmp_path):
+    out = points(tmp_path, 'pts.fgb', [1.0, 2.0], [3.0, 4.0], name=['a', 'b'])
+    meta, table = read(out)
+    geometries = shapely.from_wkb(table.column(meta['geometry_name'] or 'wkb_geometry').to_numpy(zero_copy_only=False))
+    assert table.column('name').to_pylist() == ['a', 'b']
+    assert shapely.get_coordinates(geometries).tolist() == [[1.0, 3.0], [2.0, 4.0]]
+    assert count_rows(out, backend=GDAL) == 2
+
+
+def test_buffer_and_feature_to_point(tmp_path):
+    source = points(tmp_path, 'pts.fgb', [100.0, 500.0], [100.0, 500.0], name=['a', 'b'])
+    buffered = buffer_layer(source, os.path.join(tmp_path, 'buf.fgb'), 10, 'Meters', backend=GDAL)
+    meta, table = read(buffered)
+    polygons = shapely.from_wkb(table.column(meta['geometry_name'] or 'wkb_geometry').to_numpy(zero_copy_only=False))
+    assert table.column('BUFF_DIST').to_pylist() == [10.0, 10.0]
+    assert table.column('ORIG_FID').to_pylist() == [0, 1]
+    assert np.allclose(shapely.area(polygons), np.pi * 100, rtol=0.01)
+
+    centers = feature_to_point(buffered, os.path.join(tmp_path, 'ctr.fgb'), backend=GDAL)
+    meta, table = read(centers)
+    geometries = shapely.from_wkb(table.column(meta['geometry_name'] or 'wkb_geometry').to_numpy(zero_copy_only=False))
+    assert table.column('name').to_pylist() == ['a', 'b']
+    assert shapely.contains(polygons, geometries).all()
+
+
+def test_spatial_join_uses_real_fids(tmp_path):
+    target = points(tmp_path, 'data.gpkg/target', [0.0, 100.0, 200.0, 300.0], [0.0] * 4, kind=['t0', 't1', 't2', 't3'])
+    join = points(tmp_path, 'data.gpkg/join', [100.0, 300.0, 301.0], [0.0] * 3, kind=['j0', None, 'j2'], label=['x', 'y', 'z'])
+    #: Gaps in the FIDs, like a FileGDB layer with deleted rows
+    with sqlite3.connect(os.path.join(tmp_path, 'data.gpkg')) as con:
+        con.execute('DELETE FROM target WHERE fid = 1')
+        con.execute('DELETE FROM "join" WHERE fid = 1')
+
+    out = spatial_join(target, join, os.path.join(tmp_path, 'joined.fgb'), ['kind', 'label'], 5, 'Meters', backend=GDAL)
+    _, table = read(out)
+    assert table.column('TARGET_FID').to_pylist() == [4, 4]
+    assert table.column('JOIN_FID').to_pylist() == [2, 3]
+    #: The target's value wins unless it's null
+    assert table.column('kind').to_pylist() == ['t3', 't3']
+    assert table.column('label').to_pylist() == ['y', 'z']
+
+
+def test_spatial_join_distance_in_meters_on_a_feet_layer(tmp_path):
+    #: 10 feet apart: within 5 meters (16.4 ft), not within 2 meters (6.6 ft)
+    target = points(tmp_path, 'target.fgb', [1_500_000.0], [7_000_000.0], UTAH_FEET, kind=['t'])
+    join = points(tmp_path, 'join.fgb', [1_500_010.0], [7_000_000.0], UTAH_FEET, label=['j'])
+    near = spatial_join(target, join, os.path.join(tmp_path, 'near.fgb'), ['label'], 5, 'Meters', backend=GDAL)
+    far = spatial_join(target, join, os.path.join(tmp_path, 'far.fgb'), ['label'], 2, 'Meters', backend=GDAL)
+    assert count_rows(near, backend=GDAL) == 1
+    assert count_rows(far, backend=GDAL) == 0
+
+    lonlat = points(tmp_path, 'lonlat.fgb', [-111.9], [40.7], 4326, kind=['t'])
+    with pytest.raises(ValueError):
+        buffer_layer(lonlat, os.path.join(tmp_path, 'bad.fgb'), 5, backend=GDAL)
+
+
+def test_append_matches_fields_by_name(tmp_path):
+    target = points(tmp_path, 'data.gpkg/target', [0.0], [0.0], name=['first'], category=['park'])
+    source = points(tmp_path, 'data.gpkg/source', [1.0, 2.0], [1.0, 2.0], NAME=['second', 'third'], other=['x', 'y'])
+    append_layer(source, target, backend=GDAL)
+    _, table = read(target)
+    assert table.column('name').to_pylist() == ['first', 'second', 'third']
+    assert table.column('category').to_pylist() == ['park', None, None]
+
+
+def test_schema_changes(tmp_path):
+    layer = points(tmp_path, 'data.gpkg/pts', [0.0, 1.0], [0.0, 1.0], name=['a', 'b'], drop_me=[1, 2])
+    add_field(layer, ['Flag', 'name'], 'TEXT', 10, backend=GDAL)
+    rename_field(layer, 'name', 'NAME2', backend=GDAL)
+    delete_fields(layer, ['drop_me', 'missing'], backend=GDAL)
+    _, table = read(layer)
+    fields = [name for name in table.column_names if name not in ('fid', 'SHAPE', 'geom', 'wkb_geometry')]
+    assert sorted(fields) == ['Flag', 'NAME2', 'X', 'Y']
+    assert table.column('NAME2').to_pylist() == ['a', 'b']
+
+
+def test_rewrite_refused_outside_scratch_outputs(tmp_path):
+    #: A layer this run didn't create through storage, e.g. a production feature class
+    copy = copy_layer(points(tmp_path, 'src.fgb', [0.0], [0.0], name=['a']), os.path.join(tmp_path, 'copy.fgb'),
+                      backend=GDAL)
+    meta, table = pyogrio.read_arrow(copy)
+    other = os.path.join(tmp_path, 'production.fgb')
+    pyogrio.write_arrow(table, other, driver='FlatGeobuf', geometry_name=meta['geometry_name'] or 'wkb_geometry',
+                        geometry_type=meta['geometry_type'], crs=meta['crs'])
+    with pytest.raises(PermissionError):
+        add_field(other, 'Flag', backend=GDAL)
@@ -0,0 +1,81 @@
+"""
+dabs_core.table_io readers and writers on small GeoPackage and FlatGeobuf layers
+"""
+
+import os
+import sqlite3
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+pa = pytest.importorskip('pyarrow')
+pyogrio = pytest.importorskip('pyogrio')
+shapely = pytest.importorskip('shapely')
+pytest.importorskip('pyproj')
+
+from dabs_core.storage import write_points
+from dabs_core.table_io import OID_TOKEN, arrow_wkb_xy, read_table, read_xy, write_columns
+
+
+def have_osgeo():
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return False
+    return int(gdal.VersionInfo()) >= 3060000
+
+
+def test_arrow_wkb_xy_parses_points_and_centroids():
+    geometries = [shapely.Point(1.5, -2.0), None, shapely.box(0, 0, 2, 4), shapely.Point(), shapely.Point(3, 4, 5),
+                  shapely.LineString([(0, 0), (10, 0)])]
+    wkbs = [None if g is None else shapely.to_wkb(g, byte_order=order)
+            for g, order in zip(geometries, [1, 1, 1, 1, 0, 1])]
+    for kind in (pa.binary(), pa.large_binary()):
+        x, y = arrow_wkb_xy(pa.chunked_array([pa.array(wkbs[:3], kind), pa.array(wkbs[3:], kind)]))
+        assert np.array_equal(x, [1.5, np.nan, 1.0, np.nan, 3.0, 5.0], equal_nan=True)
+        assert np.array_equal(y, [-2.0, np.nan, 2.0, np.nan, 4.0, 0.0], equal_nan=True)
+        assert x.flags['C_CONTIGUOUS'] and x.dtype == np.float64
+
+
+def test_arrow_wkb_xy_sliced_array():
+    column = pa.array([shapely.to_wkb(shapely.Point(i, -i)) for i in range(5)], pa.binary()).slice(2, 2)
+    x, y = arrow_wkb_xy(column)
+    assert x.tolist() == [2.0, 3.0] and y.tolist() == [-2.0, -3.0]
+
+
+def test_read_xy_flatgeobuf(tmp_path):
+    frame = pd.DataFrame({'X': [420000.0, 421000.5], 'Y': [4500000.0, 4500001.25], 'name': ['a', 'b']})
+    out = write_points(frame, 'X', 'Y', os.path.join(tmp_path, 'pts.fgb'), 26912, backend='gdal')
+    oids, x, y = read_xy(out, backend='pyogrio')
+    assert oids.tolist() == [0, 1]
+    assert x.tolist() == [420000.0, 421000.5] and y.tolist() == [4500000.0, 4500001.25]
+    oids, x, y = read_xy(out, "name = 'b'", backend='pyogrio')
+    assert oids.tolist() == [1] and x.tolist() == [421000.5]
+
+
+@pytest.mark.parametrize('layer, backend', [
+    ('data.gpkg/pts', 'gpkg'),
+    pytest.param('data.gpkg/pts', 'ogr', marks=pytest.mark.skipif(not have_osgeo(), reason='needs GDAL 3.6+ bindings')),
+    ('pts.fgb', 'pyogrio'),
+])
+def test_write_columns_round_trip(tmp_path, layer, backend):
+    frame = pd.DataFrame({'X': [0.0, 1.0, 2.0], 'Y': [0.0, 1.0, 2.0], 'name': ['a', 'b', 'c'], 'score': [1.0, 2.0, 3.0]})
+    out = write_points(frame, 'X', 'Y', os.path.join(tmp_path, layer), 26912, backend='gdal')
+    oids = read_table(out, [OID_TOKEN], backend=backend)[OID_TOKEN]
+
+    #: Two OIDs that aren't in the layer are counted, not written
+    result = write_columns(out, [oids[2], 999, oids[0], -5],
+                           {'name': ['C', 'x', None, 'y'], 'score': [30.0, 0.0, 10.0, 0.0]}, backend=backend)
+    assert result == (2, 2)
+    columns = read_table(out, [OID_TOKEN, 'name', 'score'], backend=backend)
+    assert columns[OID_TOKEN].tolist() == oids.tolist()
+    assert columns['name'].tolist() == [None, 'b', 'C']
+    assert columns['score'].tolist() == [10.0, 2.0, 30.0]
+
+
+def test_write_columns_unknown_field(tmp_path):
+    frame = pd.DataFrame({'X': [0.0], 'Y': [0.0], 'name': ['a']})
+    out = write_points(frame, 'X', 'Y', os.path.join(tmp_path, 'data.gpkg/pts'), 26912, backend='gdal')
+    with pytest.raises(sqlite3.OperationalError):
+        write_columns(out, [1], {'missing': ['x']}, backend='gpkg')
+    assert read_table(out, ['name'], backend='gpkg')['name'].tolist() == ['a']